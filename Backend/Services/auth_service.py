@@ -1,30 +1,42 @@
-import bcrypt
 import jwt
 import secrets
 from datetime import datetime, timezone, timedelta
 from typing import Optional, Dict, Any
 import re
 
+from Services.password_hasher import PasswordHasher, password_hasher
+
+# Compiled once at import; these run on every register/login
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+PASSWORD_RULES = [
+    (re.compile(r'[A-Z]'), "Password must contain at least one uppercase letter"),
+    (re.compile(r'[a-z]'), "Password must contain at least one lowercase letter"),
+    (re.compile(r'\d'), "Password must contain at least one number"),
+    (re.compile(r'[!@#$%^&*(),.?":{}|<>]'), "Password must contain at least one special character"),
+]
+
 class AuthService:
-    def __init__(self, secret_key: str = None):
+    def __init__(self, secret_key: str = None, hasher: PasswordHasher = None):
         self.secret_key = secret_key or secrets.token_hex(32)
         self.algorithm = 'HS256'
         self.token_expiry_hours = 24
+        self.hasher = hasher or password_hasher
     
     def hash_password(self, password: str) -> str:
-        """Hash a password using bcrypt"""
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return hashed.decode('utf-8')
+        """Hash a password using bcrypt (on the bounded hasher pool)"""
+        return self.hasher.hash(password)
     
     def verify_password(self, password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+        """Verify a password against its hash (on the bounded hasher pool)"""
+        return self.hasher.verify(password, hashed_password)
+    
+    def rehash_password(self, password: str, hashed_password: str) -> Optional[str]:
+        """New hash if the stored one uses a different bcrypt cost, else None"""
+        return self.hasher.rehash(password, hashed_password)
     
     def validate_email(self, email: str) -> bool:
         """Validate email format"""
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return re.match(pattern, email) is not None
+        return EMAIL_RE.match(email) is not None
     
     def validate_password(self, password: str) -> Dict[str, Any]:
         """Validate password strength"""
@@ -33,17 +45,9 @@ class AuthService:
         if len(password) < 8:
             errors.append("Password must be at least 8 characters long")
         
-        if not re.search(r'[A-Z]', password):
-            errors.append("Password must contain at least one uppercase letter")
-        
-        if not re.search(r'[a-z]', password):
-            errors.append("Password must contain at least one lowercase letter")
-        
-        if not re.search(r'\d', password):
-            errors.append("Password must contain at least one number")
-        
-        if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
-            errors.append("Password must contain at least one special character")
+        for pattern, message in PASSWORD_RULES:
+            if not pattern.search(password):
+                errors.append(message)
         
         return {
             'is_valid': len(errors) == 0,
@@ -0,0 +1,154 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Any, AsyncIterator, Awaitable, List, Optional
+
+import httpx
+
+from Services.graph_client import (
+    GRAPH_BASE_URL, GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT, GRAPH_MAX_RETRIES,
+    GRAPH_POOL_SIZE, GRAPH_MAX_ITEMS, GraphCall, GraphStats, PageCursor,
+    endpoint_name, graph_client, request_headers,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bound a Flask thread waits for a group of concurrent Graph calls
+GRAPH_ASYNC_TIMEOUT = float(os.getenv('GRAPH_ASYNC_TIMEOUT', '60'))
+
+
+class EventLoopThread:
+    """A persistent asyncio event loop on a daemon thread.
+
+    Synchronous code (Flask workers, background tasks) submits coroutines
+    with `run()` and blocks until they finish; the loop and everything bound
+    to it (such as an httpx connection pool) outlive individual requests.
+    """
+
+    def __init__(self, name: str = 'graph-async'):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or not self._thread.is_alive():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def serve():
+                    asyncio.set_event_loop(loop)
+                    ready.set()
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=serve, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+
+class AsyncGraphClient:
+    """Microsoft Graph client for issuing independent calls concurrently.
+
+    Built on a pooled httpx.AsyncClient living on a shared event loop
+    thread. Retries, Retry-After handling, paging and latency counters are
+    GraphClient's (GraphCall, PageCursor), and calls are recorded into the
+    same stats; only the transport differs.
+    """
+
+    def __init__(self, base_url: str = GRAPH_BASE_URL, max_retries: int = GRAPH_MAX_RETRIES,
+                 pool_size: int = GRAPH_POOL_SIZE, stats: Optional[GraphStats] = None):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.stats = stats or graph_client.stats
+        self._runner = EventLoopThread()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # An AsyncClient is tied to the loop it was created on; if the runner
+        # thread was restarted, the old client (and its pool) is unusable
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(GRAPH_READ_TIMEOUT, connect=GRAPH_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._client_loop = loop
+        return self._client
+
+    def url(self, path: str) -> str:
+        if path.startswith('http'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def request(self, method: str, path: str, access_token: str, params: Optional[dict] = None,
+                      json: Optional[Any] = None, headers: Optional[dict] = None) -> httpx.Response:
+        """Send a Graph request, retrying 429/5xx and network errors.
+
+        Returns the final response; raises the last network error if every attempt failed.
+        """
+        url = self.url(path)
+        req_headers = request_headers(access_token, headers)
+        call = GraphCall(self.stats, method, url, self.max_retries, label=', async')
+        while True:
+            try:
+                response = await self._http().request(method, url, headers=req_headers, params=params, json=json)
+            except httpx.TransportError as e:
+                delay = call.after_error(e)
+                if delay is None:
+                    raise
+            else:
+                delay = call.after_response(response.status_code, response.headers)
+                if delay is None:
+                    return response
+            await asyncio.sleep(delay)
+
+    async def get(self, path: str, access_token: str, params: Optional[dict] = None, **kwargs) -> httpx.Response:
+        return await self.request('GET', path, access_token, params=params, **kwargs)
+
+    async def aiter_pages(self, path: str, access_token: str, params: Optional[dict] = None,
+                          first_page: Optional[dict] = None, max_items: int = GRAPH_MAX_ITEMS,
+                          headers: Optional[dict] = None) -> AsyncIterator[dict]:
+        """Async counterpart of GraphClient.iter_pages"""
+        cursor = PageCursor(endpoint_name(self.url(path)), max_items)
+        page = first_page
+        if page is None:
+            page = cursor.body(await self.get(path, access_token, params=params, headers=headers))
+        while page is not None:
+            page, next_url = cursor.take(page)
+            yield page
+            if not next_url:
+                return
+            page = cursor.body(await self.get(next_url, access_token, headers=headers), 'nextLink')
+
+    def gather(self, *coros: Awaitable, timeout: float = GRAPH_ASYNC_TIMEOUT) -> List[Any]:
+        """Run coroutines concurrently on the shared loop and wait for all results.
+
+        Wall time is that of the slowest coroutine rather than the sum.
+        Exceptions propagate to the caller.
+        """
+        async def run_all():
+            return await asyncio.gather(*coros)
+
+        started = time.monotonic()
+        results = self._runner.run(run_all(), timeout)
+        logger.info(f"Graph concurrent fetch: {len(coros)} calls in {(time.monotonic() - started) * 1000.0:.0f}ms")
+        return results
+
+
+graph_async = AsyncGraphClient()
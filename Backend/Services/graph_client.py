@@ -0,0 +1,361 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit, urlencode, quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+GRAPH_BASE_URL = 'https://graph.microsoft.com/v1.0'
+
+# Connection / retry tuning
+GRAPH_CONNECT_TIMEOUT = float(os.getenv('GRAPH_CONNECT_TIMEOUT', '3.05'))
+GRAPH_READ_TIMEOUT = float(os.getenv('GRAPH_READ_TIMEOUT', '20'))
+GRAPH_MAX_RETRIES = int(os.getenv('GRAPH_MAX_RETRIES', '3'))
+GRAPH_BACKOFF_BASE = float(os.getenv('GRAPH_BACKOFF_BASE', '0.5'))
+GRAPH_BACKOFF_MAX = float(os.getenv('GRAPH_BACKOFF_MAX', '8'))
+GRAPH_MAX_RETRY_AFTER = float(os.getenv('GRAPH_MAX_RETRY_AFTER', '30'))
+GRAPH_POOL_SIZE = int(os.getenv('GRAPH_POOL_SIZE', '20'))
+
+# Pagination: items requested per page and hard cap on items followed per query
+GRAPH_PAGE_SIZE = int(os.getenv('GRAPH_PAGE_SIZE', '250'))
+GRAPH_MAX_ITEMS = int(os.getenv('GRAPH_MAX_ITEMS', '10000'))
+
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+# Graph rejects $batch payloads with more than 20 sub-requests
+GRAPH_BATCH_LIMIT = 20
+
+
+class GraphFetchError(Exception):
+    """Raised when Microsoft Graph data required by a route cannot be fetched"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def endpoint_name(url: str) -> str:
+    """Stable latency-counter key for a Graph URL (path without version or query)"""
+    path = urlsplit(url).path
+    for prefix in ('/v1.0', '/beta'):
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+            break
+    return path or '/'
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date"""
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Delay before retry `attempt` (0-based): Retry-After if given, else full-jitter exponential"""
+    if retry_after is not None:
+        return retry_after
+    cap = min(GRAPH_BACKOFF_MAX, GRAPH_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, cap)
+
+
+class GraphStats:
+    """Thread-safe per-endpoint call and latency counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            'calls': 0,
+            'errors': 0,
+            'retries': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'status': defaultdict(int),
+        })
+
+    def record(self, endpoint: str, elapsed_ms: float, status: Optional[int], retries: int = 0):
+        with self._lock:
+            s = self._stats[endpoint]
+            s['calls'] += 1
+            s['retries'] += retries
+            s['total_ms'] += elapsed_ms
+            s['max_ms'] = max(s['max_ms'], elapsed_ms)
+            s['status'][str(status) if status is not None else 'network_error'] += 1
+            if status is None or status >= 400:
+                s['errors'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                endpoint: {
+                    'calls': s['calls'],
+                    'errors': s['errors'],
+                    'retries': s['retries'],
+                    'avg_ms': round(s['total_ms'] / s['calls'], 1) if s['calls'] else 0,
+                    'max_ms': round(s['max_ms'], 1),
+                    'status': dict(s['status']),
+                }
+                for endpoint, s in self._stats.items()
+            }
+
+
+def request_headers(access_token: str, headers: Optional[dict] = None) -> Dict[str, str]:
+    req_headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+    if headers:
+        req_headers.update(headers)
+    return req_headers
+
+
+class GraphCall:
+    """Retry and latency bookkeeping for one logical Graph request.
+
+    Shared by GraphClient and AsyncGraphClient, which only perform the
+    transport call: after each attempt they ask `after_error` or
+    `after_response` how long to wait before retrying, and None means the
+    call is over (and has been recorded in the stats).
+    """
+
+    def __init__(self, stats: GraphStats, method: str, url: str, max_retries: int, label: str = ''):
+        self.stats = stats
+        self.method = method
+        self.endpoint = endpoint_name(url)
+        self.max_retries = max_retries
+        self.label = label
+        self.attempt = 0
+        self.started = time.monotonic()
+
+    def after_error(self, error: Exception) -> Optional[float]:
+        """Delay before retrying a network error; None when out of attempts (the caller re-raises)"""
+        if self.attempt >= self.max_retries:
+            self._record(None)
+            logger.error(f"Graph {self.method} {self.endpoint} failed after {self.attempt + 1} attempts: {error}")
+            return None
+        delay = backoff_delay(self.attempt)
+        logger.warning(f"Graph {self.method} {self.endpoint} network error ({error}), retrying in {delay:.2f}s")
+        self.attempt += 1
+        return delay
+
+    def after_response(self, status: int, headers) -> Optional[float]:
+        """Delay before retrying a throttled/unavailable response; None when it is the final one"""
+        if status not in RETRYABLE_STATUS or self.attempt >= self.max_retries:
+            self._record(status)
+            return None
+        retry_after = retry_after_seconds(headers)
+        if retry_after is not None and retry_after > GRAPH_MAX_RETRY_AFTER:
+            # Don't hold a worker for a long throttle window
+            self._record(status)
+            return None
+        delay = backoff_delay(self.attempt, retry_after)
+        logger.warning(f"Graph {self.method} {self.endpoint} returned {status}, retrying in {delay:.2f}s")
+        self.attempt += 1
+        return delay
+
+    def _record(self, status: Optional[int]):
+        elapsed_ms = (time.monotonic() - self.started) * 1000.0
+        self.stats.record(self.endpoint, elapsed_ms, status, self.attempt)
+        logger.info(f"Graph {self.endpoint} → {status} in {elapsed_ms:.0f}ms ({self.attempt} retries{self.label})")
+
+
+class PageCursor:
+    """@odata.nextLink and max-items bookkeeping for one paged query.
+
+    Shared by GraphClient.iter_pages and AsyncGraphClient.aiter_pages, which
+    fetch the pages: `take(page)` returns the page to yield (cut at
+    `max_items`) and the nextLink to fetch next, or None to stop.
+    """
+
+    def __init__(self, endpoint: str, max_items: int = GRAPH_MAX_ITEMS):
+        self.endpoint = endpoint
+        self.max_items = max_items
+        self.seen = 0
+
+    def take(self, page: dict) -> Tuple[dict, Optional[str]]:
+        items = page.get('value', [])
+        next_url = page.get('@odata.nextLink')
+        if self.seen + len(items) >= self.max_items and next_url:
+            logger.warning(f"Graph {self.endpoint} stopped at max_items={self.max_items}")
+            return {'value': items[:self.max_items - self.seen]}, None
+        self.seen += len(items)
+        # nextLink already carries the original query (including $skiptoken)
+        return page, next_url
+
+    def body(self, response, what: Optional[str] = None) -> Optional[dict]:
+        """JSON page of a 200 response; None (logged) otherwise, which ends the stream"""
+        if response.status_code != 200:
+            logger.error(f"Graph {what or self.endpoint} error: {response.status_code} - {response.text}")
+            return None
+        return response.json()
+
+
+class GraphClient:
+    """Shared Microsoft Graph HTTP client.
+
+    Keeps a pooled keep-alive session to graph.microsoft.com, applies
+    per-call timeouts and retries throttled/unavailable responses with
+    jittered backoff that honours Retry-After.
+    """
+
+    def __init__(self, base_url: str = GRAPH_BASE_URL, max_retries: int = GRAPH_MAX_RETRIES,
+                 timeout=(GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT), pool_size: int = GRAPH_POOL_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.stats = GraphStats()
+
+        self.session = requests.Session()
+        # Retries are handled here so Retry-After and latency accounting stay in one place
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+
+    def url(self, path: str) -> str:
+        if path.startswith('http'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, access_token: str, params: Optional[dict] = None,
+                json: Optional[Any] = None, headers: Optional[dict] = None, timeout=None) -> requests.Response:
+        """Send a Graph request, retrying 429/5xx and network errors.
+
+        Returns the final response; raises the last network error if every attempt failed.
+        """
+        url = self.url(path)
+        req_headers = request_headers(access_token, headers)
+        call = GraphCall(self.stats, method, url, self.max_retries)
+        while True:
+            try:
+                response = self.session.request(
+                    method, url, headers=req_headers, params=params, json=json,
+                    timeout=timeout or self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = call.after_error(e)
+                if delay is None:
+                    raise
+            else:
+                delay = call.after_response(response.status_code, response.headers)
+                if delay is None:
+                    return response
+            time.sleep(delay)
+
+    def get(self, path: str, access_token: str, params: Optional[dict] = None, **kwargs) -> requests.Response:
+        return self.request('GET', path, access_token, params=params, **kwargs)
+
+    def iter_pages(self, path: str, access_token: str, params: Optional[dict] = None,
+                   first_page: Optional[dict] = None, max_items: int = GRAPH_MAX_ITEMS,
+                   headers: Optional[dict] = None) -> Iterator[dict]:
+        """Lazily yield raw pages, following @odata.nextLink.
+
+        Pass `first_page` when the first page was already fetched (e.g. through
+        $batch). Each yielded page keeps its @odata.* annotations so delta
+        callers can pick up @odata.deltaLink from the last one. Stops after
+        `max_items` items; a failing page ends the stream with what was read so far.
+        """
+        cursor = PageCursor(endpoint_name(self.url(path)), max_items)
+        page = first_page
+        if page is None:
+            page = cursor.body(self.get(path, access_token, params=params, headers=headers))
+        while page is not None:
+            page, next_url = cursor.take(page)
+            yield page
+            if not next_url:
+                return
+            page = cursor.body(self.get(next_url, access_token, headers=headers), 'nextLink')
+
+    def iter_items(self, path: str, access_token: str, params: Optional[dict] = None,
+                   first_page: Optional[dict] = None, max_items: int = GRAPH_MAX_ITEMS) -> Iterator[dict]:
+        """Item-level view over iter_pages"""
+        for page in self.iter_pages(path, access_token, params=params, first_page=first_page, max_items=max_items):
+            yield from page.get('value', [])
+
+    def batch(self, access_token: str, sub_requests: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Send sub-requests through one JSON $batch call and demultiplex the results.
+
+        Each sub-request is a dict with `id`, `url` and optional `method`, `params`,
+        `headers` and `body`. Returns {id: {'status', 'headers', 'body'}}. A failing
+        sub-request only affects its own entry; throttled ones are re-sent in a
+        smaller follow-up batch.
+        """
+        if len(sub_requests) > GRAPH_BATCH_LIMIT:
+            raise ValueError(f"Graph $batch supports at most {GRAPH_BATCH_LIMIT} requests")
+
+        pending = {req['id']: req for req in sub_requests}
+        results: Dict[str, Dict[str, Any]] = {}
+        attempt = 0
+        while pending:
+            payload = {'requests': [self._batch_entry(req) for req in pending.values()]}
+            response = self.request('POST', '/$batch', access_token, json=payload)
+            if response.status_code != 200:
+                logger.error(f"Graph $batch error: {response.status_code} - {response.text}")
+                for req_id in pending:
+                    results[req_id] = {'status': response.status_code, 'headers': {}, 'body': None}
+                break
+
+            throttled = {}
+            for sub in response.json().get('responses', []):
+                req_id = sub.get('id')
+                if req_id not in pending:
+                    continue
+                status = int(sub.get('status', 500))
+                results[req_id] = {
+                    'status': status,
+                    'headers': sub.get('headers') or {},
+                    'body': sub.get('body'),
+                }
+                if status in RETRYABLE_STATUS:
+                    throttled[req_id] = pending[req_id]
+                else:
+                    logger.info(f"Graph $batch {endpoint_name(self.url(pending[req_id]['url']))} → {status}")
+
+            if not throttled or attempt >= self.max_retries:
+                break
+            waits = [retry_after_seconds(results[req_id]['headers']) for req_id in throttled]
+            waits = [w for w in waits if w is not None]
+            retry_after = max(waits) if waits else None
+            if retry_after is not None and retry_after > GRAPH_MAX_RETRY_AFTER:
+                break
+            delay = backoff_delay(attempt, retry_after)
+            logger.warning(f"Graph $batch: {len(throttled)} sub-requests throttled, retrying in {delay:.2f}s")
+            time.sleep(delay)
+            pending = throttled
+            attempt += 1
+
+        return results
+
+    def _batch_entry(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        url = req['url']
+        if url.startswith(self.base_url):
+            url = url[len(self.base_url):]
+        if req.get('params'):
+            url = f"{url}?{urlencode(req['params'], quote_via=quote, safe='$,()')}"
+        entry = {'id': req['id'], 'method': req.get('method', 'GET'), 'url': url}
+        headers = dict(req.get('headers') or {})
+        if req.get('body') is not None:
+            entry['body'] = req['body']
+            headers['Content-Type'] = 'application/json'
+        if headers:
+            entry['headers'] = headers
+        return entry
+
+
+graph_client = GraphClient()
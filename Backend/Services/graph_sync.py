@@ -0,0 +1,341 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DeleteOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from Services.graph_client import graph_client, GraphFetchError, GRAPH_PAGE_SIZE
+from Services.graph_async import graph_async
+from Services.work_stress import PERIOD_DAYS, parse_graph_datetime, stress_window
+
+logger = logging.getLogger(__name__)
+
+# Days of history kept in the local copy (enough for the quarter view, plus a day
+# so local days east of UTC are covered), and how far ahead a calendar delta
+# window reaches before it has to be re-initialised
+GRAPH_SYNC_WINDOW_DAYS = int(os.getenv('GRAPH_SYNC_WINDOW_DAYS', str(max(PERIOD_DAYS.values()) + 1)))
+GRAPH_SYNC_LOOKAHEAD_DAYS = int(os.getenv('GRAPH_SYNC_LOOKAHEAD_DAYS', '30'))
+# Skip the delta round trip when the device was synced this recently
+GRAPH_SYNC_MIN_INTERVAL = int(os.getenv('GRAPH_SYNC_MIN_INTERVAL', '30'))
+# Delta pages must be followed to the end to get a deltaLink, so the cap is generous
+GRAPH_SYNC_MAX_ITEMS = int(os.getenv('GRAPH_SYNC_MAX_ITEMS', '50000'))
+# One sync per device at a time; a holder that died frees the device after this long
+GRAPH_SYNC_LEASE_SECONDS = int(os.getenv('GRAPH_SYNC_LEASE_SECONDS', '120'))
+
+CALENDAR = 'calendar'
+MAIL = 'mail'
+# graph_sync_state document that marks a device's sync as in progress
+LEASE = 'lease'
+DELTA_PATHS = {
+    CALENDAR: '/me/calendarView/delta',
+    MAIL: '/me/mailFolders/inbox/messages/delta',
+}
+
+
+def _aware(dt: datetime) -> datetime:
+    """Mongo hands back naive UTC datetimes; make them comparable with aware ones"""
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _event_doc(device_id: str, ev: Dict[str, Any], now: datetime) -> Optional[Dict[str, Any]]:
+    start = ev.get('start', {}).get('dateTime')
+    end = ev.get('end', {}).get('dateTime')
+    if not start or not end:
+        return None
+    return {
+        'device_id': device_id,
+        'event_id': ev['id'],
+        'subject': ev.get('subject'),
+        'start': parse_graph_datetime(start),
+        'end': parse_graph_datetime(end),
+        'location': (ev.get('location') or {}).get('displayName'),
+        'is_all_day': ev.get('isAllDay', False),
+        'is_cancelled': ev.get('isCancelled', False),
+        'synced_at': now,
+    }
+
+
+def _message_doc(device_id: str, msg: Dict[str, Any], now: datetime) -> Optional[Dict[str, Any]]:
+    received = msg.get('receivedDateTime')
+    if not received:
+        return None
+    return {
+        'device_id': device_id,
+        'message_id': msg['id'],
+        'received_at': parse_graph_datetime(received),
+        'synced_at': now,
+    }
+
+
+class GraphSync:
+    """Incremental calendar/mail sync using Graph delta queries.
+
+    Per device and kind ('calendar', 'mail') the latest deltaLink and the
+    window it was opened for are kept in `graph_sync_state`. A normalised
+    copy of events and message timestamps lives in `graph_events` and
+    `graph_messages`; each sync only pulls what changed since the last one.
+
+    A full (re)initialisation writes its rows under a new generation and
+    only drops rows of older generations once the whole page chain has
+    been applied, so readers never see an empty or half-built copy. A
+    lease document in `graph_sync_state` keeps syncs of one device from
+    interleaving across threads and worker processes.
+    """
+
+    def __init__(self, db, window_days: int = GRAPH_SYNC_WINDOW_DAYS):
+        self.window_days = window_days
+        self.state = db.graph_sync_state
+        self.events = db.graph_events
+        self.messages = db.graph_messages
+
+    def ensure_indexes(self):
+        self.state.create_index([('device_id', ASCENDING), ('kind', ASCENDING)], unique=True)
+        self.events.create_index([('device_id', ASCENDING), ('event_id', ASCENDING)], unique=True)
+        self.events.create_index([('device_id', ASCENDING), ('start', ASCENDING)])
+        self.messages.create_index([('device_id', ASCENDING), ('message_id', ASCENDING)], unique=True)
+        self.messages.create_index([('device_id', ASCENDING), ('received_at', ASCENDING)])
+
+    # ---------------- Sync ----------------
+
+    def sync(self, device_id: str, access_token: str, force: bool = False) -> Dict[str, Any]:
+        """Bring the local copy for a device up to date.
+
+        Both delta queries go out in one $batch; the follow-up page chains
+        of calendar and mail are then pulled concurrently and applied page
+        by page. A caller arriving while another sync of the device runs
+        waits for it, and then usually finds the copy fresh enough to skip.
+        """
+        holder = self._acquire(device_id)
+        try:
+            return self._sync(device_id, access_token, force)
+        finally:
+            self._release(device_id, holder)
+
+    def _acquire(self, device_id: str) -> str:
+        """Take the device's sync lease, waiting for a running sync to finish"""
+        holder = str(ObjectId())
+        deadline = time.monotonic() + GRAPH_SYNC_LEASE_SECONDS
+        while True:
+            now = datetime.now(timezone.utc)
+            try:
+                self.state.update_one(
+                    {'device_id': device_id, 'kind': LEASE, 'until': {'$not': {'$gt': now}}},
+                    {'$set': {'holder': holder, 'until': now + timedelta(seconds=GRAPH_SYNC_LEASE_SECONDS)}},
+                    upsert=True
+                )
+                return holder
+            except DuplicateKeyError:
+                # Held by a running sync
+                if time.monotonic() > deadline:
+                    raise GraphFetchError("Calendar sync already in progress", 503)
+                time.sleep(0.25)
+
+    def _release(self, device_id: str, holder: str):
+        self.state.delete_one({'device_id': device_id, 'kind': LEASE, 'holder': holder})
+
+    def _sync(self, device_id: str, access_token: str, force: bool) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        window_start, today_end = stress_window(self.window_days, now)
+        states = {s['kind']: s for s in self.state.find({'device_id': device_id})}
+
+        if not force and all(
+            kind in states and states[kind].get('synced_at')
+            and (now - _aware(states[kind]['synced_at'])).total_seconds() < GRAPH_SYNC_MIN_INTERVAL
+            for kind in (CALENDAR, MAIL)
+        ):
+            return {'skipped': True}
+
+        windows = {}
+        sub_requests = []
+        for kind in (CALENDAR, MAIL):
+            state = states.get(kind)
+            if state and state.get('delta_link') and self._covers(state, window_start, today_end):
+                windows[kind] = (_aware(state['window_start']), _aware(state['window_end']))
+                sub_requests.append({'id': kind, 'url': state['delta_link'], 'headers': self._prefer()})
+            else:
+                windows[kind] = None
+                sub_requests.append(self._initial_request(kind, window_start))
+
+        results = graph_client.batch(access_token, sub_requests)
+
+        summary = {}
+        pending = {}
+        for kind in (CALENDAR, MAIL):
+            result = results.get(kind, {})
+            window = windows[kind]
+            initial = window is None
+
+            if not initial and result.get('status') in (400, 404, 410):
+                # Delta token expired or was rejected; fall back to a full re-sync
+                logger.warning(f"Delta token for {device_id}/{kind} rejected ({result.get('status')}), re-initialising")
+                result = self._fetch_initial(kind, window_start, access_token)
+                initial = True
+
+            if result.get('status') != 200:
+                logger.error(f"Graph {kind} delta error for {device_id}: {result.get('status')} - {result.get('body')}")
+                if kind == CALENDAR:
+                    raise GraphFetchError("Failed to sync calendar events", result.get('status') or 502)
+                summary[kind] = {'error': result.get('status')}
+                continue
+
+            if initial:
+                window = (window_start, window_start + timedelta(days=self.window_days + GRAPH_SYNC_LOOKAHEAD_DAYS))
+                # Rows of the previous copy stay readable until this one is complete
+                generation = str(ObjectId())
+            else:
+                generation = states[kind].get('generation')
+            pending[kind] = (window, initial, generation, result.get('body') or {})
+
+        outcomes = graph_async.gather(*(
+            self._apply_pages(device_id, kind, access_token, first_page, generation)
+            for kind, (_, _, generation, first_page) in pending.items()
+        ))
+
+        for kind, (applied, delta_link) in zip(pending, outcomes):
+            window, initial, generation, _ = pending[kind]
+            if delta_link:
+                if initial:
+                    self._drop_other_generations(device_id, kind, generation)
+                self.state.update_one(
+                    {'device_id': device_id, 'kind': kind},
+                    {'$set': {
+                        'delta_link': delta_link,
+                        'window_start': window[0],
+                        'window_end': window[1],
+                        'generation': generation,
+                        'synced_at': now,
+                    }},
+                    upsert=True
+                )
+            else:
+                logger.warning(f"No deltaLink for {device_id}/{kind}; next sync will re-initialise")
+                self.state.delete_one({'device_id': device_id, 'kind': kind})
+            summary[kind] = {'initial': initial, 'changes': applied}
+
+        logger.info(f"Graph sync for {device_id}: {summary}")
+        return summary
+
+    def reset(self, device_id: str):
+        """Forget delta state and the local copy for a device"""
+        self.state.delete_many({'device_id': device_id})
+        self.events.delete_many({'device_id': device_id})
+        self.messages.delete_many({'device_id': device_id})
+
+    def _covers(self, state: Dict[str, Any], window_start: datetime, today_end: datetime) -> bool:
+        return (state.get('window_start') and state.get('window_end')
+                and _aware(state['window_start']) <= window_start
+                and _aware(state['window_end']) >= today_end)
+
+    def _prefer(self) -> Dict[str, str]:
+        # Delta queries ignore $top; page size is negotiated through Prefer
+        return {'Prefer': f'odata.maxpagesize={GRAPH_PAGE_SIZE}'}
+
+    def _initial_request(self, kind: str, window_start: datetime) -> Dict[str, Any]:
+        if kind == CALENDAR:
+            window_end = window_start + timedelta(days=self.window_days + GRAPH_SYNC_LOOKAHEAD_DAYS)
+            return {
+                'id': kind,
+                'url': DELTA_PATHS[CALENDAR],
+                'params': {
+                    'startDateTime': window_start.isoformat(),
+                    'endDateTime': window_end.isoformat(),
+                },
+                'headers': self._prefer(),
+            }
+        return {
+            'id': kind,
+            'url': DELTA_PATHS[MAIL],
+            'params': {
+                '$select': 'receivedDateTime',
+                '$filter': f"receivedDateTime ge {window_start.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+            },
+            'headers': self._prefer(),
+        }
+
+    def _fetch_initial(self, kind: str, window_start: datetime, access_token: str) -> Dict[str, Any]:
+        req = self._initial_request(kind, window_start)
+        response = graph_client.get(req['url'], access_token, params=req['params'], headers=req['headers'])
+        return {
+            'status': response.status_code,
+            'body': response.json() if response.status_code == 200 else response.text,
+        }
+
+    def _drop_other_generations(self, device_id: str, kind: str, generation: str):
+        """Remove what a completed re-initialisation didn't deliver again"""
+        collection = self.events if kind == CALENDAR else self.messages
+        collection.delete_many({'device_id': device_id, 'generation': {'$ne': generation}})
+
+    async def _apply_pages(self, device_id: str, kind: str, access_token: str, first_page: dict,
+                           generation: Optional[str]) -> Tuple[int, Optional[str]]:
+        """Apply delta pages as they stream in, tagging rows with `generation`; returns (changes, deltaLink)"""
+        if kind == CALENDAR:
+            collection, id_field, to_doc = self.events, 'event_id', _event_doc
+        else:
+            collection, id_field, to_doc = self.messages, 'message_id', _message_doc
+
+        now = datetime.now(timezone.utc)
+        applied = 0
+        delta_link = None
+        pages = graph_async.aiter_pages(
+            DELTA_PATHS[kind], access_token, first_page=first_page,
+            max_items=GRAPH_SYNC_MAX_ITEMS, headers=self._prefer()
+        )
+        async for page in pages:
+            ops: List[Any] = []
+            for item in page.get('value', []):
+                if not item.get('id'):
+                    continue
+                key = {'device_id': device_id, id_field: item['id']}
+                if '@removed' in item:
+                    ops.append(DeleteOne(key))
+                    continue
+                doc = to_doc(device_id, item, now)
+                if doc:
+                    ops.append(UpdateOne(key, {'$set': {**doc, 'generation': generation}}, upsert=True))
+            if ops:
+                # pymongo blocks; keep the event loop free for the other chain
+                await asyncio.to_thread(collection.bulk_write, ops, ordered=False)
+                applied += len(ops)
+            delta_link = page.get('@odata.deltaLink') or delta_link
+        return applied, delta_link
+
+    # ---------------- Local reads ----------------
+
+    def event_times(self, device_id: str, start: datetime, end: datetime) -> Iterator[Tuple[datetime, datetime]]:
+        """(start, end) of the meetings in the window; cancelled ones don't add to the load"""
+        cursor = self.events.find(
+            {'device_id': device_id, 'start': {'$gte': start, '$lte': end}, 'is_cancelled': {'$ne': True}},
+            {'_id': 0, 'start': 1, 'end': 1}
+        )
+        for doc in cursor:
+            yield _aware(doc['start']), _aware(doc['end'])
+
+    def message_times(self, device_id: str, start: datetime, end: datetime) -> Iterator[datetime]:
+        cursor = self.messages.find(
+            {'device_id': device_id, 'received_at': {'$gte': start, '$lte': end}},
+            {'_id': 0, 'received_at': 1}
+        )
+        for doc in cursor:
+            yield _aware(doc['received_at'])
+
+    def events_between(self, device_id: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Events overlapping [start, end) in Graph's event shape"""
+        cursor = self.events.find(
+            {'device_id': device_id, 'start': {'$lt': end}, 'end': {'$gt': start}},
+            {'_id': 0}
+        ).sort('start', ASCENDING)
+        return [
+            {
+                'id': doc['event_id'],
+                'subject': doc.get('subject'),
+                'start': {'dateTime': _aware(doc['start']).isoformat(), 'timeZone': 'UTC'},
+                'end': {'dateTime': _aware(doc['end']).isoformat(), 'timeZone': 'UTC'},
+                'location': {'displayName': doc.get('location')},
+            }
+            for doc in cursor
+        ]
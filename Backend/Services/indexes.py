@@ -0,0 +1,108 @@
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Mood events are keyed by the integer id /api/mood-analytics/<int:user_id> receives
+# (not the users ObjectId the score collections use); the test route records 12345
+MOOD_SAMPLE_USER_ID = 12345
+
+# Indexes the request handlers rely on. create_indexes is a no-op for ones that already exist
+APP_INDEXES = {
+    # /api/register duplicate check and /api/login; unique so concurrent registrations can't both succeed
+    # updated_at: UserCacheSync polls it to find users changed by other workers
+    'users': [IndexModel([('email', ASCENDING)], unique=True, name='email_unique'),
+              IndexModel([('updated_at', ASCENDING)], name='updated_at')],
+    # One score document per user per local day; also serves the date-sorted history reads
+    'user_scores': [IndexModel([('userId', ASCENDING), ('date', ASCENDING)], unique=True, name='userId_date_unique')],
+    # The same for the monthly bucket layout (SCORE_LAYOUT=monthly): one document per user per month
+    'user_score_months': [IndexModel([('userId', ASCENDING), ('month', ASCENDING)], unique=True, name='userId_month_unique')],
+    # Mood check-ins live in mood_events and its rollups; MoodEventStore.ensure_indexes creates those
+}
+
+
+def ensure_app_indexes(db) -> Dict[str, List[str]]:
+    """Create APP_INDEXES, collection by collection; returns the index names now present"""
+    created = {}
+    for collection, indexes in APP_INDEXES.items():
+        try:
+            created[collection] = db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # Typically existing duplicates blocking a unique index; the rest still get created
+            logger.error(f"Failed to create indexes on {collection}: {e}")
+    return created
+
+
+def hot_queries(user_id: Optional[ObjectId] = None, mood_user_id: int = MOOD_SAMPLE_USER_ID) -> List[Dict[str, Any]]:
+    """The queries the endpoints issue, with representative values"""
+    user_id = user_id or ObjectId()
+    today = datetime.now(timezone.utc).date()
+    return [
+        {'endpoint': '/api/login', 'collection': 'users',
+         'filter': {'email': 'someone@example.com'}},
+        {'endpoint': '/api/update-user-score', 'collection': 'user_scores',
+         'filter': {'userId': user_id, 'date': today.isoformat()}},
+        {'endpoint': '/api/update-user-score (latest day)', 'collection': 'user_scores',
+         'filter': {'userId': user_id}, 'sort': [('date', -1)], 'limit': 1},
+        {'endpoint': '/api/user-scores', 'collection': 'user_scores',
+         'filter': {'userId': user_id, 'date': {'$gte': (today - timedelta(days=6)).isoformat(), '$lte': today.isoformat()}},
+         'sort': [('date', -1)]},
+        {'endpoint': '/api/user-profile', 'collection': 'user_scores',
+         'filter': {'userId': user_id}, 'sort': [('date', -1)]},
+        {'endpoint': '/api/user-scores (SCORE_LAYOUT=monthly)', 'collection': 'user_score_months',
+         'filter': {'userId': user_id, 'month': {'$gte': (today - timedelta(days=6)).isoformat()[:7], '$lte': today.isoformat()[:7]}},
+         'sort': [('month', -1)]},
+        {'endpoint': '/api/mood-analytics (rolled up)', 'collection': 'mood_rollups_hourly',
+         'filter': {'userId': mood_user_id, 'bucket': {'$gte': datetime.now(timezone.utc) - timedelta(days=7)}}},
+        {'endpoint': '/api/mood-analytics (latest)', 'collection': 'mood_events',
+         'filter': {'userId': mood_user_id, 'created_at': {'$gte': datetime.now(timezone.utc) - timedelta(hours=1)}}},
+    ]
+
+
+def _stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    stages = []
+    while plan:
+        stages.append(plan)
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return stages
+
+
+def explain_queries(db, user_id: Optional[ObjectId] = None,
+                    mood_user_id: int = MOOD_SAMPLE_USER_ID) -> List[Dict[str, Any]]:
+    """explain() each hot query and report whether it is served by an index"""
+    report = []
+    for query in hot_queries(user_id, mood_user_id):
+        cursor = db[query['collection']].find(query['filter'])
+        if query.get('sort'):
+            cursor = cursor.sort(query['sort'])
+        if query.get('limit'):
+            cursor = cursor.limit(query['limit'])
+        try:
+            explained = cursor.explain()
+        except Exception as e:
+            report.append({'endpoint': query['endpoint'], 'collection': query['collection'], 'error': str(e)})
+            continue
+
+        winning = explained.get('queryPlanner', {}).get('winningPlan', {})
+        # Slot-based engine (MongoDB 7+) nests the classic plan under queryPlan
+        stages = _stages(winning.get('queryPlan', winning))
+        names = [stage.get('stage') for stage in stages]
+        index = next((stage.get('indexName') for stage in stages if stage.get('stage') == 'IXSCAN'), None)
+        execution = explained.get('executionStats', {})
+        report.append({
+            'endpoint': query['endpoint'],
+            'collection': query['collection'],
+            'stages': names,
+            'index': index,
+            'indexed': index is not None and 'COLLSCAN' not in names,
+            # An in-memory SORT stage means the index didn't provide the order
+            'sorted_by_index': 'SORT' not in names,
+            'keys_examined': execution.get('totalKeysExamined'),
+            'docs_examined': execution.get('totalDocsExamined'),
+        })
+    return report
@@ -0,0 +1,104 @@
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from Services.mood_events import MoodEventStore
+from Services.timezones import local_date, local_midnight, resolve_timezone, timezone_name
+
+logger = logging.getLogger(__name__)
+
+# period -> (number of buckets, bucket unit)
+PERIODS = {
+    'week': (7, 'day'),
+    'month': (30, 'day'),
+    'year': (12, 'month'),
+}
+BUCKET_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m'}
+LABEL_FORMATS = {'week': '%a', 'month': '%b %d', 'year': '%b'}
+# source -> (time field, value summed, check-ins per document)
+SOURCE_FIELDS = {
+    'raw': ('created_at', '$mood_level', 1),
+    'hourly': ('bucket', '$total', '$count'),
+    'daily': ('bucket', '$total', '$count'),
+}
+
+
+def _add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def period_buckets(period: str, tz_name: Optional[str], now: Optional[datetime] = None) -> Tuple[List[date], datetime, datetime]:
+    """(first local day of each bucket, UTC start, UTC end) for the window ending today"""
+    count, unit = PERIODS[period]
+    today = local_date(tz_name, now)
+    if unit == 'month':
+        first = date(today.year, today.month, 1)
+        starts = [_add_months(first, i - count + 1) for i in range(count)]
+        end_day = _add_months(first, 1)
+    else:
+        starts = [today - timedelta(days=count - 1 - i) for i in range(count)]
+        end_day = today + timedelta(days=1)
+    return starts, local_midnight(tz_name, starts[0]), local_midnight(tz_name, end_day)
+
+
+class MoodAnalytics:
+    """Mood check-in averages per local day or month, grouped in MongoDB.
+
+    Reads the coarsest mood rollup whose UTC buckets line up with the
+    caller's local days (daily for UTC, hourly for whole-hour offsets) and
+    the raw mood_events for whatever the rollup job hasn't covered yet.
+    """
+
+    def __init__(self, events: MoodEventStore):
+        self.events = events
+
+    def _grouped(self, user_id: Any, start: datetime, end: datetime, unit: str, tz_name: str) -> Dict[str, Dict[str, float]]:
+        # UTC offsets in force across the window (sampled daily), to decide which rollups line up
+        tz = resolve_timezone(tz_name)
+        offsets = {datetime.fromtimestamp(t, tz).utcoffset()
+                   for t in [*range(int(start.timestamp()), int(end.timestamp()), 86400), int(end.timestamp())]}
+
+        grouped: Dict[str, Dict[str, float]] = {}
+        for source, seg_start, seg_end in self.events.sources(start, end, list(offsets)):
+            time_field, value, count = SOURCE_FIELDS[source]
+            collection = self.events.events if source == 'raw' else self.events.rollups[source]
+            # Range on the (userId, time) index; only the window is read
+            pipeline = [
+                {'$match': {'userId': user_id, time_field: {'$gte': seg_start, '$lt': seg_end}}},
+                {'$group': {
+                    '_id': {'$dateToString': {'format': BUCKET_FORMATS[unit], 'date': f'${time_field}', 'timezone': tz_name}},
+                    'total': {'$sum': value},
+                    'count': {'$sum': count},
+                }},
+            ]
+            for row in collection.aggregate(pipeline):
+                bucket = grouped.setdefault(row['_id'], {'total': 0, 'count': 0})
+                bucket['total'] += row['total']
+                bucket['count'] += row['count']
+        return grouped
+
+    def query(self, user_id: Any, period: str = 'week', tz_name: Optional[str] = None,
+              now: Optional[datetime] = None) -> Dict[str, Any]:
+        """{'labels', 'buckets', 'data', 'average'} for the last `period`, 0 for empty buckets"""
+        tz_name = timezone_name(tz_name)
+        _, unit = PERIODS[period]
+        starts, start, end = period_buckets(period, tz_name, now or datetime.now(timezone.utc))
+        grouped = self._grouped(user_id, start, end, unit, tz_name)
+
+        keys = [day.strftime(BUCKET_FORMATS[unit]) for day in starts]
+        data = []
+        for key in keys:
+            row = grouped.get(key)
+            data.append(row['total'] / row['count'] if row and row['count'] else 0)
+
+        total = sum(row['total'] for row in grouped.values())
+        count = sum(row['count'] for row in grouped.values())
+        return {
+            'period': period,
+            'timezone': tz_name,
+            'labels': [day.strftime(LABEL_FORMATS[period]) for day in starts],
+            'buckets': keys,
+            'data': data,
+            'average': round(total / count, 2) if count else 0,
+        }
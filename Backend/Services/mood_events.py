@@ -0,0 +1,224 @@
+import os
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import CollectionInvalid
+
+from Services.scheduler import PeriodicTask, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+MOOD_ROLLUP_ENABLED = os.getenv('MOOD_ROLLUP_ENABLED', 'true').lower() == 'true'
+MOOD_ROLLUP_INTERVAL_SECONDS = int(os.getenv('MOOD_ROLLUP_INTERVAL_SECONDS', '300'))
+# Hours before the last rollup that each run recomputes, to pick up late-arriving check-ins
+MOOD_ROLLUP_LOOKBACK_HOURS = int(os.getenv('MOOD_ROLLUP_LOOKBACK_HOURS', '2'))
+MOOD_MIGRATION_BATCH_SIZE = int(os.getenv('MOOD_MIGRATION_BATCH_SIZE', '1000'))
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+# Rollups from finest to coarsest: (name, bucket size)
+ROLLUPS = [('hourly', HOUR), ('daily', DAY)]
+
+
+def _aware(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def floor_time(dt: datetime, size: timedelta) -> datetime:
+    """Start of the UTC hour/day containing `dt`"""
+    dt = _aware(dt).astimezone(timezone.utc)
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return epoch + ((dt - epoch) // size) * size
+
+
+class MoodEventStore:
+    """Raw mood check-ins and their hourly/daily rollups.
+
+    Check-ins go to `mood_events`, a time-series collection on created_at
+    with userId as the metaField. `rollup()` aggregates them into
+    `mood_rollups_hourly` and `mood_rollups_daily` (UTC buckets holding the
+    sum, count, min and max of mood_level) and records how far it got in
+    `mood_rollup_state`; anything newer is read from the raw events.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.events = db.mood_events
+        self.rollups = {'hourly': db.mood_rollups_hourly, 'daily': db.mood_rollups_daily}
+        self.state = db.mood_rollup_state
+
+    def ensure_indexes(self):
+        """Create the time-series collection (if missing) and the rollup indexes"""
+        if 'mood_events' not in self.db.list_collection_names():
+            try:
+                self.db.create_collection('mood_events', timeseries={
+                    'timeField': 'created_at', 'metaField': 'userId', 'granularity': 'hours'
+                })
+            except CollectionInvalid:
+                pass  # Created by another worker in the meantime
+        self.events.create_index([('userId', ASCENDING), ('created_at', ASCENDING)])
+        for collection in self.rollups.values():
+            # $merge matches rollup buckets on these fields, so they need a unique index
+            collection.create_index([('userId', ASCENDING), ('bucket', ASCENDING)], unique=True)
+
+    def record(self, user_id: Any, mood: str, mood_level: float, mood_emoji: str,
+               created_at: Optional[datetime] = None):
+        self.events.insert_one({
+            'userId': user_id,
+            'created_at': created_at or datetime.now(timezone.utc),
+            'mood': mood,
+            'mood_level': mood_level,
+            'mood_emoji': mood_emoji,
+        })
+
+    # ---------------- Rollups ----------------
+
+    def rolled_until(self) -> Optional[datetime]:
+        """Events before this instant are reflected in the rollups"""
+        state = self.state.find_one({'_id': 'rollup'})
+        return _aware(state['until']) if state else None
+
+    def _earliest_event(self) -> Optional[datetime]:
+        first = self.events.find_one({}, {'created_at': 1}, sort=[('created_at', ASCENDING)])
+        return _aware(first['created_at']) if first else None
+
+    def _merge(self, source, time_field: str, value: Dict[str, Any], start: datetime, end: datetime, unit: str, into: str):
+        self.db[source].aggregate([
+            {'$match': {time_field: {'$gte': start, '$lt': end}}},
+            {'$group': {
+                '_id': {'userId': '$userId', 'bucket': {'$dateTrunc': {'date': f'${time_field}', 'unit': unit}}},
+                **value,
+            }},
+            {'$project': {
+                '_id': 0, 'userId': '$_id.userId', 'bucket': '$_id.bucket',
+                'total': 1, 'count': 1, 'min': 1, 'max': 1,
+            }},
+            {'$merge': {'into': into, 'on': ['userId', 'bucket'], 'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+        ])
+
+    def rollup(self, until: Optional[datetime] = None, since: Optional[datetime] = None) -> Optional[Tuple[datetime, datetime]]:
+        """Recompute the hourly buckets in [since, until) and the daily buckets containing them.
+
+        `until` defaults to the start of the current hour and `since` to the
+        last rollup minus the lookback (or the first event ever). Buckets are
+        replaced, so re-running a range is safe. Returns the range rolled up.
+        """
+        until = floor_time(until or datetime.now(timezone.utc), HOUR)
+        if since is None:
+            last = self.rolled_until()
+            since = last - timedelta(hours=MOOD_ROLLUP_LOOKBACK_HOURS) if last else self._earliest_event()
+        if since is None:
+            return None
+        since = floor_time(since, HOUR)
+        if since >= until:
+            return None
+
+        self._merge('mood_events', 'created_at', {
+            'total': {'$sum': '$mood_level'}, 'count': {'$sum': 1},
+            'min': {'$min': '$mood_level'}, 'max': {'$max': '$mood_level'},
+        }, since, until, 'hour', 'mood_rollups_hourly')
+        self._merge('mood_rollups_hourly', 'bucket', {
+            'total': {'$sum': '$total'}, 'count': {'$sum': '$count'},
+            'min': {'$min': '$min'}, 'max': {'$max': '$max'},
+        }, floor_time(since, DAY), until, 'day', 'mood_rollups_daily')
+
+        self.state.update_one({'_id': 'rollup'}, {'$set': {'until': until}}, upsert=True)
+        logger.info(f"Mood rollups updated for {since.isoformat()} - {until.isoformat()}")
+        return since, until
+
+    def sources(self, start: datetime, end: datetime, utc_offsets: List[timedelta]) -> List[Tuple[str, datetime, datetime]]:
+        """(source, start, end) segments covering [start, end), coarsest usable source first.
+
+        A rollup is usable only if its UTC buckets line up with the caller's
+        local boundaries (every offset a whole number of buckets), and only
+        up to the last complete bucket before `rolled_until()`; the rest is
+        read from the finer rollup or the raw events.
+        """
+        until = self.rolled_until()
+        usable = [(name, size) for name, size in ROLLUPS
+                  if until and all(offset % size == timedelta(0) for offset in utc_offsets)]
+
+        segments = []
+        cursor = start
+        # Coarsest first: daily up to the last whole rolled-up day, then hourly up to `until`
+        for name, size in reversed(usable):
+            limit = min(end, floor_time(until, size))
+            if limit > cursor:
+                segments.append((name, cursor, limit))
+                cursor = limit
+        if cursor < end:
+            segments.append(('raw', cursor, end))
+        return segments
+
+    # ---------------- Migration ----------------
+
+    def migrate_legacy(self, source, batch_size: int = MOOD_MIGRATION_BATCH_SIZE) -> int:
+        """Copy check-ins from the old Mood_Score collection, resuming after the last copied _id.
+
+        Old documents store the user as `user_id` (or `userId`) and the time
+        as `created_at` (or `create_at`). Rollups are rebuilt afterwards.
+        Returns the number of events copied by this run.
+        """
+        state = self.state.find_one({'_id': 'migration'}) or {}
+        last_id = state.get('last_id')
+        resumed = last_id is not None
+        copied = 0
+        while True:
+            query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+            batch = list(source.find(query).sort('_id', ASCENDING).limit(batch_size))
+            if not batch:
+                break
+
+            present = set()
+            if resumed:
+                # The previous run may have stopped between inserting a batch and recording it
+                ids = [doc['_id'] for doc in batch]
+                present = {e['legacy_id'] for e in self.events.find({'legacy_id': {'$in': ids}}, {'legacy_id': 1})}
+                resumed = False
+
+            events = []
+            for doc in batch:
+                created_at = doc.get('created_at') or doc.get('create_at')
+                if doc['_id'] in present:
+                    continue
+                if created_at is None:
+                    logger.warning(f"Skipping Mood_Score {doc['_id']}: no timestamp")
+                    continue
+                events.append({
+                    'userId': doc.get('userId', doc.get('user_id')),
+                    'created_at': created_at,
+                    'mood': doc.get('mood'),
+                    'mood_level': doc.get('mood_level'),
+                    'mood_emoji': doc.get('mood_emoji'),
+                    'legacy_id': doc['_id'],
+                })
+            if events:
+                self.events.insert_many(events, ordered=False)
+                copied += len(events)
+
+            last_id = batch[-1]['_id']
+            self.state.update_one({'_id': 'migration'}, {'$set': {'last_id': last_id}}, upsert=True)
+            logger.info(f"Migrated {copied} mood events so far")
+
+        earliest = self._earliest_event()
+        if earliest is not None:
+            self.rollup(since=earliest)
+        return copied
+
+
+class MoodRollupScheduler(PeriodicTask):
+    """Keeps the hourly and daily mood rollups current.
+
+    Each run $merges the whole lookback window, so it is held to one worker
+    process per interval by a SchedulerLease.
+    """
+
+    def __init__(self, store: MoodEventStore, interval_seconds: int = MOOD_ROLLUP_INTERVAL_SECONDS,
+                 lease: Optional[SchedulerLease] = None):
+        super().__init__('mood-rollup', interval_seconds, lease=lease)
+        self.store = store
+
+    def run_once(self):
+        self.store.rollup()
@@ -0,0 +1,130 @@
+import os
+import re
+import logging
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# bcrypt cost factor for new hashes; existing hashes with another cost are rehashed on login
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+# 'thread' (bcrypt releases the GIL while hashing) or 'process'
+BCRYPT_POOL = os.getenv('BCRYPT_POOL', 'thread').lower()
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(os.cpu_count() or 2)))
+# Hash/verify calls allowed to wait for a worker before new ones are rejected
+BCRYPT_QUEUE_LIMIT = int(os.getenv('BCRYPT_QUEUE_LIMIT', str(4 * BCRYPT_WORKERS)))
+BCRYPT_RETRY_AFTER_SECONDS = int(os.getenv('BCRYPT_RETRY_AFTER_SECONDS', '1'))
+
+_COST_RE = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class HasherBusyError(Exception):
+    """Raised when the bcrypt pool is saturated; routes answer 503 with Retry-After"""
+
+    def __init__(self, retry_after: int = BCRYPT_RETRY_AFTER_SECONDS):
+        super().__init__("Password hashing is at capacity, retry shortly")
+        self.retry_after = retry_after
+
+
+# Module-level so they can be pickled into a process pool
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """Cost factor encoded in a bcrypt hash, or None if it isn't one"""
+    match = _COST_RE.match(hashed or '')
+    return int(match.group(1)) if match else None
+
+
+class PasswordHasher:
+    """bcrypt on a bounded worker pool.
+
+    At most `workers + queue_limit` calls are admitted at once; beyond that
+    `hash`/`verify` raise HasherBusyError immediately instead of piling up
+    behind a login spike and tying up every request thread.
+    """
+
+    def __init__(self, rounds: int = BCRYPT_ROUNDS, workers: int = BCRYPT_WORKERS,
+                 queue_limit: int = BCRYPT_QUEUE_LIMIT, pool: str = BCRYPT_POOL):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pool = pool
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._stats_lock = threading.Lock()
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0, 'rehashed': 0}
+
+    def _pool(self) -> Executor:
+        # Created lazily so importing the module doesn't fork worker processes
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    if self.pool == 'process':
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        return self._executor
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _run(self, fn: Callable, *args) -> Any:
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            raise HasherBusyError()
+        try:
+            future: Future = self._pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password: str) -> str:
+        hashed = self._run(_hashpw, password.encode('utf-8'), self.rounds)
+        self._count('hashed')
+        return hashed.decode('utf-8')
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        ok = self._run(_checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+        self._count('verified')
+        return ok
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return hash_cost(hashed_password) != self.rounds
+
+    def rehash(self, password: str, hashed_password: str) -> Optional[str]:
+        """New hash at the configured cost if the stored one differs; None when unchanged or busy"""
+        if not self.needs_rehash(hashed_password):
+            return None
+        try:
+            new_hash = self.hash(password)
+        except HasherBusyError:
+            # Retried on a later login; never fail a login over it
+            return None
+        self._count('rehashed')
+        return new_hash
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                **self._stats,
+                'rounds': self.rounds,
+                'pool': self.pool,
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+            }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,251 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+from flask import jsonify, request
+from pymongo import ASCENDING, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+# 'memory' (per process) or 'mongo' (shared by every worker process)
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory').lower()
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+# Proxies in front of the app that append to X-Forwarded-For. 0 keys buckets by the socket
+# address; set it (1 on Render) only when such a proxy is really there, or clients can pick their own key
+RATE_LIMIT_PROXY_HOPS = int(os.getenv('RATE_LIMIT_PROXY_HOPS', '0'))
+
+# Bucket sizes (burst) and refill rates (requests per minute)
+LOGIN_IP_BURST = int(os.getenv('LOGIN_IP_BURST', '20'))
+LOGIN_IP_PER_MINUTE = float(os.getenv('LOGIN_IP_PER_MINUTE', '10'))
+LOGIN_EMAIL_BURST = int(os.getenv('LOGIN_EMAIL_BURST', '5'))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv('LOGIN_EMAIL_PER_MINUTE', '2'))
+REGISTER_IP_BURST = int(os.getenv('REGISTER_IP_BURST', '5'))
+REGISTER_IP_PER_MINUTE = float(os.getenv('REGISTER_IP_PER_MINUTE', '2'))
+REGISTER_EMAIL_BURST = int(os.getenv('REGISTER_EMAIL_BURST', '3'))
+REGISTER_EMAIL_PER_MINUTE = float(os.getenv('REGISTER_EMAIL_PER_MINUTE', '1'))
+# There is deliberately no bucket shared by all clients: one caller could drain it and lock
+# everyone out. Overall bcrypt load is shed by PasswordHasher's bounded queue (503 + Retry-After)
+
+
+class RateLimit:
+    """A token bucket: `burst` requests at once, refilled at `per_minute`"""
+
+    def __init__(self, name: str, burst: int, per_minute: float):
+        self.name = name
+        self.burst = burst
+        self.rate = per_minute / 60.0
+
+    @property
+    def full_refill_seconds(self) -> float:
+        return self.burst / self.rate if self.rate > 0 else 86400.0
+
+    def retry_after(self, tokens: float) -> float:
+        """Seconds until one token is available again"""
+        return (1 - tokens) / self.rate if self.rate > 0 else self.full_refill_seconds
+
+    def refill(self, tokens: float, elapsed_seconds: float) -> float:
+        return min(self.burst, tokens + elapsed_seconds * self.rate)
+
+    def verdict(self, tokens: float) -> Tuple[bool, float]:
+        """(allowed, retry-after seconds) for a bucket holding `tokens`"""
+        allowed = tokens >= 1
+        return allowed, 0.0 if allowed else self.retry_after(tokens)
+
+
+class MemoryBucketBackend:
+    """Buckets in process memory; idle ones expire once they would be full again"""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self._buckets: Dict[str, TTLCache] = {}
+        self._max_keys = max_keys
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        pass
+
+    def peek(self, limit: RateLimit, key: str) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._buckets.get(limit.name)
+            tokens, updated = buckets.get(key, (limit.burst, now)) if buckets is not None else (limit.burst, now)
+        return limit.verdict(limit.refill(tokens, now - updated))
+
+    def take(self, limit: RateLimit, key: str) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            buckets = self._buckets.get(limit.name)
+            if buckets is None:
+                buckets = self._buckets[limit.name] = TTLCache(maxsize=self._max_keys, ttl=limit.full_refill_seconds)
+            tokens, updated = buckets.get(key, (limit.burst, now))
+            tokens = limit.refill(tokens, now - updated)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            buckets[key] = (tokens, now)
+        return allowed, 0.0 if allowed else limit.retry_after(tokens)
+
+
+class MongoBucketBackend:
+    """Buckets in `rate_limits`, updated atomically so all workers share them.
+
+    Refill and take happen in one pipeline update; a TTL index drops
+    buckets once they would be full again.
+    """
+
+    def __init__(self, db):
+        self.collection = db.rate_limits
+
+    def ensure_indexes(self):
+        self.collection.create_index([('expires_at', ASCENDING)], expireAfterSeconds=0)
+
+    def peek(self, limit: RateLimit, key: str) -> Tuple[bool, float]:
+        doc = self.collection.find_one({'_id': f'{limit.name}:{key}'}, {'tokens': 1, 'updated_at': 1})
+        if not doc:
+            return True, 0.0
+        updated = doc['updated_at'] if doc['updated_at'].tzinfo else doc['updated_at'].replace(tzinfo=timezone.utc)
+        elapsed = (datetime.now(timezone.utc) - updated).total_seconds()
+        return limit.verdict(limit.refill(doc['tokens'], elapsed))
+
+    def take(self, limit: RateLimit, key: str) -> Tuple[bool, float]:
+        now = datetime.now(timezone.utc)
+        elapsed = {'$divide': [{'$subtract': [now, {'$ifNull': ['$updated_at', now]}]}, 1000]}
+        refilled = {'$min': [limit.burst, {'$add': [{'$ifNull': ['$tokens', limit.burst]}, {'$multiply': [elapsed, limit.rate]}]}]}
+        doc = self.collection.find_one_and_update(
+            {'_id': f'{limit.name}:{key}'},
+            [
+                {'$set': {'tokens': refilled}},
+                {'$set': {'allowed': {'$gte': ['$tokens', 1]}}},
+                {'$set': {
+                    'tokens': {'$cond': ['$allowed', {'$subtract': ['$tokens', 1]}, '$tokens']},
+                    'updated_at': now,
+                    'expires_at': now + timedelta(seconds=limit.full_refill_seconds),
+                }},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        allowed = bool(doc['allowed'])
+        return allowed, 0.0 if allowed else limit.retry_after(doc['tokens'])
+
+
+class RateLimiter:
+    """Token-bucket admission control in front of expensive routes.
+
+    The Mongo backend shares buckets between worker processes; if it is
+    unreachable the limiter falls back to process memory rather than
+    failing the request.
+    """
+
+    def __init__(self, backend=None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.backend = backend or MemoryBucketBackend()
+        self.enabled = enabled
+        self._fallback = self.backend if isinstance(self.backend, MemoryBucketBackend) else MemoryBucketBackend()
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {'accepted': 0, 'rejected': 0})
+
+    def ensure_indexes(self):
+        self.backend.ensure_indexes()
+
+    def _call(self, op: str, limit: RateLimit, key: str) -> Tuple[bool, float]:
+        try:
+            return getattr(self.backend, op)(limit, key)
+        except Exception as e:
+            logger.warning(f"Rate limit backend error ({e}), using in-process buckets")
+            return getattr(self._fallback, op)(limit, key)
+
+    def _count(self, limit: RateLimit, allowed: bool):
+        with self._stats_lock:
+            self._stats[limit.name]['accepted' if allowed else 'rejected'] += 1
+
+    def peek(self, limit: RateLimit, key: str) -> Tuple[bool, float]:
+        """Whether `limit`'s bucket for `key` has a token, without taking it"""
+        return self._call('peek', limit, key)
+
+    def take(self, limit: RateLimit, key: str) -> Tuple[bool, float]:
+        """(allowed, retry-after seconds) for one request against `limit`'s bucket for `key`"""
+        allowed, retry_after = self._call('take', limit, key)
+        self._count(limit, allowed)
+        return allowed, retry_after
+
+    def admit(self, rules: List[Tuple[RateLimit, str]]) -> Tuple[Optional[RateLimit], float]:
+        """Take a token from every (limit, key) bucket, or from none of them.
+
+        All buckets are checked first, so a request refused by one limit
+        doesn't use up the caller's allowance under the others. Returns the
+        limit that refused (None if admitted) and its retry-after.
+        """
+        for limit, key in rules:
+            allowed, retry_after = self.peek(limit, key)
+            if not allowed:
+                self._count(limit, False)
+                return limit, retry_after
+        for limit, key in rules:
+            # Another request may have emptied the bucket since the check
+            allowed, retry_after = self.take(limit, key)
+            if not allowed:
+                return limit, retry_after
+        return None, 0.0
+
+    def limit(self, *rules: Tuple[RateLimit, Callable[..., Optional[str]]]):
+        """Decorator answering 429 with Retry-After unless every (limit, key) bucket has a token.
+
+        Keys are computed as `key(**view_kwargs)`; a rule whose key is None
+        doesn't apply to the request.
+        """
+        def decorator(view: Callable):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled:
+                    keyed = [(limit, key(**kwargs)) for limit, key in rules]
+                    refused, retry_after = self.admit([(limit, k) for limit, k in keyed if k is not None])
+                    if refused is not None:
+                        logger.warning(f"Rate limited {request.path} ({refused.name})")
+                        return (
+                            jsonify({"error": "Too many requests, please try again later"}),
+                            429,
+                            {"Retry-After": str(max(1, math.ceil(retry_after)))},
+                        )
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {name: dict(counts) for name, counts in self._stats.items()}
+
+
+def create_rate_limiter(db) -> RateLimiter:
+    """Rate limiter for the configured backend (RATE_LIMIT_BACKEND)"""
+    if RATE_LIMIT_BACKEND == 'mongo':
+        return RateLimiter(MongoBucketBackend(db))
+    return RateLimiter(MemoryBucketBackend())
+
+
+# ---------------- Keys ----------------
+
+def client_ip(**_) -> str:
+    """Caller's address, taken from X-Forwarded-For behind RATE_LIMIT_PROXY_HOPS proxies"""
+    forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+    if RATE_LIMIT_PROXY_HOPS and len(forwarded) >= RATE_LIMIT_PROXY_HOPS:
+        # Entries left of those our proxies appended are client-controlled
+        return forwarded[-RATE_LIMIT_PROXY_HOPS]
+    return request.remote_addr or 'unknown'
+
+
+def body_email(body=None, **_) -> Optional[str]:
+    """Normalised email of a validated body"""
+    return body.email.lower() if body is not None else None
+
+
+LOGIN_IP_LIMIT = RateLimit('login_ip', LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE)
+LOGIN_EMAIL_LIMIT = RateLimit('login_email', LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE)
+REGISTER_IP_LIMIT = RateLimit('register_ip', REGISTER_IP_BURST, REGISTER_IP_PER_MINUTE)
+REGISTER_EMAIL_LIMIT = RateLimit('register_email', REGISTER_EMAIL_BURST, REGISTER_EMAIL_PER_MINUTE)
@@ -0,0 +1,142 @@
+import os
+import socket
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# How often each worker checks whether a leased task is due
+SCHEDULER_POLL_SECONDS = int(os.getenv('SCHEDULER_POLL_SECONDS', '30'))
+# A leased run still unfinished after this long is taken to be dead; another worker may start one
+SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', '3600'))
+
+
+class SchedulerLease:
+    """Run slots in `scheduler_leases`, so a task runs in one worker process per interval.
+
+    Every worker starts the task, but a run only happens after `claim()`
+    wins the task's document: the run must be due (`next_run_at` passed)
+    or requested with `request()`, and not in progress elsewhere.
+    `release()` schedules the next run one interval after this one ended.
+    A holder that dies mid-run holds the task for at most `lease_seconds`.
+    """
+
+    def __init__(self, db, poll_seconds: int = SCHEDULER_POLL_SECONDS,
+                 lease_seconds: int = SCHEDULER_LEASE_SECONDS):
+        self.collection = db.scheduler_leases
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.holder = f'{socket.gethostname()}:{os.getpid()}'
+
+    def claim(self, name: str, interval_seconds: float) -> bool:
+        """Take the next run of task `name`; False if it isn't due or another worker has it"""
+        now = datetime.now(timezone.utc)
+        try:
+            doc = self.collection.find_one_and_update(
+                {'_id': name, '$or': [
+                    {'next_run_at': {'$lte': now}},
+                    {'requested': True, 'running': {'$ne': True}},
+                ]},
+                {'$set': {
+                    'holder': self.holder,
+                    'running': True,
+                    'requested': False,
+                    'started_at': now,
+                    # Nobody else may start until this run is released or the lease runs out
+                    'next_run_at': now + timedelta(seconds=max(interval_seconds, self.lease_seconds)),
+                }},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The document exists and didn't match: not due, or running in another worker
+            return False
+        return doc is not None and doc.get('holder') == self.holder
+
+    def release(self, name: str, interval_seconds: float):
+        """End this worker's run of `name` and schedule the next one"""
+        now = datetime.now(timezone.utc)
+        self.collection.update_one(
+            {'_id': name, 'holder': self.holder},
+            {'$set': {
+                'running': False,
+                'finished_at': now,
+                'next_run_at': now + timedelta(seconds=interval_seconds),
+            }}
+        )
+
+    def request(self, name: str):
+        """Ask for a run of `name` as soon as any worker polls, even if one is in progress"""
+        self.collection.update_one({'_id': name}, {'$set': {'requested': True}}, upsert=True)
+
+
+class PeriodicTask:
+    """Runs `run_once` on a daemon thread every `interval_seconds`.
+
+    Subclasses implement `run_once`. `trigger()` wakes the loop early for a
+    manual "run now"; errors are logged and never kill the thread. With a
+    SchedulerLease, only the worker process holding the current run slot
+    runs it; the others poll the lease every `poll_seconds`.
+    """
+
+    def __init__(self, name: str, interval_seconds: float, lease: Optional[SchedulerLease] = None):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.lease = lease
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self):
+        raise NotImplementedError
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info(f"Started background task {self.name} (every {self.interval_seconds}s)")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self):
+        """Run the task as soon as possible instead of waiting for the next interval"""
+        if self.lease is not None:
+            try:
+                self.lease.request(self.name)
+            except Exception as e:
+                logger.error(f"Failed to request a run of {self.name}: {str(e)}")
+        self._wake.set()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run_leased(self):
+        if not self.lease.claim(self.name, self.interval_seconds):
+            return
+        try:
+            self.run_once()
+        finally:
+            self.lease.release(self.name, self.interval_seconds)
+
+    def _loop(self):
+        wait = self.interval_seconds if self.lease is None else min(self.interval_seconds, self.lease.poll_seconds)
+        while not self._stop.is_set():
+            try:
+                if self.lease is None:
+                    self.run_once()
+                else:
+                    self._run_leased()
+            except Exception as e:
+                logger.error(f"Background task {self.name} failed: {str(e)}")
+            self._wake.wait(wait)
+            self._wake.clear()
@@ -0,0 +1,237 @@
+import logging
+from functools import wraps
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Tuple, Type
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import jsonify, request
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, StringConstraints, ValidationError, field_validator
+from typing_extensions import Annotated
+
+from Services.auth_service import EMAIL_RE
+
+logger = logging.getLogger(__name__)
+
+
+def _object_id(value: Any) -> ObjectId:
+    if isinstance(value, ObjectId):
+        return value
+    if not value:
+        raise ValueError("User ID is required")
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ValueError("Invalid user ID")
+
+
+# Non-empty after stripping surrounding whitespace
+Text = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+# Mongo ObjectId parsed from its hex string
+UserId = Annotated[ObjectId, BeforeValidator(_object_id)]
+
+
+class RequestSchema(BaseModel):
+    """Base for JSON request bodies.
+
+    `messages` maps a field to the error returned when it is missing or of
+    the wrong type; validators raise ValueError with their own message.
+    """
+    model_config = ConfigDict(extra='ignore', populate_by_name=True, arbitrary_types_allowed=True)
+
+    messages: ClassVar[Dict[str, str]] = {}
+
+
+class ReportSchema(RequestSchema):
+    """Report payloads: known fields are typed, unknown ones are kept"""
+    model_config = ConfigDict(extra='allow')
+
+
+# ---------------- Auth ----------------
+
+class RegisterRequest(RequestSchema):
+    name: Text
+    email: Text
+    password: Annotated[str, StringConstraints(min_length=1)]
+    confirm_password: str = Field('', alias='confirmPassword')
+
+    messages: ClassVar[Dict[str, str]] = {
+        'name': "Name, email, and password are required",
+        'email': "Name, email, and password are required",
+        'password': "Name, email, and password are required",
+    }
+
+    @field_validator('email')
+    @classmethod
+    def email_format(cls, value: str) -> str:
+        if not EMAIL_RE.match(value):
+            raise ValueError("Invalid email format")
+        return value
+
+
+class LoginRequest(RequestSchema):
+    email: Text
+    password: Annotated[str, StringConstraints(min_length=1)]
+
+    messages: ClassVar[Dict[str, str]] = {
+        'email': "Email and password are required",
+        'password': "Email and password are required",
+    }
+
+    @field_validator('email')
+    @classmethod
+    def email_format(cls, value: str) -> str:
+        if not EMAIL_RE.match(value):
+            raise ValueError("Invalid email format")
+        return value
+
+
+# ---------------- Scores ----------------
+
+class MoodScoreRequest(RequestSchema):
+    user_id: UserId
+    goals: List[str] = []
+    concerns: List[str] = []
+    timezone: Optional[str] = None
+
+    messages: ClassVar[Dict[str, str]] = {'user_id': "User ID is required"}
+
+
+class UpdateScoreRequest(RequestSchema):
+    user_id: UserId
+    timezone: Optional[str] = None
+    socialScore: Optional[float] = None
+    workStressScore: Optional[float] = None
+    screenTimePenalty: Optional[float] = None
+    interactionPenalty: Optional[float] = None
+
+    messages: ClassVar[Dict[str, str]] = {'user_id': "User ID is required"}
+
+    METRICS: ClassVar[Tuple[str, ...]] = ('socialScore', 'workStressScore', 'screenTimePenalty', 'interactionPenalty')
+
+    def metrics(self) -> Dict[str, float]:
+        """Breakdown metrics present in the request"""
+        return {name: getattr(self, name) for name in self.METRICS if getattr(self, name) is not None}
+
+
+# ---------------- Reports ----------------
+
+class MoodPatterns(ReportSchema):
+    average_mood_score: Optional[float] = None
+    mood_fluctuations: Optional[str] = None
+
+
+class CallSummary(ReportSchema):
+    date: Optional[str] = None
+    outgoingCount: Optional[float] = None
+    incomingCount: Optional[float] = None
+    missedCount: Optional[float] = None
+    rejectedCount: Optional[float] = None
+    avgDuration: Optional[float] = None
+    uniqueContacts: Optional[float] = None
+
+
+class SocialHealth(ReportSchema):
+    daily_summaries: List[CallSummary] = []
+
+
+class SpendingPatterns(ReportSchema):
+    spending_score: Optional[float] = None
+    spending_trends: Optional[str] = None
+
+
+class WorkStressSummary(ReportSchema):
+    work_stress_score: Optional[float] = None
+
+
+class SleepPattern(ReportSchema):
+    sleep_score: Optional[float] = None
+    average_hours: Optional[float] = None
+    sleep_tracking_access: Optional[bool] = None
+
+
+class ScreentimeUsage(ReportSchema):
+    screentime_score: Optional[float] = None
+    average_hours: Optional[float] = None
+
+
+class MoodReportRequest(ReportSchema):
+    mood_patterns: Optional[MoodPatterns] = None
+    social_health: Optional[SocialHealth] = None
+    spending_patterns: Optional[SpendingPatterns] = None
+    work_stress: Optional[WorkStressSummary] = None
+    sleep_pattern: Optional[SleepPattern] = None
+    screentime_usage: Optional[ScreentimeUsage] = None
+
+
+class DailyScreenTime(ReportSchema):
+    date: Optional[str] = None
+    total_hours: float
+
+
+class AppUsage(ReportSchema):
+    app_name: str
+    usage_hours: float
+
+
+class ScreenTimeReportRequest(ReportSchema):
+    daily_screen_time: List[DailyScreenTime] = []
+    app_usage_breakdown: List[AppUsage] = []
+
+
+class DailyStressScore(ReportSchema):
+    date: Optional[str] = None
+    stress_score: Optional[float] = None
+
+
+class WorkStressReportRequest(ReportSchema):
+    daily_stress_scores: List[DailyStressScore] = []
+    average_stress_score: float = 0
+    stress_trend: str = 'stable'
+    high_stress_days: int = 0
+    low_stress_days: int = 0
+
+
+# ---------------- Decorator ----------------
+
+def validation_error(schema: Type[RequestSchema], exc: ValidationError) -> Tuple[str, List[str]]:
+    """(headline error, every problem) for a failed body"""
+    errors = exc.errors(include_url=False)
+    details = []
+    for err in errors:
+        if err['type'] == 'value_error':
+            details.append(str(err['ctx']['error']))
+        else:
+            field = '.'.join(str(part) for part in err['loc'])
+            details.append(f"{field}: {err['msg']}" if field else err['msg'])
+
+    first = errors[0]
+    if first['type'] == 'value_error':
+        return details[0], details
+    if first['type'] == 'json_invalid':
+        return "Invalid JSON body", details
+    field = first['loc'][0] if first['loc'] else None
+    return schema.messages.get(field, "Invalid request body"), details
+
+
+def validate_body(schema: Type[RequestSchema], empty_error: str = "No data provided"):
+    """Decode the JSON body straight into `schema` and pass it to the view as `body`.
+
+    Answers 400 with {"error", "details"} when the body is empty or invalid.
+    """
+    def decorator(view: Callable):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            raw = request.get_data(cache=False)
+            if not raw.strip():
+                return jsonify({"error": empty_error}), 400
+            try:
+                body = schema.model_validate_json(raw)
+            except ValidationError as e:
+                error, details = validation_error(schema, e)
+                logger.info(f"Rejected {request.path} body: {details}")
+                return jsonify({"error": error, "details": details}), 400
+            if not body.model_fields_set:
+                return jsonify({"error": empty_error}), 400
+            return view(*args, body=body, **kwargs)
+        return wrapper
+    return decorator
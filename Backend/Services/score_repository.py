@@ -0,0 +1,320 @@
+import os
+import logging
+from datetime import date, datetime
+from itertools import groupby
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# 'daily': one user_scores document per day; 'monthly': one user_score_months document per month
+SCORE_LAYOUT = os.getenv('SCORE_LAYOUT', 'daily').lower()
+IMPORT_BATCH_SIZE = 500
+
+# Breakdown of a user's first ever score; later days start from the previous day's
+DEFAULT_BREAKDOWN = {
+    "moodLevel": 5.0,
+    "socialScore": None,
+    "workStressScore": None,
+    "screenTimePenalty": None,
+    "interactionPenalty": None
+}
+DEFAULT_OVERALL_SCORE = 5.0
+
+# Mean of the numeric breakdown values, rounded to one decimal
+OVERALL_SCORE_EXPR = {
+    '$let': {
+        'vars': {
+            'values': {
+                '$filter': {
+                    'input': {'$map': {'input': {'$objectToArray': '$breakdown'}, 'in': '$$this.v'}},
+                    'cond': {'$isNumber': '$$this'}
+                }
+            }
+        },
+        'in': {
+            '$cond': [
+                {'$gt': [{'$size': '$$values'}, 0]},
+                {'$round': [{'$avg': '$$values'}, 1]},
+                {'$ifNull': ['$overallScore', DEFAULT_OVERALL_SCORE]}
+            ]
+        }
+    }
+}
+
+
+def overall_score(breakdown: Dict[str, Any], current: Optional[float] = None) -> float:
+    """OVERALL_SCORE_EXPR evaluated in Python"""
+    values = [v for v in breakdown.values() if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    if values:
+        return round(sum(values) / len(values), 1)
+    return current if current is not None else DEFAULT_OVERALL_SCORE
+
+
+def score_update_pipeline(metrics: Dict[str, float], now: datetime,
+                          seed: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Update pipeline merging `metrics` into the breakdown and recomputing overallScore.
+
+    `seed` is the breakdown a new document starts from; an existing
+    document keeps its own.
+    """
+    base = {'$ifNull': ['$breakdown', {'$literal': seed or DEFAULT_BREAKDOWN}]}
+    return [
+        {'$set': {
+            'breakdown': {'$mergeObjects': [base, {'$literal': metrics}]},
+            'updatedAt': now
+        }},
+        {'$set': {'overallScore': OVERALL_SCORE_EXPR}},
+    ]
+
+
+def _bulk_replace(collection, requests: Iterable[ReplaceOne]) -> int:
+    written = 0
+    batch = []
+    for op in requests:
+        batch.append(op)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            collection.bulk_write(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+class DailyScoreRepository:
+    """One `user_scores` document per user per local date.
+
+    Every repository returns days in this document's shape:
+    {_id, userId, date, overallScore, breakdown, updatedAt}.
+    """
+
+    def __init__(self, db):
+        self.collection = db.user_scores
+
+    def latest_breakdown(self, user_id: ObjectId, before: str, session=None) -> Optional[Dict[str, Any]]:
+        doc = self.collection.find_one(
+            {'userId': user_id, 'date': {'$lt': before}},
+            {'breakdown': 1, '_id': 0},
+            sort=[('date', -1)],
+            session=session
+        )
+        return doc.get('breakdown') if doc else None
+
+    def update_day(self, user_id: ObjectId, day: str, metrics: Dict[str, float], now: datetime,
+                   session=None) -> Tuple[Dict[str, Any], bool]:
+        """(updated day, whether it was created).
+
+        The common case, the day already existing, is a single
+        find_one_and_update. The first update of a day also reads the most
+        recent earlier breakdown to seed from, then upserts; an update
+        pipeline can't read another document, so that can't be folded into
+        the same round trip.
+        """
+        query = {'userId': user_id, 'date': day}
+        doc = self.collection.find_one_and_update(
+            query, score_update_pipeline(metrics, now),
+            return_document=ReturnDocument.AFTER, session=session
+        )
+        if doc is not None:
+            return doc, False
+        seed = self.latest_breakdown(user_id, day, session=session)
+        doc = self.collection.find_one_and_update(
+            query, score_update_pipeline(metrics, now, seed),
+            upsert=True, return_document=ReturnDocument.AFTER, session=session
+        )
+        return doc, True
+
+    def set_mood_baseline(self, user_id: ObjectId, day: str, mood_level: float, now: datetime,
+                          session=None) -> Tuple[Dict[str, Any], bool]:
+        """(day, whether it was created) after setting moodLevel; a new day's overallScore is the mood"""
+        query = {'userId': user_id, 'date': day}
+        pipeline = [{'$set': {
+            'breakdown': {'$mergeObjects': [
+                {'$ifNull': ['$breakdown', {'$literal': DEFAULT_BREAKDOWN}]},
+                {'$literal': {'moodLevel': mood_level}}
+            ]},
+            'overallScore': {'$ifNull': ['$overallScore', mood_level]},
+            'updatedAt': now
+        }}]
+        # The pre-image tells whether the upsert inserted, and the resulting
+        # overallScore follows from it without reading the document back
+        before = self.collection.find_one_and_update(
+            query, pipeline, upsert=True, return_document=ReturnDocument.BEFORE, session=session
+        )
+        created = before is None
+        score = mood_level if created or before.get('overallScore') is None else before['overallScore']
+        return {**(before or {}), **query, 'overallScore': score}, created
+
+    def days(self, user_id: ObjectId, start: str, end: str) -> List[Dict[str, Any]]:
+        """Days from `start` to `end` inclusive, newest first"""
+        return list(self.collection.find(
+            {'userId': user_id, 'date': {'$gte': start, '$lte': end}}
+        ).sort('date', DESCENDING))
+
+    def day_stages(self, user_id: ObjectId) -> List[Dict[str, Any]]:
+        """Aggregation stages yielding the user's days from `collection`"""
+        return [{'$match': {'userId': user_id}}]
+
+    def iter_days(self) -> Iterator[Dict[str, Any]]:
+        return self.collection.find().sort([('userId', ASCENDING), ('date', ASCENDING)])
+
+    def import_days(self, days: Iterable[Dict[str, Any]]) -> int:
+        """Write days, replacing any with the same user and date; returns how many were written"""
+        return _bulk_replace(self.collection, (
+            ReplaceOne({'userId': doc['userId'], 'date': doc['date']},
+                       {k: v for k, v in doc.items() if k != '_id'}, upsert=True)
+            for doc in days
+        ))
+
+
+class MonthlyScoreRepository:
+    """One `user_score_months` document per user per month (bucket pattern).
+
+    {userId, month: 'YYYY-MM', days: [31 slots]}, where slot i is null or
+    day i + 1's {_id, date, overallScore, breakdown, updatedAt, version}.
+    A 90-day chart reads three or four documents instead of 90, and the
+    index holds one entry per month. Days are written with positional
+    $set on `days.<i>`; overallScore is then recomputed from the returned
+    slot and stored only if the slot's version hasn't moved on since.
+    """
+
+    SLOTS = 31
+
+    def __init__(self, db):
+        self.collection = db.user_score_months
+
+    @staticmethod
+    def _slot(day: str) -> Tuple[str, int]:
+        return day[:7], date.fromisoformat(day).day - 1
+
+    @staticmethod
+    def _day(user_id: ObjectId, slot: Dict[str, Any]) -> Dict[str, Any]:
+        return {'userId': user_id, **{k: v for k, v in slot.items() if k != 'version'}}
+
+    def latest_breakdown(self, user_id: ObjectId, before: str, session=None) -> Optional[Dict[str, Any]]:
+        months = self.collection.find(
+            {'userId': user_id, 'month': {'$lte': before[:7]}},
+            {'days': 1}, sort=[('month', DESCENDING)], session=session
+        ).batch_size(2)
+        for doc in months:
+            for slot in reversed(doc['days']):
+                if slot and slot['date'] < before:
+                    return slot.get('breakdown')
+        return None
+
+    def _update_slot(self, user_id: ObjectId, day: str, changes: Dict[str, Any], now: datetime,
+                     session=None) -> Optional[Dict[str, Any]]:
+        """Apply `changes` (slot field -> value) to an existing day; the updated slot, or None if missing"""
+        month, i = self._slot(day)
+        path = f'days.{i}'
+        doc = self.collection.find_one_and_update(
+            {'userId': user_id, 'month': month, f'{path}.date': day},
+            {'$set': {**{f'{path}.{k}': v for k, v in changes.items()}, f'{path}.updatedAt': now},
+             '$inc': {f'{path}.version': 1}},
+            projection={'days': {'$slice': [i, 1]}},
+            return_document=ReturnDocument.AFTER, session=session
+        )
+        return doc['days'][0] if doc else None
+
+    def _set_overall(self, user_id: ObjectId, day: str, slot: Dict[str, Any], score: float, session=None):
+        if score == slot.get('overallScore'):
+            return
+        month, i = self._slot(day)
+        # A later writer for the same day bumps the version and stores its own, newer score
+        self.collection.update_one(
+            {'userId': user_id, 'month': month, f'days.{i}.version': slot['version']},
+            {'$set': {f'days.{i}.overallScore': score}}, session=session
+        )
+
+    def _create_slot(self, user_id: ObjectId, day: str, slot: Dict[str, Any], session=None):
+        month, i = self._slot(day)
+        result = self.collection.update_one(
+            {'userId': user_id, 'month': month, f'days.{i}': None},
+            {'$set': {f'days.{i}': slot}}, session=session
+        )
+        if result.matched_count == 0:
+            days = [None] * self.SLOTS
+            days[i] = slot
+            # DuplicateKeyError if the month exists and the day was just created
+            # by someone else; ScoreStore retries, which then updates that day
+            self.collection.insert_one({'userId': user_id, 'month': month, 'days': days}, session=session)
+
+    def update_day(self, user_id: ObjectId, day: str, metrics: Dict[str, float], now: datetime,
+                   session=None) -> Tuple[Dict[str, Any], bool]:
+        """(updated day, whether it was created)"""
+        slot = self._update_slot(user_id, day, {f'breakdown.{k}': v for k, v in metrics.items()}, now, session)
+        if slot is not None:
+            score = overall_score(slot['breakdown'], slot.get('overallScore'))
+            self._set_overall(user_id, day, slot, score, session)
+            return self._day(user_id, {**slot, 'overallScore': score}), False
+
+        breakdown = {**(self.latest_breakdown(user_id, day, session=session) or DEFAULT_BREAKDOWN), **metrics}
+        slot = {'_id': ObjectId(), 'date': day, 'overallScore': overall_score(breakdown),
+                'breakdown': breakdown, 'updatedAt': now, 'version': 1}
+        self._create_slot(user_id, day, slot, session)
+        return self._day(user_id, slot), True
+
+    def set_mood_baseline(self, user_id: ObjectId, day: str, mood_level: float, now: datetime,
+                          session=None) -> Tuple[Dict[str, Any], bool]:
+        """(day, whether it was created) after setting moodLevel; a new day's overallScore is the mood"""
+        slot = self._update_slot(user_id, day, {'breakdown.moodLevel': mood_level}, now, session)
+        if slot is not None:
+            score = slot['overallScore'] if slot.get('overallScore') is not None else mood_level
+            self._set_overall(user_id, day, slot, score, session)
+            return self._day(user_id, {**slot, 'overallScore': score}), False
+
+        slot = {'_id': ObjectId(), 'date': day, 'overallScore': mood_level,
+                'breakdown': {**DEFAULT_BREAKDOWN, 'moodLevel': mood_level}, 'updatedAt': now, 'version': 1}
+        self._create_slot(user_id, day, slot, session)
+        return self._day(user_id, slot), True
+
+    def days(self, user_id: ObjectId, start: str, end: str) -> List[Dict[str, Any]]:
+        """Days from `start` to `end` inclusive, newest first"""
+        months = self.collection.find(
+            {'userId': user_id, 'month': {'$gte': start[:7], '$lte': end[:7]}}
+        ).sort('month', DESCENDING)
+        return [self._day(user_id, slot) for doc in months for slot in reversed(doc['days'])
+                if slot and start <= slot['date'] <= end]
+
+    def day_stages(self, user_id: ObjectId) -> List[Dict[str, Any]]:
+        """Aggregation stages yielding the user's days from `collection`"""
+        return [
+            {'$match': {'userId': user_id}},
+            {'$unwind': '$days'},
+            {'$match': {'days': {'$ne': None}}},
+            {'$replaceRoot': {'newRoot': {'$mergeObjects': ['$days', {'userId': '$userId'}]}}},
+        ]
+
+    def iter_days(self) -> Iterator[Dict[str, Any]]:
+        for doc in self.collection.find().sort([('userId', ASCENDING), ('month', ASCENDING)]):
+            for slot in doc['days']:
+                if slot:
+                    yield self._day(doc['userId'], slot)
+
+    def import_days(self, days: Iterable[Dict[str, Any]]) -> int:
+        """Write days grouped by user and month (iter_days order), replacing those months wholesale.
+
+        Returns the number of month documents written.
+        """
+        def months():
+            for (user_id, month), group in groupby(days, key=lambda d: (d['userId'], d['date'][:7])):
+                slots: List[Optional[Dict[str, Any]]] = [None] * self.SLOTS
+                for doc in group:
+                    _, i = self._slot(doc['date'])
+                    slots[i] = {'_id': doc.get('_id') or ObjectId(), 'date': doc['date'],
+                                'overallScore': doc.get('overallScore'), 'breakdown': doc.get('breakdown', {}),
+                                'updatedAt': doc.get('updatedAt'), 'version': 1}
+                yield ReplaceOne({'userId': user_id, 'month': month},
+                                 {'userId': user_id, 'month': month, 'days': slots}, upsert=True)
+        return _bulk_replace(self.collection, months())
+
+
+def create_score_repository(db, layout: str = SCORE_LAYOUT):
+    """Score repository for the configured layout (SCORE_LAYOUT)"""
+    if layout == 'monthly':
+        return MonthlyScoreRepository(db)
+    return DailyScoreRepository(db)
@@ -0,0 +1,86 @@
+import os
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo.errors import ConfigurationError, DuplicateKeyError, OperationFailure
+
+from Services.score_repository import create_score_repository
+from Services.user_stats import UserStatsStore
+
+logger = logging.getLogger(__name__)
+
+# Write scores and their user_stats update in one transaction (needs a replica set, e.g. Atlas)
+SCORE_TRANSACTIONS_ENABLED = os.getenv('SCORE_TRANSACTIONS_ENABLED', 'true').lower() == 'true'
+# Server error code for "transactions not supported" (standalone mongod)
+ILLEGAL_OPERATION = 20
+
+
+class ScoreStore:
+    """Daily scores, one per user per local date, stored by a score repository.
+
+    The repository (SCORE_LAYOUT) stores them as one document per day or
+    one per month. Every write also folds the day's new overallScore into
+    the user's materialised `user_stats` document, in the same transaction
+    when the deployment supports them.
+    """
+
+    def __init__(self, db, stats: Optional[UserStatsStore] = None,
+                 transactions: bool = SCORE_TRANSACTIONS_ENABLED, repository=None):
+        self.client = db.client
+        self.repository = repository or create_score_repository(db)
+        self.stats = stats or UserStatsStore(db, self.repository)
+        self.transactions = transactions
+
+    def _write(self, write: Callable[[Any], Dict[str, Any]]) -> Dict[str, Any]:
+        """Run `write(session)` in a transaction, or with session=None where unsupported"""
+        if self.transactions:
+            try:
+                with self.client.start_session() as session:
+                    return session.with_transaction(write)
+            except (NotImplementedError, ConfigurationError) as e:
+                self._disable_transactions(e)
+            except OperationFailure as e:
+                if e.code != ILLEGAL_OPERATION:
+                    raise
+                self._disable_transactions(e)
+        return write(None)
+
+    def _disable_transactions(self, error: Exception):
+        logger.warning(f"Transactions unavailable ({error}); score and stats writes are no longer atomic")
+        self.transactions = False
+
+    def _write_day(self, write: Callable[[Any], Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            return self._write(write)
+        except DuplicateKeyError:
+            # Lost a race to create the day; the retry finds the winner's document
+            logger.info("Score document created concurrently, retrying update")
+            return self._write(write)
+
+    def update_day(self, user_id: ObjectId, day: str, metrics: Dict[str, float], now: datetime) -> Dict[str, Any]:
+        """Merge metrics into a day's score and return the updated day"""
+        def write(session):
+            doc, _ = self.repository.update_day(user_id, day, metrics, now, session=session)
+            self.stats.record(user_id, day, doc.get('overallScore'), session=session)
+            return doc
+
+        return self._write_day(write)
+
+    def set_mood_baseline(self, user_id: ObjectId, day: str, mood_level: float, now: datetime) -> Dict[str, Any]:
+        """Set a day's moodLevel from onboarding; a new day also starts its overallScore from it"""
+        def write(session):
+            doc, _ = self.repository.set_mood_baseline(user_id, day, mood_level, now, session=session)
+            self.stats.record(user_id, day, doc['overallScore'], session=session)
+            return doc
+
+        return self._write_day(write)
+
+    def days(self, user_id: ObjectId, start: str, end: str) -> List[Dict[str, Any]]:
+        """Score days from `start` to `end` (ISO dates, inclusive), newest first"""
+        return self.repository.days(user_id, start, end)
+
+    def summary(self, user_id: ObjectId) -> Dict[str, Any]:
+        """Count, lifetime average and the two latest weeks' averages (one point read)"""
+        return self.stats.summary(user_id)
@@ -0,0 +1,165 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, UpdateOne
+
+from Services.scheduler import PeriodicTask, SchedulerLease
+from Services.timezones import DEFAULT_TIMEZONE, local_date, timezone_name
+from Services.work_stress import METRIC_FIELDS, aggregate_days, get_work_stress
+
+logger = logging.getLogger(__name__)
+
+STRESS_REFRESH_ENABLED = os.getenv('STRESS_REFRESH_ENABLED', 'true').lower() == 'true'
+STRESS_REFRESH_INTERVAL_SECONDS = int(os.getenv('STRESS_REFRESH_INTERVAL_SECONDS', '900'))
+STRESS_REFRESH_MAX_WORKERS = int(os.getenv('STRESS_REFRESH_MAX_WORKERS', '4'))
+# Days recomputed by each background refresh; only these can go stale
+STRESS_REFRESH_DAYS = int(os.getenv('STRESS_REFRESH_DAYS', '7'))
+# Recent stored days older than this are recomputed on read
+STRESS_MAX_AGE_SECONDS = int(os.getenv('STRESS_MAX_AGE_SECONDS', str(2 * STRESS_REFRESH_INTERVAL_SECONDS)))
+# A timezone keeps being refreshed in the background this long after a client last asked for it
+STRESS_ZONE_ACTIVE_DAYS = int(os.getenv('STRESS_ZONE_ACTIVE_DAYS', '7'))
+
+
+def _aware(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class WorkStressStore:
+    """Per-device, per-timezone, per-day work stress documents in `work_stress_daily`.
+
+    A local day depends on the timezone it was bucketed in, so clients of
+    one device in different zones each get their own days instead of
+    overwriting the other's.
+    """
+
+    def __init__(self, db):
+        self.collection = db.work_stress_daily
+
+    def ensure_indexes(self):
+        self.collection.create_index(
+            [('device_id', ASCENDING), ('timezone', ASCENDING), ('date', ASCENDING)], unique=True
+        )
+        # Days used to be unique per (device_id, date), which allowed one timezone per device
+        if 'device_id_1_date_1' in self.collection.index_information():
+            self.collection.drop_index('device_id_1_date_1')
+
+    def save_days(self, device_id: str, days: Iterable[Dict[str, Any]], tz_name: Optional[str] = None,
+                  requested: bool = False):
+        """Store computed days; `requested` marks the timezone as one a client is using"""
+        now = datetime.now(timezone.utc)
+        tz_name = timezone_name(tz_name)
+        ops = []
+        for day in days:
+            doc = {k: day[k] for k in METRIC_FIELDS}
+            doc.update({'label': day['label'], 'score': day['score'], 'updated_at': now})
+            if requested:
+                doc['requested_at'] = now
+            ops.append(UpdateOne({'device_id': device_id, 'timezone': tz_name, 'date': day['date']},
+                                 {'$set': doc}, upsert=True))
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+
+    def read_days(self, device_id: str, tz_name: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+        """Days stored for `tz_name` in [start_date, end_date] (ISO dates), oldest first"""
+        return list(self.collection.find(
+            {'device_id': device_id, 'timezone': tz_name, 'date': {'$gte': start_date, '$lte': end_date}},
+            {'_id': 0, 'device_id': 0}
+        ).sort('date', ASCENDING))
+
+    def device_timezone(self, device_id: str) -> str:
+        """Timezone the device's most recent days were bucketed in"""
+        doc = self.collection.find_one({'device_id': device_id}, {'timezone': 1}, sort=[('date', -1)])
+        return (doc or {}).get('timezone') or DEFAULT_TIMEZONE
+
+    def active_timezones(self, device_id: str, within_days: int = STRESS_ZONE_ACTIVE_DAYS) -> List[str]:
+        """Timezones clients asked for lately, or the device's latest one if none did"""
+        since = datetime.now(timezone.utc) - timedelta(days=within_days)
+        zones = self.collection.distinct('timezone', {'device_id': device_id, 'requested_at': {'$gte': since}})
+        return [zone for zone in zones if zone] or [self.device_timezone(device_id)]
+
+    def recent(self, device_id: str, days: int = 7, tz_name: Optional[str] = None,
+               max_age_seconds: int = STRESS_MAX_AGE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Precomputed stress for the last `days` local days, or None if any day is missing or stale.
+
+        Past days are settled once stored; only the days the background
+        refresh keeps recomputing have to be recent. Only days bucketed in
+        `tz_name` are considered.
+        """
+        tz_name = timezone_name(tz_name)
+        today = local_date(tz_name)
+        stored = self.read_days(device_id, tz_name, (today - timedelta(days=days - 1)).isoformat(), today.isoformat())
+        if len(stored) < days:
+            return None
+        last_updated = min(_aware(d['updated_at']) for d in stored[-STRESS_REFRESH_DAYS:])
+        if (datetime.now(timezone.utc) - last_updated).total_seconds() > max_age_seconds:
+            return None
+        return {
+            'days': stored,
+            'aggregate': aggregate_days(stored),
+            'fetched_at': last_updated,
+        }
+
+
+class StressRefreshScheduler(PeriodicTask):
+    """Periodically recomputes work stress for every connected device,
+    in each timezone its clients have asked for lately.
+
+    With a SchedulerLease each interval's refresh runs in one worker
+    process only, rather than once per worker.
+    """
+
+    def __init__(self, store: WorkStressStore, sync, list_devices: Callable[[], Iterable[str]],
+                 get_access_token: Callable[[str], Optional[str]],
+                 interval_seconds: int = STRESS_REFRESH_INTERVAL_SECONDS,
+                 max_workers: int = STRESS_REFRESH_MAX_WORKERS,
+                 lease: Optional[SchedulerLease] = None):
+        super().__init__('stress-refresh', interval_seconds, lease=lease)
+        self.store = store
+        self.sync = sync
+        self.list_devices = list_devices
+        self.get_access_token = get_access_token
+        self.max_workers = max_workers
+
+    def refresh_device(self, device_id: str, days: int = STRESS_REFRESH_DAYS, tz_name: Optional[str] = None,
+                       access_token: Optional[str] = None, requested: bool = True) -> Optional[Dict[str, Any]]:
+        """Recompute and store the last `days` days for one device; None if it is not connected.
+
+        Without `tz_name` the device keeps the timezone it was last computed in.
+        Routes pass the `access_token` they already hold; the scheduler looks it up
+        and passes requested=False, so its own runs don't keep a timezone active.
+        """
+        access_token = access_token or self.get_access_token(device_id)
+        if not access_token:
+            return None
+        tz_name = timezone_name(tz_name or self.store.device_timezone(device_id))
+        stress = get_work_stress(device_id, access_token, days=days, sync=self.sync, tz_name=tz_name)
+        self.store.save_days(device_id, stress['days'], tz_name, requested=requested)
+        return stress
+
+    def _refresh_zones(self, device_id: str) -> Optional[Dict[str, Any]]:
+        stress = None
+        for tz_name in self.store.active_timezones(device_id):
+            stress = self.refresh_device(device_id, tz_name=tz_name, requested=False)
+            if stress is None:
+                break
+        return stress
+
+    def run_once(self):
+        devices = list(self.list_devices())
+        if not devices:
+            return
+        started = datetime.now(timezone.utc)
+        refreshed = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stress-refresh') as pool:
+            futures = {device_id: pool.submit(self._refresh_zones, device_id) for device_id in devices}
+            for device_id, future in futures.items():
+                try:
+                    if future.result() is not None:
+                        refreshed += 1
+                except Exception as e:
+                    logger.error(f"Stress refresh failed for device {device_id}: {str(e)}")
+        elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+        logger.info(f"Stress refresh: {refreshed}/{len(devices)} devices in {elapsed:.1f}s")
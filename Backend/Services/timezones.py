@@ -0,0 +1,72 @@
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+import pytz
+
+DEFAULT_TIMEZONE = 'UTC'
+
+
+@lru_cache(maxsize=1024)
+def _resolve(name: str):
+    # all_timezones_set is a set; all_timezones is a ~600 element list
+    if name in pytz.all_timezones_set:
+        try:
+            return pytz.timezone(name)
+        except Exception:
+            pass
+    return pytz.utc
+
+
+def resolve_timezone(name: Optional[str] = None):
+    """Cached pytz zone for an IANA name, falling back to UTC"""
+    return _resolve(name or DEFAULT_TIMEZONE)
+
+
+def timezone_name(name: Optional[str] = None) -> str:
+    """Canonical name of the zone `name` resolves to (unknown names become 'UTC')"""
+    return resolve_timezone(name).zone
+
+
+def local_now(name: Optional[str] = None) -> datetime:
+    """Current datetime in the user's timezone"""
+    return datetime.now(resolve_timezone(name))
+
+
+def local_date(name: Optional[str] = None, now: Optional[datetime] = None) -> date:
+    """Today's date in the user's timezone"""
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(resolve_timezone(name)).date()
+
+
+def local_midnight(name: Optional[str], day: date) -> datetime:
+    """Start of a local calendar day as an aware UTC datetime (DST-correct)"""
+    tz = resolve_timezone(name)
+    return tz.localize(datetime.combine(day, time.min)).astimezone(timezone.utc)
+
+
+@lru_cache(maxsize=4096)
+def _boundaries(name: str, first_day: date, days: int) -> np.ndarray:
+    edges = np.fromiter(
+        (local_midnight(name, first_day + timedelta(days=i)).timestamp() for i in range(days + 1)),
+        dtype=np.float64, count=days + 1
+    )
+    # Shared between callers through the cache
+    edges.flags.writeable = False
+    return edges
+
+
+def day_boundaries(name: Optional[str], first_day: date, days: int) -> np.ndarray:
+    """UTC epoch seconds of each local midnight from `first_day`, `days + 1` edges.
+
+    Day i covers [edges[i], edges[i + 1]); days are 23 or 25 hours long
+    across DST changes. The result is cached and read-only.
+    """
+    return _boundaries(timezone_name(name), first_day, days)
+
+
+def local_day_range(name: Optional[str], days: int, now: Optional[datetime] = None) -> Tuple[date, np.ndarray]:
+    """(first local date, day boundaries) for the last `days` local days ending today"""
+    first_day = local_date(name, now) - timedelta(days=days - 1)
+    return first_day, day_boundaries(name, first_day, days)
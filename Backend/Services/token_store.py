@@ -0,0 +1,396 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from cachetools import TTLCache
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from Services.scheduler import PeriodicTask, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+# 'mongo' (shared by every worker) or 'sqlite' (single host, local development)
+TOKEN_STORE_BACKEND = os.getenv('TOKEN_STORE_BACKEND', 'mongo').lower()
+TOKEN_STORE_SQLITE_PATH = os.getenv('TOKEN_STORE_SQLITE_PATH', 'ms_tokens.sqlite3')
+# In-process front cache; the TTL bounds how long a worker can miss another worker's refresh
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '1024'))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv('TOKEN_CACHE_TTL_SECONDS', '30'))
+# Access tokens are renewed in the background this long before they expire. MSAL's
+# acquire_token_silent only goes to the network inside the last 5 minutes, so stay below that
+TOKEN_REFRESH_ENABLED = os.getenv('TOKEN_REFRESH_ENABLED', 'true').lower() == 'true'
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv('TOKEN_REFRESH_MARGIN_SECONDS', '240'))
+TOKEN_REFRESH_INTERVAL_SECONDS = int(os.getenv('TOKEN_REFRESH_INTERVAL_SECONDS', '60'))
+TOKEN_REFRESH_MAX_WORKERS = int(os.getenv('TOKEN_REFRESH_MAX_WORKERS', '4'))
+# How long one process may hold a device's refresh before another can take over
+TOKEN_REFRESH_CLAIM_SECONDS = int(os.getenv('TOKEN_REFRESH_CLAIM_SECONDS', '30'))
+
+DATETIME_FIELDS = ('expires_at', 'updated_at')
+
+
+def _aware(dt: datetime) -> datetime:
+    """Mongo and SQLite hand back naive UTC datetimes; make them comparable with aware ones"""
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _normalise(data: Dict[str, Any]) -> Dict[str, Any]:
+    for field in DATETIME_FIELDS:
+        value = data.get(field)
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if isinstance(value, datetime):
+            data[field] = _aware(value)
+    return data
+
+
+class MongoTokenBackend:
+    """Tokens in the `ms_tokens` collection, one document per device.
+
+    MSAL token caches live in `ms_account_caches`, one versioned document
+    per account.
+    """
+
+    def __init__(self, db):
+        self.collection = db.ms_tokens
+        self.msal_caches = db.ms_account_caches
+
+    def ensure_indexes(self):
+        self.collection.create_index([('device_id', ASCENDING)], unique=True)
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({'device_id': device_id}, {'_id': 0, 'device_id': 0, 'refreshing_until': 0})
+
+    def put(self, device_id: str, data: Dict[str, Any]):
+        self.collection.replace_one({'device_id': device_id}, {'device_id': device_id, **data}, upsert=True)
+
+    def update(self, device_id: str, fields: Dict[str, Any]):
+        self.collection.update_one({'device_id': device_id}, {'$set': fields})
+
+    def delete(self, device_id: str):
+        self.collection.delete_one({'device_id': device_id})
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for doc in self.collection.find({}, {'_id': 0, 'refreshing_until': 0}):
+            yield doc.pop('device_id'), doc
+
+    def device_ids(self) -> List[str]:
+        return self.collection.distinct('device_id')
+
+    def claim(self, device_id: str, now: datetime, until: datetime) -> bool:
+        doc = self.collection.find_one_and_update(
+            {'device_id': device_id, 'refreshing_until': {'$not': {'$gt': now}}},
+            {'$set': {'refreshing_until': until}},
+            projection={'_id': 1}
+        )
+        return doc is not None
+
+    def release(self, device_id: str):
+        self.collection.update_one({'device_id': device_id}, {'$unset': {'refreshing_until': ''}})
+
+    def get_account_cache(self, key: str) -> Optional[Tuple[str, int]]:
+        doc = self.msal_caches.find_one({'_id': key})
+        return (doc['state'], doc['version']) if doc else None
+
+    def put_account_cache(self, key: str, state: str, version: Optional[int]) -> bool:
+        if version is None:
+            self.msal_caches.update_one({'_id': key}, {'$set': {'state': state}, '$inc': {'version': 1}}, upsert=True)
+            return True
+        if version == 0:
+            try:
+                self.msal_caches.insert_one({'_id': key, 'state': state, 'version': 1})
+                return True
+            except DuplicateKeyError:
+                return False
+        result = self.msal_caches.update_one({'_id': key, 'version': version},
+                                             {'$set': {'state': state}, '$inc': {'version': 1}})
+        return result.matched_count == 1
+
+
+class SQLiteTokenBackend:
+    """Tokens in a local SQLite file, stored as JSON per device"""
+
+    def __init__(self, path: str = TOKEN_STORE_SQLITE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        # WAL lets several worker processes on one host read while one writes
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        with self._lock, self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS ms_tokens (device_id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS ms_token_claims (device_id TEXT PRIMARY KEY, until REAL NOT NULL)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS ms_account_caches '
+                '(key TEXT PRIMARY KEY, state TEXT NOT NULL, version INTEGER NOT NULL)'
+            )
+
+    def _dumps(self, data: Dict[str, Any]) -> str:
+        return json.dumps({k: v.isoformat() if isinstance(v, datetime) else v for k, v in data.items()})
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM ms_tokens WHERE device_id = ?', (device_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, device_id: str, data: Dict[str, Any]):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO ms_tokens (device_id, data) VALUES (?, ?) '
+                'ON CONFLICT(device_id) DO UPDATE SET data = excluded.data',
+                (device_id, self._dumps(data))
+            )
+
+    def update(self, device_id: str, fields: Dict[str, Any]):
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT data FROM ms_tokens WHERE device_id = ?', (device_id,)).fetchone()
+            if row:
+                data = {**json.loads(row[0]), **json.loads(self._dumps(fields))}
+                self._conn.execute('UPDATE ms_tokens SET data = ? WHERE device_id = ?', (json.dumps(data), device_id))
+
+    def delete(self, device_id: str):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM ms_tokens WHERE device_id = ?', (device_id,))
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute('SELECT device_id, data FROM ms_tokens').fetchall()
+        for device_id, data in rows:
+            yield device_id, json.loads(data)
+
+    def device_ids(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT device_id FROM ms_tokens')]
+
+    def claim(self, device_id: str, now: datetime, until: datetime) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO ms_token_claims (device_id, until) VALUES (?, ?) '
+                'ON CONFLICT(device_id) DO UPDATE SET until = excluded.until WHERE ms_token_claims.until <= ?',
+                (device_id, until.timestamp(), now.timestamp())
+            )
+            return cursor.rowcount == 1
+
+    def release(self, device_id: str):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM ms_token_claims WHERE device_id = ?', (device_id,))
+
+    def get_account_cache(self, key: str) -> Optional[Tuple[str, int]]:
+        with self._lock:
+            row = self._conn.execute('SELECT state, version FROM ms_account_caches WHERE key = ?', (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put_account_cache(self, key: str, state: str, version: Optional[int]) -> bool:
+        with self._lock, self._conn:
+            if version is None:
+                self._conn.execute(
+                    'INSERT INTO ms_account_caches (key, state, version) VALUES (?, ?, 1) '
+                    'ON CONFLICT(key) DO UPDATE SET state = excluded.state, version = version + 1',
+                    (key, state)
+                )
+                return True
+            if version == 0:
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO ms_account_caches (key, state, version) VALUES (?, ?, 1)', (key, state)
+                )
+            else:
+                cursor = self._conn.execute(
+                    'UPDATE ms_account_caches SET state = ?, version = version + 1 WHERE key = ? AND version = ?',
+                    (state, key, version)
+                )
+            return cursor.rowcount == 1
+
+
+class TokenStore:
+    """Microsoft tokens per device behind a bounded in-process TTL/LRU cache.
+
+    The backend is the source of truth, so any worker can serve a device
+    connected through another one. Misses are not cached: a device that
+    just finished /auth/callback elsewhere is visible immediately.
+    """
+
+    def __init__(self, backend, maxsize: int = TOKEN_CACHE_SIZE, ttl_seconds: int = TOKEN_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        self.backend.ensure_indexes()
+
+    def get(self, device_id: str, fresh: bool = False) -> Optional[Dict[str, Any]]:
+        """Token data for a device (a copy), or None; `fresh` bypasses the cache"""
+        if not fresh:
+            with self._lock:
+                cached = self._cache.get(device_id)
+            if cached is not None:
+                return dict(cached)
+        data = self.backend.get(device_id)
+        if data is None:
+            self.invalidate(device_id)
+            return None
+        data = _normalise(data)
+        with self._lock:
+            self._cache[device_id] = data
+        return dict(data)
+
+    def save(self, device_id: str, data: Dict[str, Any]):
+        data = _normalise({**data, 'updated_at': datetime.now(timezone.utc)})
+        self.backend.put(device_id, data)
+        with self._lock:
+            self._cache[device_id] = data
+
+    def update(self, device_id: str, fields: Dict[str, Any]):
+        fields = _normalise({**fields, 'updated_at': datetime.now(timezone.utc)})
+        self.backend.update(device_id, fields)
+        with self._lock:
+            cached = self._cache.get(device_id)
+            if cached is not None:
+                self._cache[device_id] = {**cached, **fields}
+
+    def delete(self, device_id: str):
+        self.backend.delete(device_id)
+        self.invalidate(device_id)
+
+    def invalidate(self, device_id: str):
+        with self._lock:
+            self._cache.pop(device_id, None)
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Every stored device with its token data, read from the backend"""
+        return [(device_id, _normalise(data)) for device_id, data in self.backend.items()]
+
+    def devices(self) -> List[str]:
+        return self.backend.device_ids()
+
+    def claim_refresh(self, device_id: str, seconds: int = TOKEN_REFRESH_CLAIM_SECONDS) -> bool:
+        """Reserve redeeming a device's refresh token for this process; False if another holds it"""
+        now = datetime.now(timezone.utc)
+        return self.backend.claim(device_id, now, now + timedelta(seconds=seconds))
+
+    def release_refresh(self, device_id: str):
+        self.backend.release(device_id)
+
+    def load_msal_cache(self, home_account_id: str) -> Optional[Tuple[str, int]]:
+        """Serialized MSAL token cache of one account and its version, or None"""
+        return self.backend.get_account_cache(home_account_id)
+
+    def save_msal_cache(self, home_account_id: str, state: str, version: Optional[int] = None) -> bool:
+        """Store an account's MSAL token cache if its version is still `version`.
+
+        0 means the account must not be stored yet; None overwrites
+        unconditionally. False if another writer got there first.
+        """
+        return self.backend.put_account_cache(home_account_id, state, version)
+
+
+def create_token_store(db) -> TokenStore:
+    """Token store for the configured backend (TOKEN_STORE_BACKEND)"""
+    if TOKEN_STORE_BACKEND == 'sqlite':
+        logger.info(f"Using SQLite token store at {TOKEN_STORE_SQLITE_PATH}")
+        return TokenStore(SQLiteTokenBackend(TOKEN_STORE_SQLITE_PATH))
+    return TokenStore(MongoTokenBackend(db))
+
+
+class TokenRefresher(PeriodicTask):
+    """Renews access tokens before they expire, one refresh per device at a time.
+
+    `refresh(device_id)` is single-flight across processes: concurrent
+    callers in this worker wait on a lock, and a claim on the stored token
+    keeps other workers from redeeming the same (rotating) refresh token
+    meanwhile; they wait for its result instead. The periodic run, held to
+    one worker by a SchedulerLease, renews every token expiring within the
+    margin, so request handlers normally find a valid token.
+    """
+
+    def __init__(self, store: TokenStore, refresh_token: Callable[[str], bool],
+                 margin_seconds: int = TOKEN_REFRESH_MARGIN_SECONDS,
+                 interval_seconds: int = TOKEN_REFRESH_INTERVAL_SECONDS,
+                 max_workers: int = TOKEN_REFRESH_MAX_WORKERS,
+                 claim_seconds: int = TOKEN_REFRESH_CLAIM_SECONDS,
+                 lease: Optional[SchedulerLease] = None):
+        super().__init__('token-refresh', interval_seconds, lease=lease)
+        self.store = store
+        self.refresh_token = refresh_token
+        self.margin_seconds = margin_seconds
+        self.claim_seconds = claim_seconds
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._in_flight: Set[str] = set()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='token-refresh')
+
+    def _lock_for(self, device_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(device_id, threading.Lock())
+
+    def expires_soon(self, token_data: Dict[str, Any], margin_seconds: Optional[int] = None) -> bool:
+        expires_at = token_data.get('expires_at')
+        if not expires_at:
+            return False
+        margin = self.margin_seconds if margin_seconds is None else margin_seconds
+        return expires_at <= datetime.now(timezone.utc) + timedelta(seconds=margin)
+
+    def refresh(self, device_id: str) -> bool:
+        """Refresh a device's token unless another caller just did; True if a usable token is stored"""
+        with self._lock_for(device_id):
+            token_data = self.store.get(device_id, fresh=True)
+            if not token_data:
+                return False
+            if not self.expires_soon(token_data):
+                # Renewed while we were waiting for the lock
+                return True
+            if not self.store.claim_refresh(device_id, self.claim_seconds):
+                return self._await_other(device_id)
+            try:
+                return self.refresh_token(device_id)
+            finally:
+                self.store.release_refresh(device_id)
+
+    def _await_other(self, device_id: str) -> bool:
+        """Another process is redeeming the refresh token; wait for the token it stores"""
+        deadline = time.monotonic() + self.claim_seconds
+        token_data = None
+        while time.monotonic() < deadline:
+            time.sleep(0.5)
+            token_data = self.store.get(device_id, fresh=True)
+            if not token_data:
+                return False
+            if not self.expires_soon(token_data):
+                return True
+        logger.warning(f"Token refresh for device {device_id} held by another worker did not finish")
+        # Still usable if it hasn't actually expired yet
+        return bool(token_data) and not self.expires_soon(token_data, margin_seconds=0)
+
+    def refresh_in_background(self, device_id: str):
+        """Queue a refresh without waiting for it; no-op if one is already queued"""
+        with self._guard:
+            if device_id in self._in_flight:
+                return
+            self._in_flight.add(device_id)
+        self._pool.submit(self._refresh_queued, device_id)
+
+    def _refresh_queued(self, device_id: str):
+        try:
+            if not self.refresh(device_id):
+                logger.warning(f"Background token refresh failed for device {device_id}")
+        except Exception as e:
+            logger.error(f"Background token refresh failed for device {device_id}: {str(e)}")
+        finally:
+            with self._guard:
+                self._in_flight.discard(device_id)
+
+    def run_once(self):
+        due = [
+            device_id for device_id, token_data in self.store.items()
+            if token_data.get('refresh_token') and self.expires_soon(token_data)
+        ]
+        for device_id in due:
+            self.refresh_in_background(device_id)
+        if due:
+            logger.info(f"Token refresh: renewing {len(due)} tokens expiring within {self.margin_seconds}s")
@@ -0,0 +1,159 @@
+import os
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from cachetools import TTLCache
+
+from Services.scheduler import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '4096'))
+# Upper bound on staleness for changes made outside update_user (e.g. by hand in the database)
+USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', '300'))
+# How often each worker drops summaries of users changed through update_user by any worker
+USER_CACHE_SYNC_ENABLED = os.getenv('USER_CACHE_SYNC_ENABLED', 'true').lower() == 'true'
+USER_CACHE_SYNC_SECONDS = int(os.getenv('USER_CACHE_SYNC_SECONDS', '5'))
+
+# Fields of db.users kept in memory; never the password hash
+SUMMARY_FIELDS = {'name': 1, 'email': 1, 'is_active': 1}
+
+
+def token_key(token: str) -> str:
+    """Cache key for a JWT, so raw tokens are not kept as dict keys"""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def object_id(user_id: Any) -> Optional[ObjectId]:
+    """ObjectId for a user id string, or None if it isn't one"""
+    if isinstance(user_id, ObjectId):
+        return user_id
+    try:
+        return ObjectId(user_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+class UserCache:
+    """Verified JWT payloads and user summaries for /api/verify-token.
+
+    Payloads are keyed by token hash and summaries by user id, both in
+    per-process TTL/LRU caches, so a repeat verification does no JWT decode
+    and no database work. Every write to a user goes through `update_user`,
+    which drops the summary here and stamps `updated_at`; UserCacheSync
+    picks that up in the other workers. Writes made behind its back are
+    only seen once the TTL expires.
+    """
+
+    def __init__(self, db, maxsize: int = USER_CACHE_SIZE, ttl_seconds: int = USER_CACHE_TTL_SECONDS):
+        self.collection = db.users
+        self._tokens = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._users = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._stats = {'token_hits': 0, 'token_misses': 0, 'user_hits': 0, 'user_misses': 0}
+
+    def verify_token(self, token: str, decode: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Decoded payload of a valid token, decoding with `decode` only on a cache miss"""
+        key = token_key(token)
+        with self._lock:
+            payload = self._tokens.get(key)
+            if payload is not None:
+                # The cache TTL may outlive the token itself
+                if payload.get('exp', 0) > datetime.now(timezone.utc).timestamp():
+                    self._stats['token_hits'] += 1
+                    return dict(payload)
+                self._tokens.pop(key, None)
+            self._stats['token_misses'] += 1
+
+        payload = decode(token)
+        if payload:
+            with self._lock:
+                self._tokens[key] = dict(payload)
+        return payload
+
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """{'id', 'name', 'email', 'is_active'} for a user, or None if unknown"""
+        with self._lock:
+            summary = self._users.get(user_id)
+            if summary is not None:
+                self._stats['user_hits'] += 1
+                return dict(summary)
+            self._stats['user_misses'] += 1
+
+        oid = object_id(user_id)
+        if oid is None:
+            return None
+        user = self.collection.find_one({'_id': oid}, SUMMARY_FIELDS)
+        if not user:
+            return None
+        summary = {
+            'id': str(user['_id']),
+            'name': user.get('name'),
+            'email': user.get('email'),
+            'is_active': user.get('is_active', True),
+        }
+        with self._lock:
+            self._users[summary['id']] = summary
+        return dict(summary)
+
+    def update_user(self, user_id: str, fields: Dict[str, Any]) -> bool:
+        """$set fields on a user (profile edits, is_active) and drop its cached summary"""
+        oid = object_id(user_id)
+        if oid is None:
+            return False
+        result = self.collection.update_one(
+            {'_id': oid},
+            {'$set': {**fields, 'updated_at': datetime.now(timezone.utc)}}
+        )
+        self.invalidate_user(user_id)
+        return result.matched_count > 0
+
+    def deactivate_user(self, user_id: str, active: bool = False) -> bool:
+        """Block (or with active=True, unblock) a user; /api/verify-token rejects them from then on"""
+        return self.update_user(user_id, {'is_active': active})
+
+    def invalidate_user(self, user_id: str):
+        with self._lock:
+            self._users.pop(str(user_id), None)
+
+    def invalidate_changed(self, since: datetime) -> int:
+        """Drop cached summaries of users updated at or after `since`; returns how many were cached"""
+        changed = [str(doc['_id']) for doc in self.collection.find({'updated_at': {'$gte': since}}, {'_id': 1})]
+        with self._lock:
+            return sum(self._users.pop(user_id, None) is not None for user_id in changed)
+
+    def invalidate_token(self, token: str):
+        with self._lock:
+            self._tokens.pop(token_key(token), None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, 'tokens': len(self._tokens), 'users': len(self._users)}
+
+
+class UserCacheSync(PeriodicTask):
+    """Keeps this worker's user summaries in line with writes made by other workers.
+
+    update_user only clears the cache of the worker that ran it. Every
+    interval this task looks up users whose `updated_at` moved since its
+    last look and drops their summaries, so a deactivation is enforced
+    everywhere within seconds rather than after USER_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self, cache: UserCache, interval_seconds: int = USER_CACHE_SYNC_SECONDS):
+        super().__init__('user-cache-sync', interval_seconds)
+        self.cache = cache
+        self._since = datetime.now(timezone.utc)
+
+    def run_once(self):
+        now = datetime.now(timezone.utc)
+        # Look back one extra interval: the writer's clock and the database commit may lag ours
+        dropped = self.cache.invalidate_changed(self._since - timedelta(seconds=self.interval_seconds))
+        self._since = now
+        if dropped:
+            logger.info(f"User cache sync: dropped {dropped} changed users")
@@ -0,0 +1,152 @@
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+
+from Services.score_repository import create_score_repository
+
+logger = logging.getLogger(__name__)
+
+# Score documents per trend window, and the change in average that counts as a trend
+TREND_WINDOW = 7
+TREND_THRESHOLD = 0.5
+# Latest daily scores kept on the stats document: this week and the one before
+RING_SIZE = 2 * TREND_WINDOW
+
+
+def _mean(values: List[Optional[float]]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return sum(values) / len(values) if values else None
+
+
+class UserStatsStore:
+    """One materialised `user_stats` document per user.
+
+    Holds the number of score documents, the running sum and count of
+    overallScores, and a ring of the latest RING_SIZE daily scores (newest
+    first) from which the recent averages and trend are read. ScoreStore
+    keeps it current on every score write; `rebuild` recomputes it from
+    the score repository when it is missing or has drifted. Reads never
+    write: a user without a document is computed on the fly until their
+    next score write or the rebuild-user-stats command stores one.
+    """
+
+    def __init__(self, db, scores=None):
+        self.collection = db.user_stats
+        # Score repository the stats are computed from (daily or monthly layout)
+        self.scores = scores or create_score_repository(db)
+
+    def get(self, user_id: ObjectId, session=None) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({'_id': user_id}, session=session)
+
+    def compute(self, user_id: ObjectId, session=None) -> Dict[str, Any]:
+        """A user's stats computed from their stored score days, without storing them"""
+        pipeline = self.scores.day_stages(user_id) + [
+            {'$sort': {'date': -1}},
+            {'$project': {'_id': 0, 'date': 1, 'overallScore': 1}},
+            {'$facet': {
+                'lifetime': [{'$group': {
+                    '_id': None,
+                    'count': {'$sum': 1},
+                    'scored': {'$sum': {'$cond': [{'$isNumber': '$overallScore'}, 1, 0]}},
+                    'sum': {'$sum': '$overallScore'},
+                }}],
+                'recent': [{'$limit': RING_SIZE}],
+            }},
+        ]
+        facets = next(self.scores.collection.aggregate(pipeline, session=session), {})
+        lifetime = (facets.get('lifetime') or [{}])[0]
+        return {
+            '_id': user_id,
+            'count': lifetime.get('count', 0),
+            'scored': lifetime.get('scored', 0),
+            'sum': lifetime.get('sum', 0),
+            'recent': [{'date': s['date'], 'score': s.get('overallScore')} for s in facets.get('recent', [])],
+        }
+
+    def rebuild(self, user_id: ObjectId, session=None) -> Dict[str, Any]:
+        """Recompute a user's stats from their stored score days and store them"""
+        previous = self.get(user_id, session=session)
+        doc = {
+            **self.compute(user_id, session=session),
+            'version': (previous or {}).get('version', 0) + 1,
+            'updatedAt': datetime.now(timezone.utc),
+        }
+        self.collection.replace_one({'_id': user_id}, doc, upsert=True, session=session)
+        return doc
+
+    def record(self, user_id: ObjectId, day: str, score: Optional[float], session=None) -> Dict[str, Any]:
+        """Fold one day's new overallScore into the stats.
+
+        Whether the day is new is read from the ring, not taken from the
+        writer, so replaying a write (the DuplicateKeyError retry) can't
+        count a day twice. The ring holds every day newer than its oldest
+        entry; a day older than a full ring, or a concurrent change to the
+        stats document, falls back to a rebuild from the repository.
+        """
+        stats = self.get(user_id, session=session)
+        if stats is None:
+            # First write since stats existed; the repository already holds this one
+            return self.rebuild(user_id, session=session)
+
+        ring = stats.get('recent', [])
+        entry = next((e for e in ring if e['date'] == day), None)
+        if entry is None and len(ring) >= RING_SIZE and day < ring[-1]['date']:
+            logger.info(f"Stats for {user_id}: {day} is outside the recent ring, rebuilding")
+            return self.rebuild(user_id, session=session)
+
+        old = entry['score'] if entry else None
+        ring = [e for e in ring if e['date'] != day] + [{'date': day, 'score': score}]
+        ring.sort(key=lambda e: e['date'], reverse=True)
+        doc = {
+            **stats,
+            'count': stats.get('count', 0) + (1 if entry is None else 0),
+            'scored': stats.get('scored', 0) + (score is not None) - (old is not None),
+            'sum': stats.get('sum', 0) + (score or 0) - (old or 0),
+            'recent': ring[:RING_SIZE],
+            'version': stats.get('version', 0) + 1,
+            'updatedAt': datetime.now(timezone.utc),
+        }
+        result = self.collection.replace_one({'_id': user_id, 'version': stats.get('version', 0)}, doc, session=session)
+        if result.matched_count == 0:
+            # Another writer got in first (only possible without transactions)
+            return self.rebuild(user_id, session=session)
+        return doc
+
+    def summary(self, user_id: ObjectId) -> Dict[str, Any]:
+        """Count and averages for a user from the stats document (one point read)"""
+        stats = self.get(user_id) or self.compute(user_id)
+        ring = stats.get('recent', [])
+        recent = [e['score'] for e in ring[:TREND_WINDOW]]
+        previous = [e['score'] for e in ring[TREND_WINDOW:RING_SIZE]]
+        return {
+            'count': stats.get('count', 0),
+            'avg': stats['sum'] / stats['scored'] if stats.get('scored') else None,
+            'recent_count': len(recent),
+            'recent_avg': _mean(recent),
+            'previous_count': len(previous),
+            'previous_avg': _mean(previous),
+        }
+
+    def rebuild_all(self) -> int:
+        """Rebuild stats for every user with scores; returns how many were rebuilt"""
+        rebuilt = 0
+        for user_id in self.scores.collection.distinct('userId'):
+            self.rebuild(user_id)
+            rebuilt += 1
+        return rebuilt
+
+
+def score_trend(summary: Dict[str, Any]) -> str:
+    """'improving'/'declining' when the latest week's average moves half a point from the week before"""
+    if summary['count'] < 2 * TREND_WINDOW:  # Need at least 2 weeks of data
+        return "stable"
+    recent, previous = summary['recent_avg'], summary['previous_avg']
+    if recent is None or previous is None:
+        return "stable"
+    if recent > previous + TREND_THRESHOLD:
+        return "improving"
+    if recent < previous - TREND_THRESHOLD:
+        return "declining"
+    return "stable"
@@ -0,0 +1,507 @@
+import os
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from itertools import takewhile
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from cachetools import TTLCache
+
+from Services.graph_client import graph_client, GraphFetchError, GRAPH_PAGE_SIZE
+from Services.graph_async import graph_async
+from Services.timezones import day_boundaries, local_date, local_day_range, timezone_name
+
+logger = logging.getLogger(__name__)
+
+# How long a fetched calendar/mail snapshot may be shared between routes
+SNAPSHOT_TTL_SECONDS = int(os.getenv('WORK_STRESS_SNAPSHOT_TTL', '60'))
+# Snapshots held at once (device x period x timezone); the least recently used go first
+SNAPSHOT_CACHE_SIZE = int(os.getenv('WORK_STRESS_SNAPSHOT_CACHE_SIZE', '1024'))
+
+# Supported /graph/work-stress periods and the number of days each covers
+PERIOD_DAYS = {'week': 7, 'month': 30, 'quarter': 90}
+
+# Scoring thresholds (times are seconds since local midnight)
+BACK_TO_BACK_GAP_SECONDS = 15 * 60
+EARLY_MEETING_BEFORE = 9 * 3600
+AFTER_HOURS_BEFORE = 7 * 3600
+AFTER_HOURS_AFTER = 19 * 3600
+# Free gaps between meetings are bucketed as < 30 min, 30-60 min and >= 60 min
+SHORT_GAP_SECONDS = 30 * 60
+FOCUS_GAP_SECONDS = 60 * 60
+
+
+def clamp(v, lo, hi):
+    return max(lo, min(hi, v))
+
+
+def parse_graph_datetime(value: str) -> datetime:
+    """Parse a Graph ISO timestamp into an aware datetime"""
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        # calendarView returns naive UTC timestamps unless a Prefer header is sent
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def stress_window(days: int = 7, now: Optional[datetime] = None, tz_name: Optional[str] = None) -> Tuple[datetime, datetime]:
+    """Return (start, end) in UTC of the last `days` local days ending today"""
+    _, edges = local_day_range(tz_name, days, now)
+    return datetime.fromtimestamp(edges[0], timezone.utc), datetime.fromtimestamp(edges[-1] - 1, timezone.utc)
+
+
+# ---------------- Graph fetch ----------------
+
+# Received mail, newest first; sent with a $filter on the window, or without one as a fallback
+MAIL_PARAMS = {
+    '$select': 'subject,receivedDateTime',
+    '$orderby': 'receivedDateTime desc',
+    '$top': str(GRAPH_PAGE_SIZE),
+}
+
+
+async def _consume_pages(pages: AsyncIterator[dict], parse: Callable[[Iterable[dict]], Iterable[Any]],
+                         into: List[Any], take_while: Optional[Callable[[dict], bool]] = None):
+    """Parse each page as it arrives into `into`; with `take_while`, stop at the first item it rejects.
+
+    Only the parsed values are kept; a page's raw dicts are dropped before
+    the next page is fetched.
+    """
+    async for page in pages:
+        items = page.get('value', [])
+        kept = items if take_while is None else list(takewhile(take_while, items))
+        into.extend(parse(kept))
+        if len(kept) < len(items):
+            return
+
+
+def fetch_calendar_and_mail(access_token: str, start_dt: datetime,
+                            end_dt: datetime) -> Tuple[List[Tuple[datetime, datetime]], List[datetime]]:
+    """Fetch (start, end) of calendar events and receive times of mail for the window.
+
+    The first page of each query arrives in one $batch round trip (the
+    unfiltered mail fallback is only requested if the filtered one fails); the
+    @odata.nextLink chains of calendar and mail are then followed
+    concurrently, so the wait is the longer chain rather than both. Each
+    page is parsed as it arrives, so at most one raw page per chain is held.
+    """
+    sub_requests = [
+        {
+            'id': 'calendar',
+            'url': '/me/calendarView',
+            'params': {
+                'startDateTime': start_dt.isoformat(),
+                'endDateTime': end_dt.isoformat(),
+                '$select': 'subject,start,end,location,organizer',
+                '$top': str(GRAPH_PAGE_SIZE),
+            },
+        },
+        {
+            'id': 'mail',
+            'url': '/me/messages',
+            'params': {**MAIL_PARAMS, '$filter': f"receivedDateTime ge {start_dt.isoformat()}"},
+        },
+    ]
+    results = graph_client.batch(access_token, sub_requests)
+
+    cal = results.get('calendar', {})
+    if cal.get('status') != 200:
+        logger.error(f"Graph calendarView error: {cal.get('status')} - {cal.get('body')}")
+        raise GraphFetchError("Failed to fetch calendar events", cal.get('status') or 502)
+    event_times: List[Tuple[datetime, datetime]] = []
+    email_times: List[datetime] = []
+    cal_chain = _consume_pages(
+        graph_async.aiter_pages('/me/calendarView', access_token, first_page=cal.get('body') or {}),
+        iter_event_times, event_times
+    )
+
+    mail = results.get('mail', {})
+    if mail.get('status') == 200:
+        mail_chain = _consume_pages(
+            graph_async.aiter_pages('/me/messages', access_token, first_page=mail.get('body') or {}),
+            iter_email_times, email_times
+        )
+        graph_async.gather(cal_chain, mail_chain)
+        return event_times, email_times
+    logger.error(f"Graph messages error (filtered): {mail.get('status')} - {mail.get('body')}")
+
+    # Unfiltered fallback for mailboxes that reject the $filter/$orderby combination, only
+    # sent once the filtered query has failed. Newest first, so paging stops once messages
+    # fall before the window; a failing fallback just yields no mail.
+    window_start = start_dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    mail_chain = _consume_pages(
+        graph_async.aiter_pages('/me/messages', access_token, params=MAIL_PARAMS),
+        iter_email_times, email_times,
+        take_while=lambda m: m.get('receivedDateTime', '') >= window_start
+    )
+    graph_async.gather(cal_chain, mail_chain)
+    return event_times, email_times
+
+
+# ---------------- Snapshot ----------------
+
+def build_snapshot_from_times(event_times: Iterable[Tuple[datetime, datetime]], email_times: Iterable[datetime],
+                              start_dt: datetime, days: int = 7, tz_name: Optional[str] = None) -> Dict[str, Any]:
+    """Convert parsed event intervals and email timestamps into columnar epoch arrays.
+
+    Timestamps are converted once; scoring then works on whole arrays
+    instead of per-day lists of datetimes. Days are the user's local
+    calendar days, given as UTC epoch boundaries.
+    """
+    first_day = local_date(tz_name, start_dt)
+    starts, ends = [], []
+    for sd, ed in event_times:
+        starts.append(sd.timestamp())
+        ends.append(ed.timestamp())
+    email_ts = np.fromiter((rd.timestamp() for rd in email_times), dtype=np.float64)
+
+    return {
+        'start': start_dt,
+        'timezone': timezone_name(tz_name),
+        'day_keys': [(first_day + timedelta(days=i)).isoformat() for i in range(days)],
+        'boundaries': day_boundaries(tz_name, first_day, days),
+        'event_start': np.asarray(starts, dtype=np.float64),
+        'event_end': np.asarray(ends, dtype=np.float64),
+        'email_ts': email_ts,
+        'fetched_at': datetime.now(timezone.utc),
+    }
+
+
+def iter_event_times(cal_data: Iterable[dict]) -> Iterable[Tuple[datetime, datetime]]:
+    """Parse (start, end) from Graph events, skipping malformed ones"""
+    for ev in cal_data:
+        try:
+            s = ev.get('start', {}).get('dateTime')
+            e = ev.get('end', {}).get('dateTime')
+            if not s or not e:
+                continue
+            yield parse_graph_datetime(s), parse_graph_datetime(e)
+        except Exception:
+            continue
+
+
+def iter_email_times(mail_data: Iterable[dict]) -> Iterable[datetime]:
+    """Parse receivedDateTime from Graph messages, skipping malformed ones"""
+    for m in mail_data:
+        try:
+            r = m.get('receivedDateTime')
+            if not r:
+                continue
+            yield parse_graph_datetime(r)
+        except Exception:
+            continue
+
+
+def build_snapshot(cal_data: Iterable[dict], mail_data: Iterable[dict], start_dt: datetime, days: int = 7,
+                   tz_name: Optional[str] = None) -> Dict[str, Any]:
+    """Parse Graph items once and bucket them by day.
+
+    Items are consumed incrementally (pages can be streamed in) and only
+    parsed timestamps are kept, not the raw event/message dicts.
+    """
+    return build_snapshot_from_times(iter_event_times(cal_data), iter_email_times(mail_data), start_dt, days, tz_name)
+
+
+def fetch_snapshot(access_token: str, days: int = 7, tz_name: Optional[str] = None) -> Dict[str, Any]:
+    """Fetch Graph data for the last `days` days and build a snapshot"""
+    start_dt, end_dt = stress_window(days, tz_name=tz_name)
+    event_times, email_times = fetch_calendar_and_mail(access_token, start_dt, end_dt)
+    snapshot = build_snapshot_from_times(event_times, email_times, start_dt, days, tz_name)
+    logger.info(f"Built stress snapshot: {len(snapshot['event_start'])} events, {len(snapshot['email_ts'])} emails")
+    return snapshot
+
+
+def load_snapshot(sync, device_id: str, access_token: str, days: int = 7, tz_name: Optional[str] = None) -> Dict[str, Any]:
+    """Pull Graph changes into the local copy and build a snapshot from it"""
+    start_dt, end_dt = stress_window(days, tz_name=tz_name)
+    sync.sync(device_id, access_token)
+    return build_snapshot_from_times(
+        sync.event_times(device_id, start_dt, end_dt),
+        sync.message_times(device_id, start_dt, end_dt),
+        start_dt,
+        days,
+        tz_name
+    )
+
+
+class SnapshotCache:
+    """Short-lived per-device snapshot cache with single-flight fetching.
+
+    When the dashboard opens, /graph/work-stress and /dashboard/scores arrive
+    together; the second caller waits for the first fetch instead of
+    repeating it. Entries live in a bounded TTL/LRU cache and a key's lock
+    only exists while its fetch is in flight, so neither grows with the
+    number of devices ever seen.
+    """
+
+    def __init__(self, ttl_seconds: int = SNAPSHOT_TTL_SECONDS, maxsize: int = SNAPSHOT_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._guard:
+            return self._entries.get(key)
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        snapshot = self._get(key)
+        if snapshot is not None:
+            return snapshot
+        lock = self._lock_for(key)
+        with lock:
+            snapshot = self._get(key)
+            if snapshot is not None:
+                return snapshot
+            try:
+                snapshot = fetch()
+                with self._guard:
+                    self._entries[key] = snapshot
+                return snapshot
+            finally:
+                # Callers already waiting on this lock find the entry; later ones never need it
+                with self._guard:
+                    if self._locks.get(key) is lock:
+                        del self._locks[key]
+
+    def invalidate(self, key: str):
+        with self._guard:
+            self._entries.pop(key, None)
+
+
+snapshot_cache = SnapshotCache()
+
+
+# ---------------- Scoring ----------------
+
+def sweep_intervals(day: np.ndarray, start: np.ndarray, end: np.ndarray, days: int) -> Dict[str, np.ndarray]:
+    """Merge overlapping intervals per day with a sweep line, in O(n log n).
+
+    Every interval becomes a +1 point at its start and a -1 point at its end,
+    both keyed to the interval's day. Sorting the points by (day, time) with
+    ends before starts at equal times, the running sum is the number of
+    meetings in progress. Spans where it is positive are busy time and spans
+    where it drops to zero between two meetings are free gaps.
+    """
+    n = len(start)
+    end = np.maximum(start, end)
+    pt_day = np.concatenate([day, day])
+    pt_time = np.concatenate([start, end])
+    pt_delta = np.concatenate([np.ones(n, dtype=np.int64), -np.ones(n, dtype=np.int64)])
+
+    # lexsort keys are given last-primary: day, then time, then -1 before +1
+    order = np.lexsort((pt_delta, pt_time, pt_day))
+    pt_day, pt_time = pt_day[order], pt_time[order]
+    level = np.cumsum(pt_delta[order])
+
+    max_concurrent = np.zeros(days, dtype=np.int64)
+    np.maximum.at(max_concurrent, pt_day, level)
+
+    # Spans between consecutive points; each day's points sum to zero, so the level is 0 at day boundaries
+    span = pt_time[1:] - pt_time[:-1]
+    span_day = pt_day[:-1]
+    same_day = pt_day[1:] == span_day
+    busy = same_day & (level[:-1] > 0)
+    gap = same_day & (level[:-1] == 0) & (span > 0)
+
+    gap_len, gap_day = span[gap], span_day[gap]
+    longest_gap = np.zeros(days, dtype=np.float64)
+    np.maximum.at(longest_gap, gap_day, gap_len)
+
+    return {
+        'busy_hours': np.bincount(span_day[busy], weights=span[busy], minlength=days) / 3600.0,
+        'max_concurrent_meetings': max_concurrent,
+        'free_gaps_under_30m': np.bincount(gap_day[gap_len < SHORT_GAP_SECONDS], minlength=days),
+        'free_gaps_30_60m': np.bincount(
+            gap_day[(gap_len >= SHORT_GAP_SECONDS) & (gap_len < FOCUS_GAP_SECONDS)], minlength=days),
+        'free_gaps_over_60m': np.bincount(gap_day[gap_len >= FOCUS_GAP_SECONDS], minlength=days),
+        'longest_free_gap_hours': longest_gap / 3600.0,
+    }
+
+
+def compute_daily_metrics(snapshot: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Per-day stress metrics for every day of the snapshot at once.
+
+    Timestamps are assigned to local days by binary search over the day
+    boundaries. Returns one array per metric, indexed by day.
+    """
+    days = len(snapshot['day_keys'])
+    edges = snapshot['boundaries']
+
+    ev_start = snapshot['event_start']
+    ev_end = snapshot['event_end']
+    ev_day = np.searchsorted(edges, ev_start, side='right') - 1
+    in_window = (ev_day >= 0) & (ev_day < days)
+    ev_start, ev_end, ev_day = ev_start[in_window], ev_end[in_window], ev_day[in_window]
+
+    # Order by start; day index is monotonic in start, so this also groups by day
+    order = np.argsort(ev_start, kind='stable')
+    ev_start, ev_end, ev_day = ev_start[order], ev_end[order], ev_day[order]
+
+    durations = np.maximum(0.0, ev_end - ev_start) / 3600.0
+    meeting_hours = np.bincount(ev_day, weights=durations, minlength=days)
+    meeting_count = np.bincount(ev_day, minlength=days)
+
+    # A meeting is back-to-back when it starts within 15 min of the previous one ending that day
+    same_day = ev_day[1:] == ev_day[:-1]
+    tight = (ev_start[1:] - ev_end[:-1]) <= BACK_TO_BACK_GAP_SECONDS
+    back_to_back = np.bincount(ev_day[1:][same_day & tight], minlength=days)
+
+    ev_time_of_day = ev_start - edges[ev_day]
+    early_morning = np.bincount(ev_day[ev_time_of_day < EARLY_MEETING_BEFORE], minlength=days)
+
+    email_ts = snapshot['email_ts']
+    mail_day = np.searchsorted(edges, email_ts, side='right') - 1
+    mail_in_window = (mail_day >= 0) & (mail_day < days)
+    email_ts, mail_day = email_ts[mail_in_window], mail_day[mail_in_window]
+    mail_time_of_day = email_ts - edges[mail_day]
+    after_hours = (mail_time_of_day < AFTER_HOURS_BEFORE) | (mail_time_of_day > AFTER_HOURS_AFTER)
+
+    return {
+        'meeting_hours': meeting_hours,
+        **sweep_intervals(ev_day, ev_start, ev_end, days),
+        'meeting_count': meeting_count,
+        'back_to_back_meetings': back_to_back,
+        'early_morning_meetings': early_morning,
+        'email_count': np.bincount(mail_day, minlength=days),
+        'after_hours_emails': np.bincount(mail_day[after_hours], minlength=days),
+    }
+
+
+def score_arrays(busy_hours, back_to_back, after_hours_emails, early_morning):
+    """Map stress metrics onto the 1-10 work stress scale (scalars or arrays)"""
+    score = (
+        # Meeting load: map 0-6h of merged busy time → 0-5 points, so overlaps don't count twice
+        np.clip(busy_hours / 6.0 * 5.0, 0.0, 5.0)
+        # Back-to-back: each contributes 0.5, capped at 2
+        + np.clip(back_to_back * 0.5, 0.0, 2.0)
+        # After-hours emails: up to 2 points
+        + np.clip(after_hours_emails * 0.3, 0.0, 2.0)
+        # Early meetings: up to 1 point
+        + np.clip(early_morning * 0.3, 0.0, 1.0)
+    )
+    return np.clip(score, 1.0, 10.0)
+
+
+def score_metrics(metrics: Dict[str, Any]) -> float:
+    """Map a dict of stress metrics onto the 1-10 work stress scale"""
+    return float(score_arrays(
+        metrics['busy_hours'],
+        metrics['back_to_back_meetings'],
+        metrics['after_hours_emails'],
+        metrics['early_morning_meetings']
+    ))
+
+
+METRIC_FIELDS = (
+    'meeting_hours',
+    'busy_hours',
+    'max_concurrent_meetings',
+    'free_gaps_under_30m',
+    'free_gaps_30_60m',
+    'free_gaps_over_60m',
+    'longest_free_gap_hours',
+    'meeting_count',
+    'back_to_back_meetings',
+    'early_morning_meetings',
+    'email_count',
+    'after_hours_emails',
+)
+
+# Aggregated with max() across days instead of summed
+PEAK_FIELDS = {'max_concurrent_meetings', 'longest_free_gap_hours'}
+
+
+def _day_value(day: Dict[str, Any], field: str):
+    if field == 'busy_hours' and field not in day:
+        # Days stored before busy time was tracked only have summed meeting hours
+        return day.get('meeting_hours', 0)
+    return day.get(field, 0)
+
+
+def aggregate_days(days: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum per-day metrics and score the totals"""
+    totals = {}
+    for k in METRIC_FIELDS:
+        values = [_day_value(d, k) for d in days]
+        totals[k] = max(values, default=0) if k in PEAK_FIELDS else sum(values)
+    scores = [d['score'] for d in days]
+    return {
+        **totals,
+        'score': score_metrics(totals),
+        'average': round(sum(scores) / len(scores), 1) if scores else 0,
+    }
+
+
+def weekly_rollups(days: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group per-day stress into 7-day buckets aligned to the most recent day.
+
+    The oldest bucket may be shorter (e.g. 30 days → 2 + 4×7).
+    """
+    weeks = []
+    end = len(days)
+    while end > 0:
+        chunk = days[max(0, end - 7):end]
+        agg = aggregate_days(chunk)
+        start_dt = datetime.fromisoformat(chunk[0]['date'])
+        weeks.append({
+            'start': chunk[0]['date'],
+            'end': chunk[-1]['date'],
+            'label': start_dt.strftime('%b %d'),
+            **{k: agg[k] for k in METRIC_FIELDS},
+            'score': agg['average'],
+        })
+        end -= 7
+    weeks.reverse()
+    return weeks
+
+
+def compute_work_stress(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-day and aggregate work stress metrics for a snapshot"""
+    metrics = compute_daily_metrics(snapshot)
+    scores = np.round(score_arrays(
+        metrics['busy_hours'],
+        metrics['back_to_back_meetings'],
+        metrics['after_hours_emails'],
+        metrics['early_morning_meetings']
+    ), 1)
+
+    # Back to plain Python types so the result is JSON/BSON serialisable
+    columns = {k: metrics[k].tolist() for k in METRIC_FIELDS}
+    score_list = scores.tolist()
+    days = []
+    for i, day_key in enumerate(snapshot['day_keys']):
+        days.append({
+            'date': day_key,
+            'label': datetime.fromisoformat(day_key).strftime('%a'),
+            **{k: columns[k][i] for k in METRIC_FIELDS},
+            'score': score_list[i],
+        })
+
+    return {
+        'days': days,
+        'aggregate': aggregate_days(days),
+        'fetched_at': snapshot['fetched_at'],
+    }
+
+
+def get_work_stress(device_id: str, access_token: str, days: int = 7, sync=None,
+                    tz_name: Optional[str] = None) -> Dict[str, Any]:
+    """Work stress for a device, sharing the snapshot across routes.
+
+    With a GraphSync the snapshot is read from the delta-synced local copy;
+    without one it is fetched from Graph directly. Days are bucketed in
+    `tz_name` (UTC when not given).
+    """
+    tz_name = timezone_name(tz_name)
+    if sync is not None:
+        fetch = lambda: load_snapshot(sync, device_id, access_token, days, tz_name)
+    else:
+        fetch = lambda: fetch_snapshot(access_token, days, tz_name)
+    snapshot = snapshot_cache.get_or_fetch(f'{device_id}:{days}:{tz_name}', fetch)
+    return compute_work_stress(snapshot)
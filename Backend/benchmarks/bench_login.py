@@ -0,0 +1,96 @@
+"""Benchmark concurrent password verification inline vs on the bounded bcrypt pool.
+
+Usage (from Backend/):
+    python benchmarks/bench_login.py [--logins 64] [--concurrency 32] [--rounds 12] [--workers 4]
+
+"Inline" calls bcrypt on each request thread, as AuthService did before the
+pool; "pool" goes through PasswordHasher, which admits workers + queue_limit
+calls and rejects the rest with HasherBusyError (a 503 on /api/login).
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Services.password_hasher import HasherBusyError, PasswordHasher  # noqa: E402
+
+PASSWORD = 'Benchmark1!'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run_logins(verify, logins, concurrency):
+    """Fire `logins` verify calls from `concurrency` request threads"""
+    latencies, rejected = [], 0
+
+    def one():
+        started = time.perf_counter()
+        try:
+            verify()
+        except HasherBusyError:
+            return None
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as requests:
+        for ms in requests.map(lambda _: one(), range(logins)):
+            if ms is None:
+                rejected += 1
+            else:
+                latencies.append(ms)
+    wall = time.perf_counter() - started
+    return wall, latencies, rejected
+
+
+def report(label, logins, wall, latencies, rejected):
+    served = len(latencies)
+    print(f"  {label:<8} {served / wall:7.1f} logins/s  p50 {percentile(latencies, 50):7.1f} ms  "
+          f"p95 {percentile(latencies, 95):7.1f} ms  rejected {rejected}/{logins}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--queue-limit', type=int, default=None)
+    parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+    args = parser.parse_args()
+
+    queue_limit = args.queue_limit if args.queue_limit is not None else 4 * args.workers
+    hashed = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=args.rounds))
+
+    print("cost factor (single hash):")
+    for rounds in (10, 11, 12, 13):
+        started = time.perf_counter()
+        bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=rounds))
+        print(f"  rounds={rounds}  {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+    print(f"\n{args.logins} logins from {args.concurrency} threads, rounds={args.rounds}, "
+          f"{args.pool} pool of {args.workers} (+{queue_limit} queued)")
+
+    def inline():
+        bcrypt.checkpw(PASSWORD.encode('utf-8'), hashed)
+
+    report('inline', args.logins, *run_logins(inline, args.logins, args.concurrency))
+
+    hasher = PasswordHasher(rounds=args.rounds, workers=args.workers, queue_limit=queue_limit, pool=args.pool)
+    hasher.verify(PASSWORD, hashed.decode('utf-8'))  # start the workers outside the timing
+    report('pool', args.logins, *run_logins(lambda: hasher.verify(PASSWORD, hashed.decode('utf-8')),
+                                            args.logins, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Benchmark the daily and monthly (bucket pattern) user_scores layouts.
+
+Usage (from Backend/):
+    python benchmarks/bench_score_layouts.py [--mongo-uri mongodb://localhost:27017] [--users 200] [--days 365]
+
+Seeds a scratch database (dropped afterwards) with the same score history
+in both layouts, then reports storage and index size, update throughput
+(existing days, as /api/update-user-score mostly sees them), and read
+throughput for 7- and 90-day ranges and the user_stats rebuild aggregation.
+"""
+import os
+import sys
+import random
+import argparse
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Services.indexes import APP_INDEXES  # noqa: E402
+from Services.score_repository import DailyScoreRepository, MonthlyScoreRepository  # noqa: E402
+from Services.user_stats import UserStatsStore  # noqa: E402
+
+METRICS = ["moodLevel", "socialScore", "workStressScore", "screenTimePenalty", "interactionPenalty"]
+
+
+def history(users, days, rng):
+    """Score days for every user, ordered by user and date (import_days order)"""
+    first = date.today() - timedelta(days=days - 1)
+    for user_id in users:
+        for i in range(days):
+            breakdown = {k: round(rng.uniform(1, 10), 1) if rng.random() < 0.6 else None for k in METRICS}
+            values = [v for v in breakdown.values() if v is not None]
+            yield {
+                "userId": user_id,
+                "date": (first + timedelta(days=i)).isoformat(),
+                "overallScore": round(sum(values) / len(values), 1) if values else 5.0,
+                "breakdown": breakdown,
+                "updatedAt": datetime.now(timezone.utc),
+            }
+
+
+def throughput(fn, ops, seconds):
+    """Operations per second calling fn(op) for each op, stopping after `seconds`"""
+    done = 0
+    start = time.perf_counter()
+    for op in ops:
+        fn(op)
+        done += 1
+        if time.perf_counter() - start > seconds:
+            break
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongo-uri', default=os.getenv('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='mood_tracker_bench')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seconds', type=float, default=5.0, help='Time spent on each measurement')
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    client.drop_database(args.database)
+    db = client[args.database]
+    for collection in ('user_scores', 'user_score_months'):
+        db[collection].create_indexes(APP_INDEXES[collection])
+
+    rng = random.Random(7)
+    users = [ObjectId() for _ in range(args.users)]
+    layouts = {'daily': DailyScoreRepository(db), 'monthly': MonthlyScoreRepository(db)}
+    for repository in layouts.values():
+        repository.import_days(history(users, args.days, random.Random(7)))
+
+    today = date.today()
+    # Same random operations for both layouts
+    updates = [(rng.choice(users), (today - timedelta(days=rng.randrange(args.days))).isoformat(),
+                {rng.choice(METRICS): round(rng.uniform(1, 10), 1)}) for _ in range(200_000)]
+    reads = [rng.choice(users) for _ in range(200_000)]
+    now = datetime.now(timezone.utc)
+
+    def days_back(n):
+        return (today - timedelta(days=n - 1)).isoformat(), today.isoformat()
+
+    try:
+        print(f"{args.users} users x {args.days} days")
+        print(f"{'layout':>8}  {'docs':>8}  {'data':>9}  {'index':>9}  {'update/s':>9}  "
+              f"{'7d read/s':>10}  {'90d read/s':>10}  {'rebuild/s':>10}")
+        for name, repository in layouts.items():
+            coll_stats = db.command('collStats', repository.collection.name)
+            stats = UserStatsStore(db, repository)
+            update_rate = throughput(lambda op: repository.update_day(op[0], op[1], op[2], now), updates, args.seconds)
+            week_rate = throughput(lambda u: repository.days(u, *days_back(7)), reads, args.seconds)
+            quarter_rate = throughput(lambda u: repository.days(u, *days_back(90)), reads, args.seconds)
+            rebuild_rate = throughput(stats.rebuild, reads, args.seconds)
+            print(f"{name:>8}  {coll_stats['count']:>8}  {coll_stats['size'] / 2**20:7.1f}MB  "
+                  f"{coll_stats['totalIndexSize'] / 2**20:7.1f}MB  {update_rate:>9.0f}  "
+                  f"{week_rate:>10.0f}  {quarter_rate:>10.0f}  {rebuild_rate:>10.0f}")
+    finally:
+        client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
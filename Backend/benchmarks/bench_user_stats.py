@@ -0,0 +1,105 @@
+"""Benchmark user_stats reads and rebuilds against loading a user's whole score history.
+
+Usage (from Backend/):
+    python benchmarks/bench_user_stats.py [--mongo-uri mongodb://localhost:27017] [--sizes 30,365,1000,3000,10000]
+
+Seeds a scratch database (dropped afterwards) with one user per history
+size, then times the old /api/user-stats computation (find + sort, every
+document into Python), the $facet rebuild of a user_stats document, and
+ScoreStore.summary, which reads that document.
+"""
+import os
+import sys
+import random
+import argparse
+import timeit
+from datetime import date, datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Services.score_store import ScoreStore  # noqa: E402
+from Services.user_stats import score_trend  # noqa: E402
+
+
+def legacy_stats(db, user_id):
+    """What /api/user-stats did before the aggregation"""
+    scores = list(db.user_scores.find({"userId": user_id}).sort("date", -1))
+    valid = [s.get('overallScore') for s in scores if s.get('overallScore') is not None]
+    avg_mood = round(sum(valid) / len(valid), 1) if valid else 0
+    recent = [s.get('overallScore') for s in scores[:7] if s.get('overallScore') is not None]
+    recent_avg = round(sum(recent) / len(recent), 1) if recent else 0
+    trend = "stable"
+    if len(scores) >= 14:
+        older = [s.get('overallScore') for s in scores[7:14] if s.get('overallScore') is not None]
+        if older and recent:
+            older_avg, recent_avg_calc = sum(older) / len(older), sum(recent) / len(recent)
+            if recent_avg_calc > older_avg + 0.5:
+                trend = "improving"
+            elif recent_avg_calc < older_avg - 0.5:
+                trend = "declining"
+    return len(scores), avg_mood, recent_avg, trend
+
+
+def summary_stats(store, user_id):
+    summary = store.summary(user_id)
+    avg_mood = round(summary['avg'], 1) if summary['avg'] is not None else 0
+    recent_avg = round(summary['recent_avg'], 1) if summary['recent_avg'] is not None else 0
+    return summary['count'], avg_mood, recent_avg, score_trend(summary)
+
+
+def seed(db, size, rng):
+    user_id = ObjectId()
+    first = date(2020, 1, 1)
+    db.user_scores.insert_many([
+        {
+            "userId": user_id,
+            "date": (first + timedelta(days=i)).isoformat(),
+            "overallScore": round(rng.uniform(1, 10), 1),
+            "breakdown": {"moodLevel": round(rng.uniform(1, 10), 1), "socialScore": None,
+                          "workStressScore": round(rng.uniform(1, 10), 1), "screenTimePenalty": None,
+                          "interactionPenalty": None},
+            "updatedAt": datetime.now(timezone.utc),
+        }
+        for i in range(size)
+    ])
+    return user_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mongo-uri', default=os.getenv('BENCH_MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--database', default='mood_tracker_bench')
+    parser.add_argument('--sizes', default='30,365,1000,3000,10000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    client.drop_database(args.database)
+    db = client[args.database]
+    db.user_scores.create_index([('userId', ASCENDING), ('date', ASCENDING)], unique=True)
+    store = ScoreStore(db)
+    rng = random.Random(7)
+
+    try:
+        print(f"{'history':>8}  {'legacy':>10}  {'rebuild':>10}  {'user_stats':>10}")
+        for size in (int(s) for s in args.sizes.split(',')):
+            user_id = seed(db, size, rng)
+            # The first summary builds the user_stats document from the seeded history
+            assert legacy_stats(db, user_id) == summary_stats(store, user_id), size
+
+            def best_ms(fn):
+                return min(timeit.repeat(lambda: fn(user_id), number=1, repeat=args.repeat)) * 1000
+
+            legacy_ms = best_ms(lambda uid: legacy_stats(db, uid))
+            rebuild_ms = best_ms(store.stats.rebuild)
+            read_ms = best_ms(lambda uid: summary_stats(store, uid))
+            print(f"{size:>8}  {legacy_ms:8.2f}ms  {rebuild_ms:8.2f}ms  {read_ms:8.2f}ms  ({legacy_ms / read_ms:.1f}x)")
+    finally:
+        client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Benchmark vectorised work-stress scoring against the original per-day loop.
+
+Usage (from Backend/):
+    python benchmarks/bench_work_stress.py [--days 90] [--events-per-day 25] [--emails-per-day 150]
+"""
+import os
+import sys
+import random
+import argparse
+import timeit
+from datetime import datetime, timezone, timedelta, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Services.work_stress import build_snapshot, compute_work_stress, stress_window  # noqa: E402
+
+
+def legacy_work_stress(cal_data, mail_data, start_dt, days):
+    """The per-day loop /graph/work-stress used before the shared engine"""
+    day_keys = [(start_dt + timedelta(days=i)).date().isoformat() for i in range(days)]
+    events_by_day = {k: [] for k in day_keys}
+    emails_by_day = {k: [] for k in day_keys}
+
+    def clamp(v, lo, hi):
+        return max(lo, min(hi, v))
+
+    for ev in cal_data:
+        try:
+            s = ev.get('start', {}).get('dateTime')
+            e = ev.get('end', {}).get('dateTime')
+            if not s or not e:
+                continue
+            sd = datetime.fromisoformat(s.replace('Z', '+00:00'))
+            ed = datetime.fromisoformat(e.replace('Z', '+00:00'))
+            day_key = sd.date().isoformat()
+            if day_key in events_by_day:
+                events_by_day[day_key].append((sd, ed, ev))
+        except Exception:
+            continue
+
+    for m in mail_data:
+        try:
+            r = m.get('receivedDateTime')
+            if not r:
+                continue
+            rd = datetime.fromisoformat(r.replace('Z', '+00:00'))
+            day_key = rd.date().isoformat()
+            if day_key in emails_by_day:
+                emails_by_day[day_key].append(m)
+        except Exception:
+            continue
+
+    data = []
+    for day_key in day_keys:
+        day_events = sorted(events_by_day.get(day_key, []), key=lambda x: x[0])
+        day_emails = emails_by_day.get(day_key, [])
+
+        total_meeting_hours = 0.0
+        back_to_back_count = 0
+        after_hours_emails = 0
+        early_morning_meetings = 0
+
+        last_end = None
+        for sd, ed, _ in day_events:
+            dur = (ed - sd).total_seconds() / 3600.0
+            total_meeting_hours += max(0.0, dur)
+            if last_end is not None and (sd - last_end).total_seconds() <= 15 * 60:
+                back_to_back_count += 1
+            last_end = ed
+            if sd.time() < time(9, 0):
+                early_morning_meetings += 1
+
+        for m in day_emails:
+            try:
+                rd = datetime.fromisoformat(m['receivedDateTime'].replace('Z', '+00:00'))
+                if rd.time() < time(7, 0) or rd.time() > time(19, 0):
+                    after_hours_emails += 1
+            except Exception:
+                continue
+
+        score = 0.0
+        score += clamp(total_meeting_hours / 6.0 * 5.0, 0.0, 5.0)
+        score += clamp(back_to_back_count * 0.5, 0.0, 2.0)
+        score += clamp(after_hours_emails * 0.3, 0.0, 2.0)
+        score += clamp(early_morning_meetings * 0.3, 0.0, 1.0)
+        score = clamp(score * (10.0 / 10.0), 1.0, 10.0)
+        data.append({
+            'meeting_hours': round(total_meeting_hours, 6),
+            'back_to_back_meetings': back_to_back_count,
+            'early_morning_meetings': early_morning_meetings,
+            'email_count': len(day_emails),
+            'after_hours_emails': after_hours_emails,
+            'score': round(score, 1),
+        })
+    return data
+
+
+def reference_busy_hours(cal_data, start_dt, days):
+    """Merged busy time per day by sorting and merging each day's intervals"""
+    by_day = [[] for _ in range(days)]
+    for ev in cal_data:
+        sd = datetime.fromisoformat(ev['start']['dateTime']).replace(tzinfo=timezone.utc)
+        ed = datetime.fromisoformat(ev['end']['dateTime']).replace(tzinfo=timezone.utc)
+        idx = (sd - start_dt).days
+        if 0 <= idx < days:
+            by_day[idx].append((sd.timestamp(), ed.timestamp()))
+    busy = []
+    for intervals in by_day:
+        total, cur_start, cur_end = 0.0, None, None
+        for s, e in sorted(intervals):
+            if cur_end is None or s > cur_end:
+                if cur_end is not None:
+                    total += cur_end - cur_start
+                cur_start, cur_end = s, e
+            else:
+                cur_end = max(cur_end, e)
+        if cur_end is not None:
+            total += cur_end - cur_start
+        busy.append(round(total / 3600.0, 6))
+    return busy
+
+
+def synthetic_data(start_dt, days, events_per_day, emails_per_day, seed=7):
+    """Graph-shaped calendarView events and messages, including overlaps and after-hours mail"""
+    rng = random.Random(seed)
+    cal, mail = [], []
+    for d in range(days):
+        day = start_dt + timedelta(days=d)
+        for _ in range(events_per_day):
+            begin = day + timedelta(minutes=rng.randrange(6 * 60, 20 * 60, 5))
+            end = begin + timedelta(minutes=rng.choice([15, 30, 45, 60, 90]))
+            cal.append({
+                'subject': 'Sync',
+                'start': {'dateTime': begin.strftime('%Y-%m-%dT%H:%M:%S.0000000'), 'timeZone': 'UTC'},
+                'end': {'dateTime': end.strftime('%Y-%m-%dT%H:%M:%S.0000000'), 'timeZone': 'UTC'},
+            })
+        for _ in range(emails_per_day):
+            received = day + timedelta(seconds=rng.randrange(0, 24 * 3600))
+            mail.append({'subject': 'Re: status', 'receivedDateTime': received.strftime('%Y-%m-%dT%H:%M:%SZ')})
+    return cal, mail
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--events-per-day', type=int, default=25)
+    parser.add_argument('--emails-per-day', type=int, default=150)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    start_dt, _ = stress_window(args.days, datetime(2026, 1, 31, tzinfo=timezone.utc))
+    cal, mail = synthetic_data(start_dt, args.days, args.events_per_day, args.emails_per_day)
+    snapshot = build_snapshot(cal, mail, start_dt, args.days)
+
+    # Scores differ by design (busy time replaces summed meeting hours); the raw metrics must not
+    legacy = legacy_work_stress(cal, mail, start_dt, args.days)
+    days = compute_work_stress(snapshot)['days']
+    for field in ('back_to_back_meetings', 'early_morning_meetings', 'email_count', 'after_hours_emails'):
+        assert [d[field] for d in legacy] == [d[field] for d in days], f"{field} differs from the legacy loop"
+    assert [d['meeting_hours'] for d in legacy] == [round(d['meeting_hours'], 6) for d in days], \
+        "meeting_hours differs from the legacy loop"
+    assert reference_busy_hours(cal, start_dt, args.days) == [round(d['busy_hours'], 6) for d in days], \
+        "busy_hours differs from the reference merge"
+    overlapping = sum(1 for a, b in zip(legacy, days) if a['meeting_hours'] - b['busy_hours'] > 1e-9)
+
+    def best(fn):
+        return min(timeit.repeat(fn, number=1, repeat=args.repeat)) * 1000
+
+    legacy_ms = best(lambda: legacy_work_stress(cal, mail, start_dt, args.days))
+    end_to_end_ms = best(lambda: compute_work_stress(build_snapshot(cal, mail, start_dt, args.days)))
+    scoring_ms = best(lambda: compute_work_stress(snapshot))
+
+    print(f"{args.days} days, {len(cal)} events, {len(mail)} emails (best of {args.repeat})")
+    print(f"  days with overlapping meetings: {overlapping}/{args.days}")
+    print(f"  legacy per-day loop          {legacy_ms:9.2f} ms")
+    print(f"  parse + vectorised scoring   {end_to_end_ms:9.2f} ms  ({legacy_ms / end_to_end_ms:.1f}x)")
+    print(f"  vectorised scoring only      {scoring_ms:9.2f} ms  ({legacy_ms / scoring_ms:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,13 @@
 import os
-from msal import ConfidentialClientApplication, PublicClientApplication
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from msal import ConfidentialClientApplication, PublicClientApplication, SerializableTokenCache
+
+logger = logging.getLogger(__name__)
 
 # Microsoft OAuth Configuration
 # You need to register your app at https://portal.azure.com/#view/Microsoft_AAD_RegisteredApps/ApplicationsListBlade
@@ -23,18 +31,187 @@ SCOPES = [
 # Authority URL
 AUTHORITY = f'https://login.microsoftonline.com/{TENANT_ID}'
 
-def get_msal_app():
-    """Get MSAL application instance"""
+# Times a token call is replayed when another worker stored the same account's cache meanwhile
+MSAL_CACHE_WRITE_ATTEMPTS = int(os.getenv('MSAL_CACHE_WRITE_ATTEMPTS', '3'))
+
+
+class MsalStats:
+    """Counters for MSAL network traffic and silent token lookups"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = defaultdict(int)
+
+    def incr(self, key: str):
+        with self._lock:
+            self._counts[key] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+msal_stats = MsalStats()
+
+
+class CountingHttpClient(requests.Session):
+    """requests.Session handed to MSAL so its network calls can be counted"""
+
+    def request(self, method, url, *args, **kwargs):
+        if '/oauth2/v2.0/token' in url:
+            msal_stats.incr('http_token')
+        elif 'openid-configuration' in url or '/discovery/' in url:
+            msal_stats.incr('http_discovery')
+        else:
+            msal_stats.incr('http_other')
+        return super().request(method, url, *args, **kwargs)
+
+
+_msal_http_client = CountingHttpClient()
+_msal_http_cache: Dict[str, Any] = {}
+
+
+def build_msal_app(token_cache: Optional[SerializableTokenCache] = None):
+    """MSAL application over the given token cache.
+
+    Cheap to build: every app shares one HTTP session and one http_cache,
+    which keeps the authority/instance discovery responses (no tokens), so
+    discovery runs once per process however many apps are built.
+    """
+    kwargs = dict(
+        authority=AUTHORITY,
+        token_cache=token_cache,
+        http_client=_msal_http_client,
+        http_cache=_msal_http_cache,
+    )
     if CLIENT_SECRET:
         # Confidential client (web app with client secret)
-        return ConfidentialClientApplication(
-            CLIENT_ID,
-            authority=AUTHORITY,
-            client_credential=CLIENT_SECRET
-        )
-    else:
-        # Public client (mobile app)
-        return PublicClientApplication(
-            CLIENT_ID,
-            authority=AUTHORITY
-        )
+        return ConfidentialClientApplication(CLIENT_ID, client_credential=CLIENT_SECRET, **kwargs)
+    # Public client (mobile app)
+    return PublicClientApplication(CLIENT_ID, **kwargs)
+
+
+_msal_app = None
+_msal_app_lock = threading.Lock()
+
+
+def get_msal_app():
+    """Process-wide MSAL application for token-free calls such as the login URL.
+
+    Token acquisition goes through `msal_token_caches`, which builds an app
+    over the account's own cache for every call.
+    """
+    global _msal_app
+    if _msal_app is not None:
+        return _msal_app
+    with _msal_app_lock:
+        if _msal_app is None:
+            msal_stats.incr('app_created')
+            _msal_app = build_msal_app()
+    return _msal_app
+
+
+class AccountTokenCaches:
+    """MSAL token caches kept per account (home_account_id) in external storage.
+
+    Every acquire runs on a fresh SerializableTokenCache holding only that
+    account, so no cache object is shared between threads and a refresh
+    (de)serializes one account rather than every user. Writes carry the
+    version that was loaded: if another worker stored the account in the
+    meantime, the call is replayed on its state instead of overwriting the
+    refresh token it just rotated.
+    """
+
+    def __init__(self, load: Optional[Callable[[str], Optional[Tuple[str, int]]]] = None,
+                 save: Optional[Callable[[str, str, Optional[int]], bool]] = None,
+                 attempts: int = MSAL_CACHE_WRITE_ATTEMPTS):
+        self._load = load
+        self._save = save
+        self.attempts = attempts
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def configure(self, load: Callable[[str], Optional[Tuple[str, int]]],
+                  save: Callable[[str, str, Optional[int]], bool]):
+        self._load = load
+        self._save = save
+
+    def _lock_for(self, home_account_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(home_account_id, threading.Lock())
+
+    def _open(self, home_account_id: str) -> Tuple[SerializableTokenCache, int]:
+        cache = SerializableTokenCache()
+        if not self._load:
+            return cache, 0
+        try:
+            stored = self._load(home_account_id)
+        except Exception as e:
+            logger.error(f"Failed to load MSAL token cache for {home_account_id}: {str(e)}")
+            return cache, 0
+        if not stored:
+            return cache, 0
+        state, version = stored
+        cache.deserialize(state)
+        return cache, version
+
+    def _write(self, home_account_id: Optional[str], cache: SerializableTokenCache, version: Optional[int]) -> bool:
+        """Store the cache if the call changed it; False only when another writer got there first"""
+        if not self._save or not home_account_id or not cache.has_state_changed:
+            return True
+        try:
+            return self._save(home_account_id, cache.serialize(), version)
+        except Exception as e:
+            logger.error(f"Failed to save MSAL token cache for {home_account_id}: {str(e)}")
+            return True
+
+    def acquire(self, home_account_id: Optional[str], call: Callable[[Any], dict]) -> Tuple[dict, Optional[str]]:
+        """Run `call(app)` on the account's token cache and store what it changed.
+
+        Without a home_account_id (a new sign-in, or a device stored before
+        accounts were tracked) the call starts from an empty cache and the
+        account taken from its result replaces whatever was stored.
+        Returns (result, home_account_id).
+        """
+        if not home_account_id:
+            cache = SerializableTokenCache()
+            app = build_msal_app(cache)
+            result = call(app)
+            home_account_id = home_account_id_for(app, result) if 'access_token' in result else None
+            self._write(home_account_id, cache, None)
+            return result, home_account_id
+
+        # Threads of this worker queue up; other workers are caught by the version check
+        with self._lock_for(home_account_id):
+            for attempt in range(1, self.attempts + 1):
+                cache, version = self._open(home_account_id)
+                result = call(build_msal_app(cache))
+                if self._write(home_account_id, cache, version):
+                    return result, home_account_id
+                msal_stats.incr('cache_conflict')
+                logger.info(f"MSAL token cache for {home_account_id} changed concurrently, retrying ({attempt}/{self.attempts})")
+            logger.warning(f"Gave up storing MSAL token cache for {home_account_id} after {self.attempts} conflicts")
+            return result, home_account_id
+
+
+msal_token_caches = AccountTokenCaches()
+
+
+def home_account_id_for(app, result: dict) -> Optional[str]:
+    """MSAL account id for a fresh token response, used later for acquire_token_silent"""
+    claims = result.get('id_token_claims') or {}
+    local_id = claims.get('oid') or claims.get('sub')
+    accounts = app.get_accounts(username=claims.get('preferred_username')) if claims.get('preferred_username') else app.get_accounts()
+    for account in accounts:
+        if local_id and account.get('local_account_id') == local_id:
+            return account.get('home_account_id')
+    return accounts[0].get('home_account_id') if len(accounts) == 1 else None
+
+
+def find_account(app, home_account_id: Optional[str]) -> Optional[dict]:
+    if not home_account_id:
+        return None
+    for account in app.get_accounts():
+        if account.get('home_account_id') == home_account_id:
+            return account
+    return None
@@ -1,18 +1,42 @@
 from flask import Flask, request, jsonify, redirect, session, url_for
+import click
 from flask_cors import CORS
 import logging
 from datetime import datetime, timezone, timedelta, time
-import pytz
 from flask_pymongo import PyMongo
+from pymongo.errors import DuplicateKeyError
 from collections import defaultdict
 from datetime import timedelta
-from typing import Dict
 from Services.groqClient import generate_mood_report
 from Services.auth_service import AuthService
-import requests
+from Services.password_hasher import HasherBusyError
+from Services.work_stress import PERIOD_DAYS, clamp, weekly_rollups
+from Services.graph_client import graph_client, GraphFetchError
+from Services.graph_sync import GraphSync
+from Services.timezones import resolve_timezone, local_date, local_now, local_midnight
+from Services.stress_store import WorkStressStore, StressRefreshScheduler, STRESS_REFRESH_ENABLED
+from Services.token_store import create_token_store, TokenRefresher, TOKEN_REFRESH_ENABLED
+from Services.user_cache import UserCache, UserCacheSync, USER_CACHE_SYNC_ENABLED
+from Services.schemas import (
+    validate_body, RegisterRequest, LoginRequest, MoodScoreRequest, UpdateScoreRequest,
+    MoodReportRequest, ScreenTimeReportRequest, WorkStressReportRequest
+)
+from Services.indexes import ensure_app_indexes, explain_queries
+from Services.score_store import ScoreStore
+from Services.user_stats import score_trend
+from Services.mood_analytics import MoodAnalytics, PERIODS
+from Services.mood_events import MoodEventStore, MoodRollupScheduler, MOOD_ROLLUP_ENABLED
+from Services.scheduler import SchedulerLease
+from Services.rate_limiter import (
+    create_rate_limiter, client_ip, body_email,
+    LOGIN_IP_LIMIT, LOGIN_EMAIL_LIMIT, REGISTER_IP_LIMIT, REGISTER_EMAIL_LIMIT
+)
 import secrets
 from dotenv import load_dotenv
-from microsoft_config import get_msal_app, CLIENT_ID, REDIRECT_URI, SCOPES, AUTHORITY
+from microsoft_config import (
+    get_msal_app, msal_token_caches, msal_stats, find_account,
+    CLIENT_ID, REDIRECT_URI, SCOPES, AUTHORITY
+)
 
 # Load environment variables
 load_dotenv()
@@ -38,33 +62,51 @@ mongo = PyMongo(app)
 # Get database
 db = mongo.db
 
+# Delta-synced local copy of Microsoft calendar/mail data
+graph_sync = GraphSync(db)
+# Precomputed per-day work stress scores
+stress_store = WorkStressStore(db)
+# Microsoft tokens per device, shared by every worker process
+token_store = create_token_store(db)
+# Daily user scores and their materialised per-user stats
+score_store = ScoreStore(db)
+# Raw mood check-ins (time-series) with hourly/daily rollups
+mood_events = MoodEventStore(db)
+# Mood check-in averages per local day/month
+mood_analytics = MoodAnalytics(mood_events)
+# Token buckets in front of the bcrypt-heavy auth routes
+rate_limiter = create_rate_limiter(db)
+# Run slots that keep each background task to one worker process per interval
+scheduler_lease = SchedulerLease(db)
+try:
+    ensure_app_indexes(db)
+    graph_sync.ensure_indexes()
+    stress_store.ensure_indexes()
+    token_store.ensure_indexes()
+    rate_limiter.ensure_indexes()
+    mood_events.ensure_indexes()
+except Exception as e:
+    logger.error(f"Failed to create indexes: {str(e)}")
+# MSAL token caches are shared by all workers through the token store, one per account
+msal_token_caches.configure(load=token_store.load_msal_cache, save=token_store.save_msal_cache)
+
 # ---------------- Authentication Service ----------------
 auth_service = AuthService()
+# Verified tokens and user summaries for /api/verify-token
+user_cache = UserCache(db)
 
 # ---------------- Timezone Configuration ----------------
 def get_user_timezone(user_timezone=None):
     """Get user's timezone or fallback to UTC"""
-    if user_timezone and user_timezone in pytz.all_timezones:
-        try:
-            return pytz.timezone(user_timezone)
-        except:
-            pass
-    # Fallback to UTC if no valid timezone provided
-    return pytz.timezone('UTC')
+    return resolve_timezone(user_timezone)
 
 def get_user_date(user_timezone=None):
     """Get current date in user's timezone"""
-    tz = get_user_timezone(user_timezone)
-    local_time = datetime.now(tz)
-    return local_time.date().isoformat()
+    return local_date(user_timezone).isoformat()
 
 def get_user_datetime(user_timezone=None):
     """Get current datetime in user's timezone"""
-    tz = get_user_timezone(user_timezone)
-    return datetime.now(tz)
-
-# ---------------- In-memory store for Microsoft login state ----------------
-ms_tokens: Dict[str, dict] = {}
+    return local_now(user_timezone)
 
 # ---------------- Feature Space ----------------
 goals_list = [
@@ -135,13 +177,7 @@ def home():
 
     logger.info("testing mongoDB connection now : ")
 
-    db.Mood_Score.insert_one({
-        "user_id": 12345,
-        "mood": "test mood",
-        "mood_level": 7,
-        "mood_emoji": "🥲",
-        "created_at": datetime.now(timezone.utc)
-    })
+    mood_events.record(12345, "test mood", 7, "🥲")
 
 
     return jsonify({"message": "Mood Tracker API is running"})
@@ -191,14 +227,14 @@ def auth_callback():
         return jsonify({"error": "No authorization code received"}), 400
     
     try:
-        # Create MSAL app instance
-        app_msal = get_msal_app()
-        
-        # Exchange authorization code for tokens
-        result = app_msal.acquire_token_by_authorization_code(
-            code,
-            scopes=SCOPES,
-            redirect_uri=REDIRECT_URI
+        # Exchange authorization code for tokens; the account's token cache starts afresh
+        result, home_account_id = msal_token_caches.acquire(
+            None,
+            lambda app_msal: app_msal.acquire_token_by_authorization_code(
+                code,
+                scopes=SCOPES,
+                redirect_uri=REDIRECT_URI
+            )
         )
         
         if "error" in result:
@@ -210,15 +246,14 @@ def auth_callback():
             )
         
         # Store tokens for the device
-        ms_tokens[device_id] = {
+        token_store.save(device_id, {
             "access_token": result["access_token"],
             "refresh_token": result.get("refresh_token"),
             "expires_at": datetime.now(timezone.utc) + timedelta(seconds=result.get("expires_in", 3600)),
             "scope": result.get("scope", ""),
-            "token_type": result.get("token_type", "Bearer")
-        }
-
-#         print("Ms token acquired: ", ms_tokens[device_id])
+            "token_type": result.get("token_type", "Bearer"),
+            "home_account_id": home_account_id
+        })
         
         logger.info(f"Successfully authenticated device: {device_id}")
         
@@ -238,33 +273,47 @@ def auth_callback():
         )
 
 def refresh_access_token(device_id):
-    """Refresh access token using refresh token"""
-    token_data = ms_tokens.get(device_id)
+    """Refresh access token, trying MSAL's token cache before the refresh token"""
+    # Read past the cache: another worker may already have rotated the refresh token
+    token_data = token_store.get(device_id, fresh=True)
     if not token_data or not token_data.get('refresh_token'):
         return False
     
     try:
-        app_msal = get_msal_app()
-        result = app_msal.acquire_token_by_refresh_token(
-            token_data['refresh_token'],
-            scopes=SCOPES
-        )
+        def redeem(app_msal):
+            # Silent acquisition serves a cached token or redeems MSAL's own refresh token
+            account = find_account(app_msal, token_data.get('home_account_id'))
+            if account:
+                result = app_msal.acquire_token_silent(SCOPES, account=account)
+                msal_stats.incr('silent_hit' if result and 'access_token' in result else 'silent_miss')
+                if result and 'access_token' in result:
+                    return result
+            msal_stats.incr('refresh_token_fallback')
+            return app_msal.acquire_token_by_refresh_token(
+                token_data['refresh_token'],
+                scopes=SCOPES
+            )
+        
+        result, home_account_id = msal_token_caches.acquire(token_data.get('home_account_id'), redeem)
         
         if "error" in result:
             logger.error(f"Token refresh error: {result.get('error_description')}")
             return False
         
         # Update stored tokens
-        ms_tokens[device_id].update({
+        refreshed = {
             "access_token": result["access_token"],
             "expires_at": datetime.now(timezone.utc) + timedelta(seconds=result.get("expires_in", 3600)),
             "scope": result.get("scope", ""),
             "token_type": result.get("token_type", "Bearer")
-        })
+        }
+        if home_account_id and home_account_id != token_data.get('home_account_id'):
+            refreshed["home_account_id"] = home_account_id
         
         # Update refresh token if provided
         if result.get("refresh_token"):
-            ms_tokens[device_id]["refresh_token"] = result["refresh_token"]
+            refreshed["refresh_token"] = result["refresh_token"]
+        token_store.update(device_id, refreshed)
         
         logger.info(f"Successfully refreshed token for device: {device_id}")
         return True
@@ -282,7 +331,7 @@ def connection_status():
         logger.warning("⚠️ DEBUG: No device_id provided")
         return jsonify({"connected": False, "reason": "no_device_id"}), 200
     
-    token = ms_tokens.get(device_id)
+    token = token_store.get(device_id)
     logger.info(f"🔍 DEBUG: Token exists for device_id: {token is not None}")
     
     if not token:
@@ -297,15 +346,14 @@ def connection_status():
         
         if expires_at <= now:
             logger.info(f"🔄 DEBUG: Token expired, attempting refresh for device_id={device_id}")
-            # Try to refresh the token
-            if refresh_access_token(device_id):
+            # Try to refresh the token (shared with any concurrent refresh for this device)
+            if token_refresher.refresh(device_id):
                 logger.info(f"✅ DEBUG: Token refreshed successfully for device_id={device_id}")
                 return jsonify({"connected": True, "reason": "refreshed"})
             else:
                 logger.error(f"❌ DEBUG: Token refresh failed for device_id={device_id}")
                 # Remove invalid token
-                if device_id in ms_tokens:
-                    del ms_tokens[device_id]
+                token_store.delete(device_id)
                 return jsonify({"connected": False, "reason": "refresh_failed"})
         else:
             logger.info(f"✅ DEBUG: Token is still valid for device_id={device_id}")
@@ -317,25 +365,16 @@ def connection_status():
 # ---------------- User Authentication Endpoints ----------------
 
 @app.route('/api/register', methods=['POST'])
-def register_user():
+@validate_body(RegisterRequest)
+@rate_limiter.limit((REGISTER_IP_LIMIT, client_ip), (REGISTER_EMAIL_LIMIT, body_email))
+def register_user(body: RegisterRequest):
     """Register a new user with email and password"""
     try:
-        data = request.json
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
-        
-        name = data.get('name', '').strip()
-        email = data.get('email', '').strip()
-        password = data.get('password', '')
-        confirm_password = data.get('confirmPassword', '')
-        
-        # Validate required fields
-        if not name or not email or not password:
-            return jsonify({"error": "Name, email, and password are required"}), 400
-        
-        # Validate email format
-        if not auth_service.validate_email(email):
-            return jsonify({"error": "Invalid email format"}), 400
+        # Required fields and email format are checked by RegisterRequest
+        name = body.name
+        email = body.email
+        password = body.password
+        confirm_password = body.confirm_password
         
         # Validate password strength
         password_validation = auth_service.validate_password(password)
@@ -357,8 +396,11 @@ def register_user():
         # Create user data
         user_data = auth_service.create_user_data(name, email, password)
         
-        # Insert user into database
-        result = db.users.insert_one(user_data)
+        # Insert user into database; the unique email index catches concurrent sign-ups
+        try:
+            result = db.users.insert_one(user_data)
+        except DuplicateKeyError:
+            return jsonify({"error": "User with this email already exists"}), 409
         user_id = str(result.inserted_id)
         
         # Generate JWT token
@@ -376,28 +418,21 @@ def register_user():
             "token": token
         }), 201
         
+    except HasherBusyError as e:
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         logger.error(f"Registration error: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
 @app.route('/api/login', methods=['POST'])
-def login_user():
+@validate_body(LoginRequest)
+@rate_limiter.limit((LOGIN_IP_LIMIT, client_ip), (LOGIN_EMAIL_LIMIT, body_email))
+def login_user(body: LoginRequest):
     """Login user with email and password"""
     try:
-        data = request.json
-        if not data:
-            return jsonify({"error": "No data provided"}), 400
-        
-        email = data.get('email', '').strip()
-        password = data.get('password', '')
-        
-        # Validate required fields
-        if not email or not password:
-            return jsonify({"error": "Email and password are required"}), 400
-        
-        # Validate email format
-        if not auth_service.validate_email(email):
-            return jsonify({"error": "Invalid email format"}), 400
+        # Required fields and email format are checked by LoginRequest
+        email = body.email
+        password = body.password
         
         # Find user in database
         user = db.users.find_one({"email": email.lower()})
@@ -412,11 +447,12 @@ def login_user():
         if not user.get('is_active', True):
             return jsonify({"error": "Account is deactivated"}), 401
         
-        # Update last login
-        db.users.update_one(
-            {"_id": user['_id']},
-            {"$set": {"last_login": datetime.now(timezone.utc)}}
-        )
+        # Update last login, upgrading the hash if BCRYPT_ROUNDS changed since it was stored
+        login_update = {"last_login": datetime.now(timezone.utc)}
+        new_hash = auth_service.rehash_password(password, user['password_hash'])
+        if new_hash:
+            login_update["password_hash"] = new_hash
+        user_cache.update_user(str(user['_id']), login_update)
         
         # Generate JWT token
         user_id = str(user['_id'])
@@ -434,6 +470,8 @@ def login_user():
             "token": token
         }), 200
         
+    except HasherBusyError as e:
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
@@ -447,20 +485,20 @@ def verify_token():
             return jsonify({"error": "Token is required"}), 400
         
         token = data['token']
-        payload = auth_service.verify_token(token)
+        payload = user_cache.verify_token(token, auth_service.verify_token)
         
         if not payload:
             return jsonify({"error": "Invalid or expired token"}), 401
         
-        # Get user from database
-        user = db.users.find_one({"_id": payload['user_id']})
-        if not user or not user.get('is_active', True):
+        # Cached user summary; falls back to an _id lookup on a miss
+        user = user_cache.get_user(payload['user_id'])
+        if not user or not user['is_active']:
             return jsonify({"error": "User not found or inactive"}), 401
         
         return jsonify({
             "valid": True,
             "user": {
-                "id": str(user['_id']),
+                "id": user['id'],
                 "name": user['name'],
                 "email": user['email']
             }
@@ -474,7 +512,8 @@ def verify_token():
 def debug_devices():
     """Debug endpoint to see connected device IDs"""
     connected_devices = []
-    for device_id, token_data in ms_tokens.items():
+    stored = token_store.items()
+    for device_id, token_data in stored:
         is_expired = token_data.get('expires_at') and token_data['expires_at'] <= datetime.now(timezone.utc)
         connected_devices.append({
             "device_id": device_id,
@@ -484,16 +523,49 @@ def debug_devices():
         })
     
     return jsonify({
-        "total_devices": len(ms_tokens),
+        "total_devices": len(stored),
         "devices": connected_devices
     })
 
+@app.route('/debug-graph-stats', methods=['GET'])
+def debug_graph_stats():
+    """Debug endpoint with per-endpoint Microsoft Graph call and latency counters"""
+    return jsonify(graph_client.stats.snapshot())
+
+
+@app.route('/debug-auth-stats', methods=['GET'])
+def debug_auth_stats():
+    """Debug endpoint with bcrypt pool, verify-token cache and rate limit counters"""
+    return jsonify({
+        **auth_service.hasher.stats(),
+        "user_cache": user_cache.stats(),
+        "rate_limits": rate_limiter.stats()
+    })
+
+
+@app.route('/debug-indexes', methods=['GET'])
+def debug_indexes():
+    """Debug endpoint explaining each hot query: winning plan stages and the index it uses"""
+    from bson import ObjectId
+    user_id = request.args.get('user_id')
+    report = explain_queries(db, ObjectId(user_id) if user_id else None)
+    return jsonify({
+        "all_indexed": all(q.get('indexed') for q in report),
+        "queries": report
+    })
+
+
+@app.route('/debug-msal-stats', methods=['GET'])
+def debug_msal_stats():
+    """Debug endpoint with MSAL network calls (discovery, token) and silent-acquire hit counts"""
+    return jsonify(msal_stats.snapshot())
+
 
 def get_valid_access_token(device_id):
     """Get a valid access token, refreshing if necessary"""
     logger.info(f"🔍 DEBUG: Getting valid access token for device_id={device_id}")
     
-    token_data = ms_tokens.get(device_id)
+    token_data = token_store.get(device_id)
     logger.info(f"🔍 DEBUG: Token data exists: {token_data is not None}")
     
     if not token_data:
@@ -507,15 +579,19 @@ def get_valid_access_token(device_id):
         logger.info(f"🔍 DEBUG: Token expires at: {expires_at}, Current time: {now}")
         
         if expires_at <= now:
+            # Only reached when the background refresher fell behind; concurrent callers share one refresh
             logger.info(f"🔄 DEBUG: Token expired, attempting refresh for device_id={device_id}")
-            if not refresh_access_token(device_id):
+            if not token_refresher.refresh(device_id):
                 logger.error(f"❌ DEBUG: Token refresh failed for device_id={device_id}")
                 # Remove invalid token from storage
-                if device_id in ms_tokens:
-                    del ms_tokens[device_id]
+                token_store.delete(device_id)
                 return None
-            token_data = ms_tokens.get(device_id)
+            token_data = token_store.get(device_id)
             logger.info(f"✅ DEBUG: Token refreshed successfully for device_id={device_id}")
+        elif token_refresher.expires_soon(token_data):
+            # Still valid: serve it now and renew off the request path
+            logger.info(f"🔄 DEBUG: Token expiring soon, renewing in background for device_id={device_id}")
+            token_refresher.refresh_in_background(device_id)
         else:
             logger.info(f"✅ DEBUG: Token is still valid for device_id={device_id}")
     else:
@@ -527,204 +603,46 @@ def get_valid_access_token(device_id):
 
 @app.route('/graph/work-stress', methods=['GET'])
 def graph_work_stress():
-
-    print("Inside graph work stress")
-
     device_id = request.args.get('device_id', '').strip()
     period = request.args.get('period', 'week')
+    user_timezone = request.args.get('timezone')
     if not device_id:
         return jsonify({"error": "device_id is required"}), 400
 
+    days = PERIOD_DAYS.get(period)
+    if not days:
+        return jsonify({"error": f"period must be one of: {', '.join(PERIOD_DAYS)}"}), 400
+
     access_token = get_valid_access_token(device_id)
     if not access_token:
         return jsonify({"error": "not connected or token expired"}), 401
 
     try:
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-
-        # Determine date range (default: last 7 days)
-        end_dt = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59, microsecond=0)
-        start_dt = end_dt - timedelta(days=6)
-
-        # Fetch calendar events using calendarView for accurate windowing
-        cal_url = 'https://graph.microsoft.com/v1.0/me/calendarView'
-        cal_params = {
-            'startDateTime': start_dt.isoformat(),
-            'endDateTime': end_dt.isoformat(),
-            '$select': 'subject,start,end,location,organizer',
-            '$top': '1000',
-        }
-        cal_resp = requests.get(cal_url, headers=headers, params=cal_params)
-        if cal_resp.status_code != 200:
-            logger.error(f"Graph calendarView error: {cal_resp.status_code} - {cal_resp.text}")
-            return jsonify({"error": "Failed to fetch calendar events"}), cal_resp.status_code
-        cal_data = cal_resp.json().get('value', [])
-
-        print("Logging the calendar data fetched: ", cal_data)
-
-        # Fetch recent emails (last 7 days, top N)
-        mail_url = 'https://graph.microsoft.com/v1.0/me/messages'
-        
-        # For email filter, use start of day to include all emails from that day
-        email_start_dt = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-        print(f"Email filter start → {email_start_dt.isoformat()}")
-        
-        # Try without filter first to see if we can get any emails at all
-        mail_params_simple = {
-            '$select': 'subject,receivedDateTime',
-            '$orderby': 'receivedDateTime desc',
-            '$top': '50'
-        }
-        print(f"GET {mail_url} params={mail_params_simple} (simple query)")
-        mail_resp_simple = requests.get(mail_url, headers=headers, params=mail_params_simple)
-        print(f"Simple messages status={mail_resp_simple.status_code}")
-        if mail_resp_simple.status_code != 200:
-            logger.error(f"Graph messages error (simple): {mail_resp_simple.status_code} - {mail_resp_simple.text}")
-            print(f"Simple messages error body: {mail_resp_simple.text}")
-            mail_data = []
-        else:
-            mail_data_simple = mail_resp_simple.json().get('value', [])
-            print(f"Simple query fetched: {len(mail_data_simple)} emails")
-            if mail_data_simple:
-                print(f"Sample email from simple query: {mail_data_simple[0]}")
-                # Filter manually for last 7 days
-                mail_data = []
-                for email in mail_data_simple:
-                    try:
-                        received_dt = datetime.fromisoformat(email['receivedDateTime'].replace('Z', '+00:00'))
-                        if received_dt >= email_start_dt:
-                            mail_data.append(email)
-                    except Exception as ex:
-                        print(f"Error parsing email date: {ex}")
-                print(f"After manual filtering: {len(mail_data)} emails in date range")
-            else:
-                mail_data = []
-                print("No emails found in simple query")
-        
-        # Also try the original filtered query for comparison
-        mail_params = {
-            '$select': 'subject,receivedDateTime',
-            '$orderby': 'receivedDateTime desc',
-            '$top': '200',
-            '$filter': f"receivedDateTime ge {email_start_dt.isoformat()}"
+        # Longer periods are served from stored per-day aggregates, so a quarter
+        # costs about the same as a week once the history has been computed
+        stress = (stress_store.recent(device_id, days, user_timezone)
+                  or stress_refresher.refresh_device(device_id, days, user_timezone, access_token=access_token))
+        if stress is None:
+            return jsonify({"error": "not connected or token expired"}), 401
+
+        response = {
+            'average': stress['aggregate']['average'],
+            'period': period,
+            'daily': [{'date': d['date'], 'score': d['score']} for d in stress['days']],
         }
-        print(f"GET {mail_url} params={mail_params} (filtered query)")
-        mail_resp = requests.get(mail_url, headers=headers, params=mail_params)
-        print(f"Filtered messages status={mail_resp.status_code}")
-        if mail_resp.status_code != 200:
-            logger.error(f"Graph messages error (filtered): {mail_resp.status_code} - {mail_resp.text}")
-            print(f"Filtered messages error body: {mail_resp.text}")
+        if period == 'week':
+            response['labels'] = [d['label'] for d in stress['days']]
+            response['data'] = [d['score'] for d in stress['days']]
         else:
-            mail_data_filtered = mail_resp.json().get('value', [])
-            print(f"Filtered query fetched: {len(mail_data_filtered)} emails")
-            if mail_data_filtered:
-                print(f"Sample email from filtered query: {mail_data_filtered[0]}")
-                # Use filtered data if it worked
-                mail_data = mail_data_filtered
-
-        # Build per-day aggregates
-        day_keys = []
-        day_start = start_dt
-        for i in range(7):
-            key = (day_start + timedelta(days=i)).date().isoformat()
-            day_keys.append(key)
-
-        events_by_day = {k: [] for k in day_keys}
-        emails_by_day = {k: [] for k in day_keys}
-
-        def clamp(v, lo, hi):
-            return max(lo, min(hi, v))
-
-        # Bucket events by day; count durations and overlaps
-        for ev in cal_data:
-            try:
-                s = ev.get('start', {}).get('dateTime')
-                e = ev.get('end', {}).get('dateTime')
-                if not s or not e:
-                    continue
-                sd = datetime.fromisoformat(s.replace('Z', '+00:00'))
-                ed = datetime.fromisoformat(e.replace('Z', '+00:00'))
-                day_key = sd.date().isoformat()
-                if day_key in events_by_day:
-                    events_by_day[day_key].append((sd, ed, ev))
-            except Exception:
-                continue
-
-        # Bucket emails by day
-        for m in mail_data:
-            try:
-                r = m.get('receivedDateTime')
-                if not r:
-                    continue
-                rd = datetime.fromisoformat(r.replace('Z', '+00:00'))
-                day_key = rd.date().isoformat()
-                if day_key in emails_by_day:
-                    emails_by_day[day_key].append(m)
-            except Exception:
-                continue
-
-        # Heuristic scoring per day (1-10)
-        labels = []
-        data = []
-        for i, day_key in enumerate(day_keys):
-            day_dt = start_dt.date() + timedelta(days=i)
-            labels.append(day_dt.strftime('%a'))
-
-            day_events = sorted(events_by_day.get(day_key, []), key=lambda x: x[0])
-            day_emails = emails_by_day.get(day_key, [])
-
-            # Metrics
-            total_meeting_hours = 0.0
-            back_to_back_count = 0
-            after_hours_emails = 0
-            early_morning_meetings = 0
-
-            last_end = None
-            for sd, ed, _ in day_events:
-                dur = (ed - sd).total_seconds() / 3600.0
-                total_meeting_hours += max(0.0, dur)
-                if last_end is not None and (sd - last_end).total_seconds() <= 15 * 60:
-                    back_to_back_count += 1
-                last_end = ed
-                # Early meetings before 9am local
-                if sd.time() < time(9, 0):
-                    early_morning_meetings += 1
-
-            for m in day_emails:
-                try:
-                    rd = datetime.fromisoformat(m['receivedDateTime'].replace('Z', '+00:00'))
-                    if rd.time() < time(7, 0) or rd.time() > time(19, 0):
-                        after_hours_emails += 1
-                except Exception:
-                    continue
-
-            # Convert metrics to stress score components
-            score = 0.0
-            # Meeting load: map 0-6h → 0-5 points
-            score += clamp(total_meeting_hours / 6.0 * 5.0, 0.0, 5.0)
-            # Back-to-back: each contributes up to 2 points capped at 2
-            score += clamp(back_to_back_count * 0.5, 0.0, 2.0)
-            # After-hours emails: up to 2 points
-            score += clamp(after_hours_emails * 0.3, 0.0, 2.0)
-            # Early meetings: up to 1 point
-            score += clamp(early_morning_meetings * 0.3, 0.0, 1.0)
-
-            # Normalize to 1-10 scale and clamp
-            score = clamp(score * (10.0 / 10.0), 1.0, 10.0)
-            data.append(round(score, 1))
-
-        avg = round(sum(data) / len(data), 1) if data else 0
+            weeks = weekly_rollups(stress['days'])
+            response['labels'] = [w['label'] for w in weeks]
+            response['data'] = [w['score'] for w in weeks]
+            response['weekly'] = weeks
 
-        return jsonify({
-            'labels': labels,
-            'data': data,
-            'average': avg,
-            'period': period,
-        })
+        return jsonify(response)
 
+    except GraphFetchError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         logger.error(f"Error computing work stress: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
@@ -741,14 +659,9 @@ def graph_test_mail():
         return jsonify({"error": "not connected or token expired"}), 401
     
     try:
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         # Test 1: Get user info
         print("Testing user info...")
-        user_resp = requests.get('https://graph.microsoft.com/v1.0/me', headers=headers)
+        user_resp = graph_client.get('/me', access_token)
         print(f"User info status: {user_resp.status_code}")
         if user_resp.status_code == 200:
             user_data = user_resp.json()
@@ -756,7 +669,7 @@ def graph_test_mail():
         
         # Test 2: Get mail folders
         print("Testing mail folders...")
-        folders_resp = requests.get('https://graph.microsoft.com/v1.0/me/mailFolders', headers=headers)
+        folders_resp = graph_client.get('/me/mailFolders', access_token)
         print(f"Mail folders status: {folders_resp.status_code}")
         if folders_resp.status_code == 200:
             folders_data = folders_resp.json().get('value', [])
@@ -766,7 +679,7 @@ def graph_test_mail():
         
         # Test 3: Get recent messages (no filter)
         print("Testing recent messages...")
-        messages_resp = requests.get('https://graph.microsoft.com/v1.0/me/messages?$top=10&$select=subject,receivedDateTime', headers=headers)
+        messages_resp = graph_client.get('/me/messages', access_token, params={'$top': '10', '$select': 'subject,receivedDateTime'})
         print(f"Recent messages status: {messages_resp.status_code}")
         if messages_resp.status_code == 200:
             messages_data = messages_resp.json().get('value', [])
@@ -803,12 +716,7 @@ def graph_me():
     
     try:
         # Call Microsoft Graph API
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.get('https://graph.microsoft.com/v1.0/me', headers=headers)
+        response = graph_client.get('/me', access_token)
         
         if response.status_code == 200:
             return jsonify(response.json())
@@ -832,31 +740,19 @@ def graph_events():
         return jsonify({"error": "not connected or token expired"}), 401
     
     try:
-        # Call Microsoft Graph API for calendar events
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        # Get events for today
-        today = datetime.now(timezone.utc).strftime('%Y-%m-%dT00:00:00.000Z')
-        tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).strftime('%Y-%m-%dT00:00:00.000Z')
-        
-        url = f'https://graph.microsoft.com/v1.0/me/events'
-        params = {
-            'startDateTime': today,
-            'endDateTime': tomorrow,
-            '$select': 'subject,start,end,location'
-        }
-        
-        response = requests.get(url, headers=headers, params=params)
-        
-        if response.status_code == 200:
-            return jsonify(response.json())
-        else:
-            logger.error(f"Graph API error: {response.status_code} - {response.text}")
-            return jsonify({"error": "Failed to fetch events"}), response.status_code
-            
+        # Pull calendar changes into the local copy, then serve today's events from it
+        graph_sync.sync(device_id, access_token)
+
+        # "Today" is the user's local day
+        user_timezone = request.args.get('timezone')
+        local_today = local_date(user_timezone)
+        today = local_midnight(user_timezone, local_today)
+        tomorrow = local_midnight(user_timezone, local_today + timedelta(days=1))
+
+        return jsonify({"value": graph_sync.events_between(device_id, today, tomorrow)})
+
+    except GraphFetchError as e:
+        return jsonify({"error": "Failed to fetch events"}), e.status_code
     except Exception as e:
         logger.error(f"Error calling Graph API: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
@@ -864,72 +760,32 @@ def graph_events():
 
 
 @app.route("/generate-mood-score", methods=["POST"])
-def generate_mood_score():
+@validate_body(MoodScoreRequest)
+def generate_mood_score(body: MoodScoreRequest):
     """Generate baseline mood score during onboarding and store in database"""
     try:
-        data = request.json
-        user_id = data.get('user_id', '')
-        goals = data.get("goals", [])
-        concerns = data.get("concerns", [])
+        # user_id arrives as a validated ObjectId
+        user_oid = body.user_id
+        user_id = str(user_oid)
+        goals = body.goals
+        concerns = body.concerns
 
         logger.info(f"🔍 DEBUG: generate-mood-score called with user_id={user_id}")
         logger.info(f"🔍 DEBUG: goals={goals}, concerns={concerns}")
 
-        if not user_id:
-            logger.error("❌ DEBUG: No user_id provided")
-            return jsonify({"error": "User ID is required"}), 400
-
         mood, mood_level, mood_emoji = predict_mood(goals, concerns)
 
         logger.info(f"✅ Mood predicted: {mood} ({mood_level} {mood_emoji})")
 
         # Store baseline mood score in new format
         try:
-            from bson import ObjectId
-            today = get_user_date()  # Use user timezone
+            today = get_user_date(body.timezone)  # Use user timezone
             
             logger.info(f"🔍 DEBUG: Storing score for user_id={user_id}, date={today}")
             
-            # Check if score already exists for today
-            existing_score = db.user_scores.find_one({
-                "userId": ObjectId(user_id),
-                "date": today
-            })
-            
-            logger.info(f"🔍 DEBUG: Existing score found: {existing_score is not None}")
-            
-            if existing_score:
-                logger.info(f"🔍 DEBUG: Updating existing score: {existing_score}")
-                # Update existing score with baseline mood data
-                update_result = db.user_scores.update_one(
-                    {"userId": ObjectId(user_id), "date": today},
-                    {
-                        "$set": {
-                            "breakdown.moodLevel": float(mood_level),
-                            "updatedAt": datetime.now(timezone.utc)
-                        }
-                    }
-                )
-                logger.info(f"🔍 DEBUG: Update result: {update_result.modified_count} documents modified")
-            else:
-                logger.info("🔍 DEBUG: Creating new score document")
-                # Create new score document with baseline mood
-                score_doc = {
-                    "userId": ObjectId(user_id),
-                    "date": today,
-                    "overallScore": float(mood_level),  # Start with mood level as baseline
-                    "breakdown": {
-                        "moodLevel": float(mood_level),
-                        "socialScore": None,  # Will be updated when permissions granted
-                        "workStressScore": None,
-                        "screenTimePenalty": None,
-                        "interactionPenalty": None
-                    },
-                    "updatedAt": datetime.now(timezone.utc)
-                }
-                logger.info(f"🔍 DEBUG: Score document to insert: {score_doc}")
-                insert_result = db.user_scores.insert_one(score_doc)
-                logger.info(f"🔍 DEBUG: Insert result: {insert_result.inserted_id}")
+            # Sets moodLevel on today's score, creating it with the mood as overallScore if new
+            stored_score = score_store.set_mood_baseline(user_oid, today, float(mood_level), datetime.now(timezone.utc))
+            logger.info(f"🔍 DEBUG: Stored baseline score: {stored_score}")
 
         except Exception as e:
             logger.error(f"❌ Error storing score in database: {e}")
@@ -979,65 +835,19 @@ def generate_mood_score():
 def get_mood_analytics(user_id):
     """
     Provides mood analytics data for a specific user.
-    Currently supports a 'weekly' period.
+    Supports 'week' and 'month' (daily averages) and 'year' (monthly averages),
+    bucketed by calendar date in the user's timezone.
     """
     period = request.args.get('period', 'week') # Default to 'weekly'
 
-    if period != 'week':
-        return jsonify({"error": "Only 'weekly' period is currently supported"}), 400
+    if period not in PERIODS:
+        return jsonify({"error": f"period must be one of: {', '.join(PERIODS)}"}), 400
 
     try:
-        # 1. Calculate the date range for the last 7 days
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=7)
-
-        print('end_date - ', end_date)
-        print('start_date - ', start_date)
-        print('user_id - ', user_id)
-
-        # 2. Query MongoDB for mood scores within the date range for the user
-#         query = {
-#             "userId": user_id,
-#             "created_at": {"$gte": start_date, "$lt": end_date}
-#         }
-        # The 'collection' variable is now managed by Flask-PyMongo
-        mood_entries = list(db.Mood_Score.find())
-        app.logger.info(f"Found {len(mood_entries)} entries.")
-
-        if not mood_entries:
-            return jsonify({"labels": [], "data": [], "average": 0})
-
-        # --- FIX: Use defaultdict for cleaner aggregation ---
-        daily_scores = defaultdict(list)
-        for entry in mood_entries:
-            day_str = entry['created_at'].strftime('%a') # e.g., 'Mon'
-            daily_scores[day_str].append(entry['mood_level'])
-
-        labels = []
-        data = []
-        total_mood_sum = 0
-        total_mood_count = 0
-
-        for i in range(7):
-            day = start_date + timedelta(days=i)
-            day_str = day.strftime('%a')
-            labels.append(day_str)
-
-            if day_str in daily_scores:
-                day_avg = sum(daily_scores[day_str]) / len(daily_scores[day_str])
-                data.append(day_avg)
-                total_mood_sum += sum(daily_scores[day_str])
-                total_mood_count += len(daily_scores[day_str])
-            else:
-                data.append(0)
-
-        average = (total_mood_sum / total_mood_count) if total_mood_count > 0 else 0
-
-        return jsonify({
-            "labels": labels,
-            "data": data,
-            "average": round(average, 2)
-        })
+        # Indexed range query over the requested window, grouped by local date in MongoDB
+        result = mood_analytics.query(user_id, period, request.args.get('timezone'))
+        app.logger.info(f"Mood analytics for {user_id} ({period}): {len(result['data'])} buckets")
+        return jsonify(result)
 
     except Exception as e:
         app.logger.error(f"An error occurred: {e}")
@@ -1066,12 +876,11 @@ def test_mood():
 # ---------------- Report Generation API ----------------
 
 @app.route('/generate-mood-report', methods=['POST'])
-def generate_report():
+@validate_body(MoodReportRequest, empty_error="Request body must contain mood data.")
+def generate_report(body: MoodReportRequest):
     print('Received request to generate mood report...')
-    mood_data = request.json
-
-    if not mood_data:
-        return jsonify({"error": "Request body must contain mood data."}), 400
+    # Only what the client sent, including fields the schema doesn't name
+    mood_data = body.model_dump(exclude_unset=True)
 
     try:
         # Run the async function in the event loop
@@ -1087,20 +896,17 @@ def generate_report():
         return jsonify({"error": "Failed to generate report", "details": str(error)}), 500
 
 @app.route('/generate-screentime-report', methods=['POST'])
-def generate_screentime_report():
+@validate_body(ScreenTimeReportRequest, empty_error="Request body must contain screen time data.")
+def generate_screentime_report(body: ScreenTimeReportRequest):
     print('Received request to generate screen time report...')
-    screentime_data = request.json
-
-    if not screentime_data:
-        return jsonify({"error": "Request body must contain screen time data."}), 400
 
     try:
         # Extract screen time data
-        daily_screen_time = screentime_data.get('daily_screen_time', [])
-        app_usage_breakdown = screentime_data.get('app_usage_breakdown', [])
+        daily_screen_time = body.daily_screen_time
+        app_usage_breakdown = body.app_usage_breakdown
         
         # Calculate insights
-        total_hours = sum(day['total_hours'] for day in daily_screen_time)
+        total_hours = sum(day.total_hours for day in daily_screen_time)
         avg_hours = total_hours / len(daily_screen_time) if daily_screen_time else 0
         
         # Generate insights based on screen time data
@@ -1114,8 +920,8 @@ def generate_screentime_report():
         
         # Generate trend insights
         if len(daily_screen_time) >= 2:
-            recent_avg = sum(day['total_hours'] for day in daily_screen_time[-3:]) / min(3, len(daily_screen_time))
-            older_avg = sum(day['total_hours'] for day in daily_screen_time[:-3]) / max(1, len(daily_screen_time) - 3)
+            recent_avg = sum(day.total_hours for day in daily_screen_time[-3:]) / min(3, len(daily_screen_time))
+            older_avg = sum(day.total_hours for day in daily_screen_time[:-3]) / max(1, len(daily_screen_time) - 3)
             change_percent = ((recent_avg - older_avg) / older_avg) * 100 if older_avg > 0 else 0
             
             if change_percent < -10:
@@ -1126,8 +932,8 @@ def generate_screentime_report():
         # Generate app usage insights
         if app_usage_breakdown:
             top_app = app_usage_breakdown[0]
-            if top_app['usage_hours'] > 2:
-                insights.append(f"{top_app['app_name']} is your most used app with {top_app['usage_hours']:.1f} hours today.")
+            if top_app.usage_hours > 2:
+                insights.append(f"{top_app.app_name} is your most used app with {top_app.usage_hours:.1f} hours today.")
         
         # Generate suggestions
         suggestions = [
@@ -1141,7 +947,7 @@ def generate_screentime_report():
         # Add specific suggestions based on usage patterns
         if avg_hours > 6:
             suggestions.append("Consider a digital detox day once a week")
-        if any(app['app_name'].lower().find('social') != -1 for app in app_usage_breakdown[:3]):
+        if any(app.app_name.lower().find('social') != -1 for app in app_usage_breakdown[:3]):
             suggestions.append("Limit social media usage to specific times of day")
         
         return jsonify({
@@ -1154,20 +960,17 @@ def generate_screentime_report():
         return jsonify({"error": "Failed to generate screen time report", "details": str(error)}), 500
 
 @app.route('/generate-workstress-report', methods=['POST'])
-def generate_workstress_report():
+@validate_body(WorkStressReportRequest, empty_error="Request body must contain work stress data.")
+def generate_workstress_report(body: WorkStressReportRequest):
     print('Received request to generate work stress report...')
-    workstress_data = request.json
-
-    if not workstress_data:
-        return jsonify({"error": "Request body must contain work stress data."}), 400
 
     try:
         # Extract work stress data
-        daily_stress_scores = workstress_data.get('daily_stress_scores', [])
-        average_stress_score = workstress_data.get('average_stress_score', 0)
-        stress_trend = workstress_data.get('stress_trend', 'stable')
-        high_stress_days = workstress_data.get('high_stress_days', 0)
-        low_stress_days = workstress_data.get('low_stress_days', 0)
+        daily_stress_scores = body.daily_stress_scores
+        average_stress_score = body.average_stress_score
+        stress_trend = body.stress_trend
+        high_stress_days = body.high_stress_days
+        low_stress_days = body.low_stress_days
         
         # Generate insights based on work stress data
         insights = []
@@ -1246,136 +1049,35 @@ def generate_workstress_report():
         # ---------------- Dashboard Work Stress Scores ---------------- 
 
 @app.route('/api/update-user-score', methods=['POST'])
-def update_user_score():
+@validate_body(UpdateScoreRequest)
+def update_user_score(body: UpdateScoreRequest):
     """Update user's daily score with all available metrics"""
     try:
-        data = request.json
-        user_id = data.get('user_id', '')
-        user_timezone = data.get('timezone', None)  # Get user's timezone
+        # user_id arrives as a validated ObjectId
+        user_oid = body.user_id
+        user_id = str(user_oid)
+        user_timezone = body.timezone  # Get user's timezone
+        metrics = body.metrics()
         
         logger.info(f"🔍 DEBUG: update-user-score called with user_id={user_id}")
         logger.info(f"🔍 DEBUG: User timezone: {user_timezone}")
-        logger.info(f"🔍 DEBUG: Score data received: {data}")
-        
-        if not user_id:
-            logger.error("❌ DEBUG: No user_id provided")
-            return jsonify({"error": "User ID is required"}), 400
+        logger.info(f"🔍 DEBUG: Score data received: {metrics}")
         
-        from bson import ObjectId
-        today = get_user_date(user_timezone)  # Use user's timezone
+        user_now = get_user_datetime(user_timezone)  # Resolved once for the whole request
+        today = user_now.date().isoformat()
         
         logger.info(f"🔍 DEBUG: Looking for score on date={today}")
-        logger.info(f"🔍 DEBUG: Current user time: {get_user_datetime(user_timezone).isoformat()}")
-        
-        # Get current score document
-        existing_score = db.user_scores.find_one({
-            "userId": ObjectId(user_id),
-            "date": today
-        })
-        
-        logger.info(f"🔍 DEBUG: Existing score found: {existing_score}")
-        
-        if not existing_score:
-            logger.info("🔍 DEBUG: No score found for today, looking for most recent score")
-            # Find the most recent score from previous days
-            most_recent_score = db.user_scores.find_one(
-                {"userId": ObjectId(user_id)},
-                sort=[("date", -1)]  # Sort by date descending to get most recent
-            )
-            
-            if most_recent_score:
-                logger.info(f"🔍 DEBUG: Found most recent score from {most_recent_score['date']}")
-                # Create a new score for today based on the most recent score
-                baseline_score = {
-                    "userId": ObjectId(user_id),
-                    "date": today,
-                    "overallScore": most_recent_score.get("overallScore", 5.0),
-                    "breakdown": most_recent_score.get("breakdown", {
-                        "moodLevel": 5.0,
-                        "socialScore": None,
-                        "workStressScore": None,
-                        "screenTimePenalty": None,
-                        "interactionPenalty": None
-                    }).copy(),  # Copy the breakdown from most recent score
-                    "updatedAt": get_user_datetime(user_timezone)
-                }
-                logger.info(f"🔍 DEBUG: Creating score for today based on most recent: {baseline_score}")
-            else:
-                logger.info("🔍 DEBUG: No previous scores found, creating default baseline")
-                # If no previous scores exist, create a default baseline
-                baseline_score = {
-                    "userId": ObjectId(user_id),
-                    "date": today,
-                    "overallScore": 5.0,  # Default neutral score
-                    "breakdown": {
-                        "moodLevel": 5.0,  # Default neutral mood
-                        "socialScore": None,
-                        "workStressScore": None,
-                        "screenTimePenalty": None,
-                        "interactionPenalty": None
-                    },
-                    "updatedAt": get_user_datetime(user_timezone)
-                }
-                logger.info(f"🔍 DEBUG: Creating default baseline score: {baseline_score}")
-            
-            insert_result = db.user_scores.insert_one(baseline_score)
-            logger.info(f"🔍 DEBUG: Score created with ID: {insert_result.inserted_id}")
-            existing_score = baseline_score
-        
-        # Update with provided metrics
-        update_data = {"updatedAt": get_user_datetime(user_timezone)}
-        
-        if 'socialScore' in data:
-            update_data["breakdown.socialScore"] = float(data['socialScore'])
-            logger.info(f"🔍 DEBUG: Adding socialScore={data['socialScore']}")
-        if 'workStressScore' in data:
-            update_data["breakdown.workStressScore"] = float(data['workStressScore'])
-            logger.info(f"🔍 DEBUG: Adding workStressScore={data['workStressScore']}")
-        if 'screenTimePenalty' in data:
-            update_data["breakdown.screenTimePenalty"] = float(data['screenTimePenalty'])
-            logger.info(f"🔍 DEBUG: Adding screenTimePenalty={data['screenTimePenalty']}")
-        if 'interactionPenalty' in data:
-            update_data["breakdown.interactionPenalty"] = float(data['interactionPenalty'])
-            logger.info(f"🔍 DEBUG: Adding interactionPenalty={data['interactionPenalty']}")
-        
-        logger.info(f"🔍 DEBUG: Update data: {update_data}")
-        
-        # Calculate new overall score
-        breakdown = existing_score.get('breakdown', {})
-        logger.info(f"🔍 DEBUG: Current breakdown: {breakdown}")
-        
-        scores = []
-        for key, value in breakdown.items():
-            if value is not None and isinstance(value, (int, float)):
-                scores.append(value)
-        
-        logger.info(f"🔍 DEBUG: Valid scores for calculation: {scores}")
-        
-        if scores:
-            new_overall = sum(scores) / len(scores)
-            update_data["overallScore"] = round(new_overall, 1)
-            logger.info(f"🔍 DEBUG: Calculated new overall score: {new_overall}")
-        
-        # Update the document
-        update_result = db.user_scores.update_one(
-            {"userId": ObjectId(user_id), "date": today},
-            {"$set": update_data}
-        )
-        
-        logger.info(f"🔍 DEBUG: Update result: {update_result.modified_count} documents modified")
+        logger.info(f"🔍 DEBUG: Current user time: {user_now.isoformat()}")
         
-        # Verify the update
-        updated_score = db.user_scores.find_one({
-            "userId": ObjectId(user_id),
-            "date": today
-        })
+        # One find_one_and_update when today's score exists; seeds it from the latest day otherwise
+        updated_score = score_store.update_day(user_oid, today, metrics, user_now)
         logger.info(f"🔍 DEBUG: Updated score after operation: {updated_score}")
         
         logger.info(f"✅ Updated score for user {user_id} on {today}")
         
         return jsonify({
             "message": "Score updated successfully",
-            "overallScore": update_data.get("overallScore"),
+            "overallScore": updated_score.get("overallScore"),
             "date": today
         }), 200
         
@@ -1391,17 +1093,11 @@ def get_user_scores(user_id):
     try:
         from bson import ObjectId
         
-        # Get last 7 days of scores
-        end_date = datetime.now(timezone.utc).date()
+        # Get last 7 days of scores, ending today in the user's timezone
+        end_date = local_date(request.args.get('timezone'))
         start_date = end_date - timedelta(days=6)
         
-        scores = list(db.user_scores.find({
-            "userId": ObjectId(user_id),
-            "date": {
-                "$gte": start_date.isoformat(),
-                "$lte": end_date.isoformat()
-            }
-        }).sort("date", -1))
+        scores = score_store.days(ObjectId(user_id), start_date.isoformat(), end_date.isoformat())
 
         # Convert ObjectId fields to strings for JSON serialization
         serializable_scores = []
@@ -1445,23 +1141,20 @@ def get_user_profile(user_id):
             logger.error("❌ DEBUG: User not found in database")
             return jsonify({"error": "User not found"}), 404
         
-        # Get user's score history for stats calculation
-        scores = list(db.user_scores.find({"userId": ObjectId(user_id)}).sort("date", -1))
-        logger.info(f"🔍 DEBUG: Found {len(scores)} scores for user")
+        # Count and average from the materialised user_stats document
+        summary = score_store.summary(ObjectId(user_id))
+        logger.info(f"🔍 DEBUG: Found {summary['count']} scores for user")
         
         # Calculate user stats
-        days_tracked = len(scores)
-        avg_mood = 0
-        if scores:
-            total_score = sum(score.get('overallScore', 0) for score in scores if score.get('overallScore'))
-            avg_mood = round(total_score / len(scores), 1) if scores else 0
-            logger.info(f"🔍 DEBUG: Calculated avg_mood: {avg_mood}")
+        days_tracked = summary['count']
+        avg_mood = round(summary['avg'], 1) if summary['avg'] is not None else 0
+        logger.info(f"🔍 DEBUG: Calculated avg_mood: {avg_mood}")
         
         # Get connected apps count from user's connection status
         connected_apps = get_connected_apps_count(user_id)
         
         # Check if user has any scores (indicates onboarding completion)
-        has_scores = len(scores) > 0
+        has_scores = days_tracked > 0
         
         response_data = {
             "user": {
@@ -1497,48 +1190,20 @@ def get_user_stats(user_id):
         
         logger.info(f"🔍 DEBUG: get_user_stats called with user_id={user_id}")
         
-        # Get user's score history
-        scores = list(db.user_scores.find({"userId": ObjectId(user_id)}).sort("date", -1))
-        logger.info(f"🔍 DEBUG: Found {len(scores)} scores for user")
-        
-        # Calculate detailed stats
-        days_tracked = len(scores)
+        # Count, lifetime average and the two latest weeks' averages from user_stats
+        summary = score_store.summary(ObjectId(user_id))
+        logger.info(f"🔍 DEBUG: Found {summary['count']} scores for user")
         
-        # Calculate average mood from overall scores
-        avg_mood = 0
-        if scores:
-            valid_scores = [score.get('overallScore', 0) for score in scores if score.get('overallScore') is not None]
-            if valid_scores:
-                avg_mood = round(sum(valid_scores) / len(valid_scores), 1)
-                logger.info(f"🔍 DEBUG: Calculated avg_mood from {len(valid_scores)} valid scores: {avg_mood}")
+        days_tracked = summary['count']
+        avg_mood = round(summary['avg'], 1) if summary['avg'] is not None else 0
+        recent_avg = round(summary['recent_avg'], 1) if summary['recent_avg'] is not None else 0
+        logger.info(f"🔍 DEBUG: Calculated avg_mood: {avg_mood}, recent_avg: {recent_avg}")
         
         # Get connected apps count
         connected_apps = get_connected_apps_count(user_id)
         
-        # Calculate additional stats
-        recent_scores = scores[:7] if scores else []  # Last 7 days
-        recent_avg = 0
-        if recent_scores:
-            recent_valid_scores = [score.get('overallScore', 0) for score in recent_scores if score.get('overallScore') is not None]
-            if recent_valid_scores:
-                recent_avg = round(sum(recent_valid_scores) / len(recent_valid_scores), 1)
-        
-        # Calculate trend (comparing recent vs older scores)
-        trend = "stable"
-        if len(scores) >= 14:  # Need at least 2 weeks of data
-            older_scores = scores[7:14]  # Previous week
-            if older_scores and recent_scores:
-                older_valid = [score.get('overallScore', 0) for score in older_scores if score.get('overallScore') is not None]
-                recent_valid = [score.get('overallScore', 0) for score in recent_scores if score.get('overallScore') is not None]
-                
-                if older_valid and recent_valid:
-                    older_avg = sum(older_valid) / len(older_valid)
-                    recent_avg_calc = sum(recent_valid) / len(recent_valid)
-                    
-                    if recent_avg_calc > older_avg + 0.5:
-                        trend = "improving"
-                    elif recent_avg_calc < older_avg - 0.5:
-                        trend = "declining"
+        # Trend compares the latest 7 scores with the 7 before them
+        trend = score_trend(summary)
         
         response_data = {
             "days_tracked": days_tracked,
@@ -1546,7 +1211,7 @@ def get_user_stats(user_id):
             "connected_apps": connected_apps,
             "recent_avg": recent_avg,
             "trend": trend,
-            "total_scores": len(scores),
+            "total_scores": days_tracked,
             "last_updated": datetime.now(timezone.utc).isoformat()
         }
         
@@ -1594,6 +1259,7 @@ def get_connected_apps_count(user_id):
 def get_dashboard_scores():
     """Get comprehensive dashboard scores including work stress, email activity, and calendar insights"""
     device_id = request.args.get('device_id', '').strip()
+    user_timezone = request.args.get('timezone')
     if not device_id:
         return jsonify({"error": "device_id is required"}), 400
 
@@ -1602,107 +1268,21 @@ def get_dashboard_scores():
         return jsonify({"error": "not connected or token expired"}), 401
 
     try:
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-
-        # Get work stress data (reuse existing logic)
-        end_dt = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59, microsecond=0)
-        start_dt = end_dt - timedelta(days=6)
-
-        # Fetch calendar events
-        cal_url = 'https://graph.microsoft.com/v1.0/me/calendarView'
-        cal_params = {
-            'startDateTime': start_dt.isoformat(),
-            'endDateTime': end_dt.isoformat(),
-            '$select': 'subject,start,end,location,organizer',
-            '$top': '1000',
-        }
-        cal_resp = requests.get(cal_url, headers=headers, params=cal_params)
-        cal_data = cal_resp.json().get('value', []) if cal_resp.status_code == 200 else []
-
-        # Fetch recent emails
-        mail_url = 'https://graph.microsoft.com/v1.0/me/messages'
-        email_start_dt = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        mail_params = {
-            '$select': 'subject,receivedDateTime',
-            '$orderby': 'receivedDateTime desc',
-            '$top': '50'
-        }
-        mail_resp = requests.get(mail_url, headers=headers, params=mail_params)
-        mail_data = mail_resp.json().get('value', []) if mail_resp.status_code == 200 else []
-
-        # Filter emails for last 7 days
-        filtered_emails = []
-        for email in mail_data:
-            try:
-                received_dt = datetime.fromisoformat(email['receivedDateTime'].replace('Z', '+00:00'))
-                if received_dt >= email_start_dt:
-                    filtered_emails.append(email)
-            except Exception:
-                continue
-
-        # Calculate work stress score (simplified version)
-        total_meeting_hours = 0.0
-        back_to_back_count = 0
-        after_hours_emails = 0
-        early_morning_meetings = 0
-
-        # Process calendar events
-        events_by_day = defaultdict(list)
-        for ev in cal_data:
-            try:
-                s = ev.get('start', {}).get('dateTime')
-                e = ev.get('end', {}).get('dateTime')
-                if not s or not e:
-                    continue
-                sd = datetime.fromisoformat(s.replace('Z', '+00:00'))
-                ed = datetime.fromisoformat(e.replace('Z', '+00:00'))
-                day_key = sd.date().isoformat()
-                events_by_day[day_key].append((sd, ed, ev))
-            except Exception:
-                continue
-
-        # Calculate metrics
-        for day_events in events_by_day.values():
-            day_events.sort(key=lambda x: x[0])
-            last_end = None
-            for sd, ed, _ in day_events:
-                dur = (ed - sd).total_seconds() / 3600.0
-                total_meeting_hours += max(0.0, dur)
-                if last_end is not None and (sd - last_end).total_seconds() <= 15 * 60:
-                    back_to_back_count += 1
-                last_end = ed
-                if sd.time() < time(9, 0):
-                    early_morning_meetings += 1
-
-        # Process emails
-        for email in filtered_emails:
-            try:
-                rd = datetime.fromisoformat(email['receivedDateTime'].replace('Z', '+00:00'))
-                if rd.time() < time(7, 0) or rd.time() > time(19, 0):
-                    after_hours_emails += 1
-            except Exception:
-                continue
-
-        # Calculate work stress score
-        def clamp(v, lo, hi):
-            return max(lo, min(hi, v))
-
-        work_stress_score = 0.0
-        work_stress_score += clamp(total_meeting_hours / 6.0 * 5.0, 0.0, 5.0)
-        work_stress_score += clamp(back_to_back_count * 0.5, 0.0, 2.0)
-        work_stress_score += clamp(after_hours_emails * 0.3, 0.0, 2.0)
-        work_stress_score += clamp(early_morning_meetings * 0.3, 0.0, 1.0)
-        work_stress_score = clamp(work_stress_score * (10.0 / 10.0), 1.0, 10.0)
+        # Served from the background-refreshed store; computed inline only when missing or stale
+        stress = (stress_store.recent(device_id, tz_name=user_timezone)
+                  or stress_refresher.refresh_device(device_id, tz_name=user_timezone, access_token=access_token))
+        if stress is None:
+            return jsonify({"error": "not connected or token expired"}), 401
+        totals = stress['aggregate']
+        work_stress_score = totals['score']
+        total_meeting_hours = totals['meeting_hours']
+        busy_hours = totals['busy_hours']
 
         # Calculate email activity score (inverse relationship - more emails = higher stress)
-        email_activity_score = clamp(len(filtered_emails) * 0.2, 1.0, 10.0)
+        email_activity_score = clamp(totals['email_count'] * 0.2, 1.0, 10.0)
 
-        # Calculate calendar busyness score
-        calendar_busyness_score = clamp(total_meeting_hours * 1.5, 1.0, 10.0)
+        # Calculate calendar busyness score from merged busy time (double-booked slots count once)
+        calendar_busyness_score = clamp(busy_hours * 1.5, 1.0, 10.0)
 
         # Calculate overall productivity score (combination of all factors)
         productivity_score = (work_stress_score + email_activity_score + calendar_busyness_score) / 3
@@ -1715,28 +1295,63 @@ def get_dashboard_scores():
             },
             'email_activity': {
                 'score': round(email_activity_score, 1),
-                'count': len(filtered_emails),
-                'after_hours': after_hours_emails
+                'count': totals['email_count'],
+                'after_hours': totals['after_hours_emails']
             },
             'calendar_busyness': {
                 'score': round(calendar_busyness_score, 1),
                 'meeting_hours': round(total_meeting_hours, 1),
-                'back_to_back_meetings': back_to_back_count,
-                'early_morning_meetings': early_morning_meetings
+                'busy_hours': round(busy_hours, 1),
+                'overlap_hours': round(max(0.0, total_meeting_hours - busy_hours), 1),
+                'max_concurrent_meetings': totals['max_concurrent_meetings'],
+                'back_to_back_meetings': totals['back_to_back_meetings'],
+                'early_morning_meetings': totals['early_morning_meetings'],
+                'free_gaps': {
+                    'under_30m': totals['free_gaps_under_30m'],
+                    '30_60m': totals['free_gaps_30_60m'],
+                    'over_60m': totals['free_gaps_over_60m'],
+                    'longest_hours': round(totals['longest_free_gap_hours'], 1)
+                }
             },
             'overall_productivity': {
                 'score': round(productivity_score, 1),
                 'level': 'Low' if productivity_score < 4 else 'Moderate' if productivity_score < 7 else 'High'
             },
             'period': 'week',
-            'last_updated': datetime.now(timezone.utc).isoformat()
+            'last_updated': stress['fetched_at'].isoformat()
         })
 
+    except GraphFetchError as e:
+        return jsonify({"error": str(e)}), e.status_code
     except Exception as e:
         logger.error(f"Error computing dashboard scores: {str(e)}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route('/dashboard/refresh', methods=['POST'])
+def refresh_dashboard_scores():
+    """Recompute stored work stress now, for one device or (without device_id) for all"""
+    device_id = request.args.get('device_id', '').strip()
+    if not device_id:
+        stress_refresher.trigger()
+        return jsonify({"message": "Refresh scheduled for all connected devices"}), 202
+
+    try:
+        stress = stress_refresher.refresh_device(device_id, tz_name=request.args.get('timezone'))
+        if stress is None:
+            return jsonify({"error": "not connected or token expired"}), 401
+        return jsonify({
+            "message": "Work stress refreshed",
+            "days": len(stress['days']),
+            "last_updated": stress['fetched_at'].isoformat()
+        })
+    except GraphFetchError as e:
+        return jsonify({"error": str(e)}), e.status_code
+    except Exception as e:
+        logger.error(f"Error refreshing dashboard scores: {str(e)}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
 @app.route('/debug-timezone', methods=['GET'])
 def debug_timezone():
     """Debug endpoint to check timezone settings"""
@@ -1764,6 +1379,69 @@ def debug_timezone():
         ]
     })
 
+# ---------------- CLI Commands ----------------
+@app.cli.command('rebuild-user-stats')
+@click.option('--user-id', default=None, help='Rebuild a single user (default: every user with scores)')
+def rebuild_user_stats(user_id):
+    """Recompute materialised user_stats documents from the stored scores"""
+    from bson import ObjectId
+    if user_id:
+        stats = score_store.stats.rebuild(ObjectId(user_id))
+        click.echo(f"Rebuilt stats for {user_id}: {stats['count']} scores")
+    else:
+        click.echo(f"Rebuilt stats for {score_store.stats.rebuild_all()} users")
+
+@app.cli.command('convert-user-scores')
+@click.argument('layout', type=click.Choice(['daily', 'monthly']))
+def convert_user_scores(layout):
+    """Copy every score day into LAYOUT; set SCORE_LAYOUT to it afterwards"""
+    from Services.score_repository import create_score_repository
+    source = create_score_repository(db, 'monthly' if layout == 'daily' else 'daily')
+    written = create_score_repository(db, layout).import_days(source.iter_days())
+    click.echo(f"Wrote {written} {layout} score documents")
+
+@app.cli.command('migrate-mood-events')
+@click.option('--batch-size', default=1000, show_default=True, help='Mood_Score documents copied per batch')
+def migrate_mood_events(batch_size):
+    """Copy Mood_Score check-ins into the mood_events time-series collection (resumable)"""
+    mood_events.ensure_indexes()
+    copied = mood_events.migrate_legacy(db.Mood_Score, batch_size=batch_size)
+    click.echo(f"Copied {copied} mood events; rollups rebuilt")
+
+@app.cli.command('deactivate-user')
+@click.argument('email')
+@click.option('--reactivate', is_flag=True, help='Allow the user to sign in again')
+def deactivate_user(email, reactivate):
+    """Block EMAIL from logging in; running workers reject its tokens within seconds"""
+    user = db.users.find_one({"email": email.lower()}, {"_id": 1})
+    if not user:
+        raise click.ClickException(f"No user with email {email}")
+    user_cache.deactivate_user(str(user['_id']), active=reactivate)
+    click.echo(f"{'Reactivated' if reactivate else 'Deactivated'} {email}")
+
+# ---------------- Background Workers ----------------
+user_cache_sync = UserCacheSync(user_cache)
+if USER_CACHE_SYNC_ENABLED:
+    user_cache_sync.start()
+
+token_refresher = TokenRefresher(token_store, refresh_token=refresh_access_token, lease=scheduler_lease)
+if TOKEN_REFRESH_ENABLED:
+    token_refresher.start()
+
+stress_refresher = StressRefreshScheduler(
+    stress_store,
+    graph_sync,
+    list_devices=token_store.devices,
+    get_access_token=get_valid_access_token,
+    lease=scheduler_lease
+)
+if STRESS_REFRESH_ENABLED:
+    stress_refresher.start()
+
+mood_rollups = MoodRollupScheduler(mood_events, lease=scheduler_lease)
+if MOOD_ROLLUP_ENABLED:
+    mood_rollups.start()
+
 # ---------------- Run ----------------
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
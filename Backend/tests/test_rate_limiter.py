@@ -0,0 +1,64 @@
+import pytest
+from flask import Flask, jsonify
+
+from Services.rate_limiter import MemoryBucketBackend, RateLimit, RateLimiter
+
+
+def make_limiter():
+    return RateLimiter(MemoryBucketBackend(), enabled=True)
+
+
+def test_refused_request_takes_no_token_from_other_buckets():
+    limiter = make_limiter()
+    ip_limit = RateLimit('ip', burst=5, per_minute=0.001)
+    email_limit = RateLimit('email', burst=1, per_minute=0.001)
+    rules = [(ip_limit, '10.0.0.1'), (email_limit, 'victim@example.com')]
+
+    assert limiter.admit(rules) == (None, 0.0)
+    for _ in range(3):
+        refused, retry_after = limiter.admit(rules)
+        assert refused is email_limit
+        assert retry_after > 0
+
+    # One token taken by the admitted request, none by the three refused ones
+    allowed, _ = limiter.peek(ip_limit, '10.0.0.1')
+    assert allowed
+    assert limiter.backend._buckets['ip']['10.0.0.1'][0] == pytest.approx(4, abs=0.01)
+    assert limiter.stats()['email'] == {'accepted': 1, 'rejected': 3}
+    assert limiter.stats()['ip'] == {'accepted': 1, 'rejected': 0}
+
+
+def test_decorator_answers_429_and_keeps_ip_allowance():
+    limiter = make_limiter()
+    ip_limit = RateLimit('login_ip', burst=2, per_minute=0.001)
+    email_limit = RateLimit('login_email', burst=1, per_minute=0.001)
+    app = Flask(__name__)
+
+    @app.route('/login/<email>', methods=['POST'])
+    @limiter.limit((ip_limit, lambda **_: 'client'), (email_limit, lambda email, **_: email))
+    def login(email):
+        return jsonify({'ok': True})
+
+    client = app.test_client()
+    assert client.post('/login/a@example.com').status_code == 200
+    refused = client.post('/login/a@example.com')
+    assert refused.status_code == 429
+    assert int(refused.headers['Retry-After']) >= 1
+    # The refused attempt left the IP bucket's second token for another account
+    assert client.post('/login/b@example.com').status_code == 200
+    assert client.post('/login/c@example.com').status_code == 429
+
+
+def test_rule_whose_key_is_none_is_skipped():
+    limiter = make_limiter()
+    limit = RateLimit('email', burst=1, per_minute=0.001)
+    app = Flask(__name__)
+
+    @app.route('/anonymous', methods=['POST'])
+    @limiter.limit((limit, lambda **_: None))
+    def anonymous():
+        return jsonify({'ok': True})
+
+    client = app.test_client()
+    assert [client.post('/anonymous').status_code for _ in range(3)] == [200, 200, 200]
+    assert limiter.stats() == {}
@@ -0,0 +1,153 @@
+import pytest
+from bson import ObjectId
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+
+mongomock = pytest.importorskip('mongomock')
+
+from Services.score_repository import DailyScoreRepository
+from Services.score_store import ScoreStore
+from Services.user_stats import RING_SIZE, UserStatsStore
+
+NOW = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+class SimpleDayRepository(DailyScoreRepository):
+    """Daily layout with a plain $set write (mongomock lacks the pipeline operators update_day uses)"""
+
+    def update_day(self, user_id, day, metrics, now, session=None):
+        score = metrics.get('overallScore')
+        result = self.collection.update_one(
+            {'userId': user_id, 'date': day},
+            {'$set': {'overallScore': score, 'updatedAt': now}},
+            upsert=True,
+        )
+        doc = self.collection.find_one({'userId': user_id, 'date': day})
+        return doc, result.upserted_id is not None
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def stats(db):
+    return UserStatsStore(db, SimpleDayRepository(db))
+
+
+def day(n):
+    return f'2025-01-{n:02d}'
+
+
+def seed(db, user_id, days):
+    """Store score days directly, day n scoring n"""
+    db.user_scores.insert_many([{'userId': user_id, 'date': day(n), 'overallScore': float(n)} for n in days])
+
+
+def test_replaying_a_day_does_not_count_it_twice(db, stats):
+    user_id = ObjectId()
+    seed(db, user_id, range(1, 4))
+    stats.rebuild(user_id)
+
+    seed(db, user_id, [4])
+    stats.record(user_id, day(4), 4.0)
+    replayed = stats.record(user_id, day(4), 4.0)
+
+    assert replayed['count'] == 4
+    assert replayed['scored'] == 4
+    assert replayed['sum'] == pytest.approx(10.0)
+    assert [e['date'] for e in replayed['recent']] == [day(4), day(3), day(2), day(1)]
+
+
+def test_rescoring_a_day_replaces_its_score(db, stats):
+    user_id = ObjectId()
+    seed(db, user_id, range(1, 4))
+    stats.rebuild(user_id)
+
+    doc = stats.record(user_id, day(2), 7.0)
+
+    assert doc['count'] == 3
+    assert doc['sum'] == pytest.approx(1.0 + 7.0 + 3.0)
+    assert next(e for e in doc['recent'] if e['date'] == day(2))['score'] == 7.0
+
+
+def test_day_older_than_a_full_ring_rebuilds(db, stats):
+    user_id = ObjectId()
+    seed(db, user_id, range(2, RING_SIZE + 3))
+    stats.rebuild(user_id)
+
+    # Day 1 is older than every day in the full ring, so it can't be folded in
+    seed(db, user_id, [1])
+    doc = stats.record(user_id, day(1), 1.0)
+
+    assert doc['count'] == RING_SIZE + 2
+    assert doc['sum'] == pytest.approx(sum(range(1, RING_SIZE + 3)))
+    assert len(doc['recent']) == RING_SIZE
+    assert doc['recent'][-1]['date'] == day(3)
+
+
+def test_first_write_without_stats_rebuilds(db, stats):
+    user_id = ObjectId()
+    seed(db, user_id, range(1, 3))
+
+    doc = stats.record(user_id, day(2), 2.0)
+
+    assert doc['count'] == 2
+    assert doc['version'] == 1
+    assert stats.get(user_id)['count'] == 2
+
+
+def test_version_conflict_falls_back_to_rebuild(db, stats, monkeypatch):
+    user_id = ObjectId()
+    seed(db, user_id, range(1, 3))
+    stats.rebuild(user_id)
+    stale = stats.get(user_id)
+
+    # Another writer folds in day 3 between this writer's read and its replace
+    seed(db, user_id, [3, 4])
+    stats.record(user_id, day(3), 3.0)
+    reads = iter([stale])
+    get = stats.get
+    monkeypatch.setattr(stats, 'get', lambda user_id, session=None: next(reads, None) or get(user_id, session))
+    doc = stats.record(user_id, day(4), 4.0)
+
+    assert doc['count'] == 4
+    assert doc['sum'] == pytest.approx(10.0)
+    assert stats.get(user_id)['version'] == doc['version'] == 3
+
+
+def test_summary_does_not_store_missing_stats(db, stats):
+    user_id = ObjectId()
+    seed(db, user_id, range(1, 4))
+
+    summary = stats.summary(user_id)
+
+    assert summary['count'] == 3
+    assert summary['avg'] == pytest.approx(2.0)
+    assert stats.get(user_id) is None
+
+
+def test_duplicate_key_retry_counts_the_day_once(db, stats, monkeypatch):
+    user_id = ObjectId()
+    seed(db, user_id, range(1, 3))
+    stats.rebuild(user_id)
+    store = ScoreStore(db, stats=stats, transactions=False, repository=stats.scores)
+
+    # Without transactions the first attempt's stats write lands before the error
+    record = stats.record
+    attempts = []
+
+    def record_then_fail(*args, **kwargs):
+        doc = record(*args, **kwargs)
+        attempts.append(doc)
+        if len(attempts) == 1:
+            raise DuplicateKeyError('E11000 duplicate key error')
+        return doc
+
+    monkeypatch.setattr(stats, 'record', record_then_fail)
+    store.update_day(user_id, day(3), {'overallScore': 3.0}, NOW)
+
+    assert len(attempts) == 2
+    assert stats.get(user_id)['count'] == 3
+    assert stats.get(user_id)['sum'] == pytest.approx(6.0)
@@ -0,0 +1,64 @@
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import pytest
+
+from Services.work_stress import build_snapshot_from_times, compute_daily_metrics, sweep_intervals
+
+DAY = datetime(2025, 3, 3, tzinfo=timezone.utc)
+
+
+def at(hour: float, day: int = 0) -> datetime:
+    return DAY + timedelta(days=day, hours=hour)
+
+
+def metrics(*meetings, days: int = 1):
+    """compute_daily_metrics for (start_hour, end_hour[, day]) meetings in UTC"""
+    intervals = [(at(m[0], *m[2:]), at(m[1], *m[2:])) for m in meetings]
+    return compute_daily_metrics(build_snapshot_from_times(intervals, [], DAY, days, 'UTC'))
+
+
+def test_overlapping_meetings_count_busy_time_once():
+    m = metrics((9, 10), (9.5, 10.5))
+    assert m['meeting_hours'][0] == pytest.approx(2.0)
+    assert m['busy_hours'][0] == pytest.approx(1.5)
+    assert m['max_concurrent_meetings'][0] == 2
+    assert m['free_gaps_under_30m'][0] == 0
+
+
+def test_nested_meeting_adds_no_busy_time():
+    m = metrics((9, 12), (10, 11))
+    assert m['busy_hours'][0] == pytest.approx(3.0)
+    assert m['max_concurrent_meetings'][0] == 2
+    assert m['longest_free_gap_hours'][0] == 0
+
+
+def test_back_to_back_meetings_are_not_concurrent_and_leave_no_gap():
+    m = metrics((9, 10), (10, 11), (11.25, 12))
+    assert m['busy_hours'][0] == pytest.approx(2.75)
+    assert m['max_concurrent_meetings'][0] == 1
+    assert m['back_to_back_meetings'][0] == 2
+    # Only the 15 minute break is a gap; the zero-length handover at 10:00 is not
+    assert m['free_gaps_under_30m'][0] == 1
+    assert m['free_gaps_30_60m'][0] == 0
+
+
+def test_free_gaps_are_bucketed_by_length():
+    m = metrics((9, 10), (10 + 20 / 60, 11), (11.75, 12), (13.5, 14))
+    assert m['free_gaps_under_30m'][0] == 1
+    assert m['free_gaps_30_60m'][0] == 1
+    assert m['free_gaps_over_60m'][0] == 1
+    assert m['longest_free_gap_hours'][0] == pytest.approx(1.5)
+
+
+def test_gaps_do_not_span_days():
+    m = metrics((16, 17, 0), (9, 10, 1), days=2)
+    assert m['busy_hours'].tolist() == pytest.approx([1.0, 1.0])
+    assert m['longest_free_gap_hours'].tolist() == [0, 0]
+
+
+def test_sweep_intervals_treats_inverted_intervals_as_empty():
+    swept = sweep_intervals(np.array([0]), np.array([3600.0]), np.array([0.0]), 1)
+    assert swept['busy_hours'][0] == 0
+    assert swept['max_concurrent_meetings'][0] == 0
+    assert swept['free_gaps_under_30m'][0] == 0
@@ -1,6 +1,7 @@
 import { Platform, Linking } from 'react-native';
 import InAppBrowser from 'react-native-inappbrowser-reborn';
 import AsyncStorage from '@react-native-async-storage/async-storage';
+import { getUserTimezone } from '../utils/timezoneUtils';
 
 async function getOrCreateDeviceId(): Promise<string> {
   const key = 'device_id';
@@ -70,7 +71,7 @@ export const fetchMicrosoftMe = async () => {
 export const fetchMicrosoftEvents = async () => {
   const deviceId = await getOrCreateDeviceId();
   const base = 'https://moodtracker-9ygs.onrender.com';
-  const res = await fetch(`${base}/graph/events?device_id=${encodeURIComponent(deviceId)}`);
+  const res = await fetch(`${base}/graph/events?device_id=${encodeURIComponent(deviceId)}&timezone=${encodeURIComponent(getUserTimezone())}`);
   if (!res.ok) throw new Error('Failed to fetch events');
   return res.json();
 };
@@ -78,7 +79,7 @@ export const fetchMicrosoftEvents = async () => {
 export const fetchWorkStress = async (period: 'week' | 'month' | 'quarter' = 'week') => {
   const deviceId = await getOrCreateDeviceId();
   const base = 'https://moodtracker-9ygs.onrender.com';
-  const url = `${base}/graph/work-stress?device_id=${encodeURIComponent(deviceId)}&period=${encodeURIComponent(period)}`;
+  const url = `${base}/graph/work-stress?device_id=${encodeURIComponent(deviceId)}&period=${encodeURIComponent(period)}&timezone=${encodeURIComponent(getUserTimezone())}`;
   const res = await fetch(url);
   if (!res.ok) throw new Error('Failed to fetch work stress');
   return res.json() as Promise<{ labels: string[]; data: number[]; average: number; period: string }>;
@@ -169,7 +170,7 @@ export const fetchDashboardScores = async () => {
   try {
     const deviceId = await getOrCreateDeviceId();
     const base = 'https://moodtracker-9ygs.onrender.com';
-    const url = `${base}/dashboard/scores?device_id=${encodeURIComponent(deviceId)}`;
+    const url = `${base}/dashboard/scores?device_id=${encodeURIComponent(deviceId)}&timezone=${encodeURIComponent(getUserTimezone())}`;
     
     console.log(`🔍 DEBUG: Fetching dashboard scores from: ${url}`);
     
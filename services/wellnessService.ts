@@ -2,6 +2,7 @@ import { ScreenTimeService, ScreenTimeData } from './ScreenTimeService';
 import { getHistoricalSocialScores } from '../scoreFunctions/socialScore';
 import { getUserSpecificWeights } from '../utils/userProfile';
 import AsyncStorage from '@react-native-async-storage/async-storage';
+import { getUserTimezone } from '../utils/timezoneUtils';
 
 export interface WellnessData {
   date: string;
@@ -37,7 +38,7 @@ const getWorkStressData = async (period: string): Promise<Array<{date: string, s
     const deviceId = await AsyncStorage.getItem('device_id') || 'default-device';
     const API_BASE_URL = 'https://moodtracker-9ygs.onrender.com';
 
-    const resp = await fetch(`${API_BASE_URL}/graph/work-stress?device_id=${encodeURIComponent(deviceId)}&period=${encodeURIComponent(period || 'week')}`);
+    const resp = await fetch(`${API_BASE_URL}/graph/work-stress?device_id=${encodeURIComponent(deviceId)}&period=${encodeURIComponent(period || 'week')}&timezone=${encodeURIComponent(getUserTimezone())}`);
     if (!resp.ok) {
       console.log('Failed to fetch /graph/work-stress');
       return [];
@@ -159,7 +160,7 @@ const getMoodData = async (period: string): Promise<Array<{date: string, score:
     
     // Fetch mood data from the same API endpoint as dashboard
     const API_BASE_URL = 'https://moodtracker-9ygs.onrender.com';
-    const response = await fetch(`${API_BASE_URL}/api/user-scores/${userId}`);
+    const response = await fetch(`${API_BASE_URL}/api/user-scores/${userId}?timezone=${encodeURIComponent(getUserTimezone())}`);
     
     if (!response.ok) {
       console.log('Failed to fetch mood data from API, using mock data');